@@ -0,0 +1,167 @@
+#!/usr/bin/python3
+# -*- coding: utf8 -*-
+
+# Cold and warm start benchmark for the GUI, run headless with stubbed Tk and
+# GPIO (see headless.py) and the simulated pump controller.
+#
+# For each menu size a temporary directory gets a generated holiday.json and
+# one JPEG per cocktail. A cold start is a fresh interpreter, a warm start
+# re-runs the script in an interpreter that already imported everything.
+# Each run writes a startup trace with the time to the first frame and to
+# fully loaded (images decoded and controller connected, both deferred past
+# the first frame). The results are summarized and saved:
+#
+#     python3 bench_startup.py --sizes 10,50,200 --runs 5 --output startup_bench.json
+#     python3 bench_startup.py --baseline startup_bench.json   # exits 1 on regression
+#     python3 bench_startup.py --cpus 1   # closer to a Pi: the GUI and controller share one core
+
+import argparse
+import json
+import os
+import platform
+import runpy
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Directory of this repository, added to sys.path of the child runs
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Function to write a menu of the given size with one image per cocktail
+def make_menu(directory, size, image_size=600):
+    from PIL import Image
+    recipes = {}
+    for n in range(size):
+        name = f"Cocktail {n + 1}"
+        img_path = os.path.join(directory, f"cocktail{n + 1}.jpg")
+        Image.new('RGB', (image_size, image_size), ((n * 37) % 256, (n * 91) % 256, (n * 53) % 256)).save(img_path, quality=85)
+        recipes[name] = {
+            'imgpath': img_path,
+            'image_url': '',
+            'ingredients': [{'name': f"Ingredient {m + 1}", 'motor': m + 1, 'quantity': 10 + 5 * m} for m in range(n % 4 + 1)],
+        }
+    with open(os.path.join(directory, 'holiday.json'), 'w') as file:
+        json.dump(recipes, file)
+
+# Function to run the GUI script inside a child interpreter, once per trace path
+def run_child(script, traces):
+    import headless
+    import startup_profile
+    headless.install()
+    # Keep the event loop running until the deferred startup work is done
+    headless.mainloop_seconds = 30
+    headless.until = lambda: startup_profile.loaded_at is not None
+    for trace in traces:
+        os.environ['CBR_STARTUP_TRACE'] = trace
+        runpy.run_path(script, run_name='__main__')
+
+# Function to read the phase durations, time to first frame and time to loaded from a trace, in ms
+def read_trace(path):
+    with open(path) as file:
+        events = json.load(file)['traceEvents']
+    phases = {event['name']: event['dur'] / 1000 for event in events if event['ph'] == 'X'}
+    instants = {event['name']: event['ts'] / 1000 for event in events if event['ph'] == 'i'}
+    ttff = instants['time_to_first_frame']
+    return ttff, instants.get('time_to_loaded', ttff), phases
+
+# Function to start a child interpreter running the given traces
+def spawn_child(script, directory, traces, cpus=None):
+    env = dict(os.environ, CBR_SIM_GPIO='1', CBR_PUMP_SOCKET=os.path.join(directory, 'pump.sock'),
+               PYTHONPATH=os.pathsep.join([repo_dir, os.environ.get('PYTHONPATH', '')]))
+    # The pump controller started by the GUI inherits the affinity
+    pin = (lambda: os.sched_setaffinity(0, range(cpus))) if cpus else None
+    subprocess.run([sys.executable, os.path.abspath(__file__), '--child', script, '--traces', ','.join(traces)],
+                   cwd=directory, env=env, check=True, stdout=subprocess.DEVNULL, preexec_fn=pin)
+
+# Function to summarize a list of (ttff, loaded, phases, wall) runs
+def summarize(size, mode, runs):
+    ttffs = sorted(run[0] for run in runs)
+    names = runs[0][2].keys()
+    loaded = sorted(run[1] for run in runs)
+    result = {
+        'menu_size': size,
+        'mode': mode,
+        'runs': len(runs),
+        'ttff_ms_median': statistics.median(ttffs),
+        'ttff_ms_max': ttffs[-1],
+        'loaded_ms_median': statistics.median(loaded),
+        'phases_ms_median': {name: statistics.median(run[2][name] for run in runs) for name in names},
+    }
+    if runs[0][3] is not None:
+        result['wall_ms_median'] = statistics.median(run[3] for run in runs)
+    return result
+
+# Function to benchmark cold and warm starts for one menu size
+def bench_size(script, size, runs, cpus=None):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        make_menu(directory, size)
+
+        # Cold: a fresh interpreter for every run
+        cold = []
+        for n in range(runs):
+            trace = os.path.join(directory, f"cold{n}.json")
+            started = time.perf_counter()
+            spawn_child(script, directory, [trace], cpus)
+            wall = (time.perf_counter() - started) * 1000
+            cold.append(read_trace(trace) + (wall,))
+        results.append(summarize(size, 'cold', cold))
+
+        # Warm: one interpreter, the first run only warms it up
+        traces = [os.path.join(directory, f"warm{n}.json") for n in range(runs + 1)]
+        spawn_child(script, directory, traces, cpus)
+        warm = [read_trace(trace) + (None,) for trace in traces[1:]]
+        results.append(summarize(size, 'warm', warm))
+    return results
+
+# Function to compare results with a baseline file, returning the regressions found
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as file:
+        baseline = {(result['menu_size'], result['mode']): result for result in json.load(file)['results']}
+    regressions = []
+    for result in results:
+        old = baseline.get((result['menu_size'], result['mode']))
+        if old is None:
+            continue
+        change = result['ttff_ms_median'] / old['ttff_ms_median'] - 1
+        print(f"{result['mode']:>4} {result['menu_size']:>5} recipes: {old['ttff_ms_median']:8.1f} -> {result['ttff_ms_median']:8.1f} ms ({change:+.1%})")
+        if change > threshold:
+            regressions.append(result)
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Headless cold/warm start benchmark")
+    parser.add_argument('--script', default=os.path.join(repo_dir, 'progressbar_added.py'))
+    parser.add_argument('--sizes', default='10,50,200', help="Menu sizes to benchmark")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', default='startup_bench.json')
+    parser.add_argument('--baseline', help="Earlier output to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Allowed slowdown before a regression is reported")
+    parser.add_argument('--cpus', type=int, help="Run the GUI and controller on this many CPUs, 1 for a Pi-class profile")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--traces', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.traces.split(','))
+        sys.exit(0)
+
+    results = []
+    for size in [int(size) for size in args.sizes.split(',')]:
+        for result in bench_size(os.path.abspath(args.script), size, args.runs, args.cpus):
+            results.append(result)
+            print(f"{result['mode']:>4} {size:>5} recipes: time to first frame {result['ttff_ms_median']:8.1f} ms median, "
+                  f"loaded {result['loaded_ms_median']:8.1f} ms, "
+                  + ", ".join(f"{name} {ms:.1f}" for name, ms in result['phases_ms_median'].items()))
+
+    regressions = compare(results, args.baseline, args.threshold) if args.baseline else []
+
+    with open(args.output, 'w') as file:
+        json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'script': os.path.basename(args.script), 'cpus': args.cpus,
+                   'results': results}, file, indent=2)
+
+    if regressions:
+        print(f"{len(regressions)} startup regression(s) above {args.threshold:.0%}")
+        sys.exit(1)
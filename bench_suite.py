@@ -0,0 +1,315 @@
+#!/usr/bin/python3
+# -*- coding: utf8 -*-
+
+# Headless benchmark suite, runs on plain Linux with stubbed Tk and GPIO
+# (headless.py, sim_gpio.py):
+#
+#   recipes     loading a generated menu, building the menu matrix and its ETAs
+#   plan        laying out the pours of an order, per strategy and through the
+#               controller with its heat budget
+#   scheduler   controller time per pour: queueing, planning and switching the
+#               relays of many orders on the simulated pins
+#   images      the GUI's image pipeline (decode and resize, Tk conversion is
+#               stubbed) in images per second
+#   ui          tap to handler done and tap to the next frame for the cocktail
+#               and order buttons of the GUI, run headless in a child process
+#   memory      resident memory of the GUI per 100 recipes once every image
+#               was shown, and the images still kept, with and without the
+#               profile's lean_memory mode
+#
+# Results are saved as <commit>.json in --results-dir and compared with the
+# newest earlier result there (or --baseline), exiting 1 when a metric got
+# worse than --threshold:
+#
+#     python3 bench_suite.py
+#     python3 bench_suite.py --only plan,scheduler --menu-size 500
+#     python3 bench_suite.py --baseline bench_results/1a2b3c4.json
+
+import argparse
+import collections
+import gc
+import glob
+import json
+import os
+import platform
+import runpy
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Directory of this repository, added to sys.path of the child runs
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Benchmarks in the order they run
+suites = ('recipes', 'plan', 'scheduler', 'images', 'ui', 'memory')
+
+# Function to time a function over some repeats, returning the median in ms
+def median_ms(function, repeats=5):
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+# Function to benchmark loading the menu and computing every ETA
+def bench_recipes(directory, size):
+    import menu
+    import menu_matrix
+    path = os.path.join(directory, 'holiday.json')
+    recipes = menu.load_recipes(path)
+    flow_rates = {motor: 1.5 for motor in range(1, 11)}
+    matrix = menu_matrix.MenuMatrix(recipes, flow_rates)
+    return {'load_ms': median_ms(lambda: menu.load_recipes(path)),
+            'matrix_build_ms': median_ms(lambda: menu_matrix.MenuMatrix(recipes, flow_rates)),
+            'matrix_etas_ms': median_ms(lambda: matrix.etas(glasses=2, backlog=30.0), 20),
+            'loop_etas_ms': median_ms(lambda: [menu.recipe_eta(recipe, 1.5) for recipe in recipes.values()])}
+
+# Function to benchmark laying out the orders of the menu
+def bench_plan(recipes):
+    import pump_controller
+    import sim_gpio
+    from cbr import bench
+    from cbr import strategies
+    orders = [(name, menu_pours) for name, menu_pours in ((name, [(ingredient['motor'], ingredient['quantity']) for ingredient in recipe['ingredients']])
+                                                          for name, recipe in recipes.items())]
+    results = {f"{name}_us": bench.plan_time(strategies.get(name), orders, 1.5)
+               for name, strategy in strategies.strategies.items() if strategy.exact}
+
+    # The controller adds the heat budget to the strategy's plan
+    controller = pump_controller.PumpController(sim_gpio, list(range(1, 11)), 1.5)
+    jobs = [pump_controller.PourJob(n, f"bench-{n}", name, [{'motor': motor, 'volume': volume, 'offset': 0.0} for motor, volume in pours], None)
+            for n, (name, pours) in enumerate(orders)]
+    now = time.monotonic()
+    started = time.perf_counter()
+    for _ in range(20):
+        for job in jobs:
+            controller.plan_job(job, now)
+    results['controller_us'] = (time.perf_counter() - started) / (20 * len(jobs)) * 1e6
+    return results
+
+# Function to benchmark the controller's own work per pour, with pours so short the relays switch at once
+def bench_scheduler(recipes, orders=500):
+    import pump_controller
+    import sim_gpio
+    controller = pump_controller.PumpController(sim_gpio, list(range(1, 11)), 1e9)
+    controller.setup_gpio()
+    cycle = list(recipes.values())
+    pours = 0
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    for n in range(orders):
+        recipe = cycle[n % len(cycle)]
+        message = {'order': f"bench-{n}", 'pours': [{'motor': ingredient['motor'], 'volume': ingredient['quantity']} for ingredient in recipe['ingredients']]}
+        controller.enqueue(message, None)
+        pours += len(message['pours'])
+        while controller.current is not None or controller.jobs:
+            controller.fire_timers()
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    controller.all_off()
+    sim_gpio.cleanup()
+    return {'wall_us_per_pour': wall / pours * 1e6, 'cpu_us_per_pour': cpu / pours * 1e6}
+
+# Function to read the resident memory of this process in MB
+def rss_mb():
+    with open('/proc/self/statm') as file:
+        return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+# Function to run the GUI headless in this (child) process and time its images and button handlers,
+# or with memory set only measure its resident memory once every image is shown
+def run_gui_child(directory, output, taps=50, memory=False):
+    import headless
+    import startup_profile
+    headless.install()
+    results = {}
+
+    # Function run by the fake event loop once the GUI is fully loaded, returning True to leave mainloop
+    def measure():
+        if startup_profile.loaded_at is None:
+            return False
+        root = headless.root
+        gui = vars(sys.modules['__main__'])  # The script's globals, runpy runs it as __main__
+        order_button = gui['order_button']
+        names = list(gui['cocktail_buttons'])
+        buttons = list(gui['cocktail_buttons'].values())
+        if memory:
+            for name in names:
+                gui['show_button_image'](name)
+            gc.collect()
+            results['rss_mb'] = rss_mb()
+            results['images_kept'] = len(gui['thumbnail_cache'])
+            return True
+
+        started = time.perf_counter()
+        for name in names:
+            gui['make_photo_image'](gui['recipes'][name]['imgpath'])
+        results['images_per_s'] = len(names) / (time.perf_counter() - started)
+
+        # Tap every cocktail button, then the order button, 20 ms apart so the GUI's timers fall due in
+        # between. A tap is stamped first and delivered after the Tk work already due, like a touch
+        # queued behind it, then the handler and the next frame are timed from delivery.
+        for stage, target in (('select', lambda n: buttons[n % len(buttons)]), ('order', lambda n: order_button)):
+            handler = []
+            frame = []
+            for n in range(taps):
+                time.sleep(0.02)
+                button = target(n)
+                stamp = int(time.monotonic() * 1000)
+                root.run_due()
+                delivered = time.perf_counter()
+                button.event_generate('<ButtonPress-1>', time=stamp)
+                button.event_generate('<ButtonRelease-1>', time=stamp)
+                button.options['command']()
+                handled = time.perf_counter()
+                root.run_due()
+                handler.append((handled - delivered) * 1000)
+                frame.append((time.perf_counter() - delivered) * 1000)
+            results[f"{stage}_handler_ms_median"] = statistics.median(handler)
+            results[f"{stage}_handler_ms_max"] = max(handler)
+            results[f"{stage}_to_frame_ms_median"] = statistics.median(frame)
+        # The GUI's own release to next frame histograms (input_latency.py)
+        for interaction, summaries in gui['input_latencies'].report().items():
+            if summaries['input_to_frame']['count']:
+                results[f"{interaction}_input_to_handler_ms_p90"] = summaries['input_to_handler']['p90'] * 1000
+                results[f"{interaction}_input_to_frame_ms_p90"] = summaries['input_to_frame']['p90'] * 1000
+        return True
+
+    headless.mainloop_seconds = 60
+    headless.until = measure
+    runpy.run_path(os.path.join(repo_dir, 'progressbar_added.py'), run_name='__main__')
+    with open(output, 'w') as file:
+        json.dump(results, file)
+
+# Function to run the GUI benchmarks in a child interpreter, since the stubs replace tkinter for good
+def bench_gui(directory, memory=False, overrides=None):
+    output = os.path.join(directory, 'gui.json')
+    profile = os.environ.get('CBR_PROFILE', 'progressbar_added')
+    if overrides:
+        base = profile
+        profile = os.path.join(directory, 'profile.json')
+        with open(profile, 'w') as file:
+            json.dump(dict(overrides, base=base), file)
+    env = dict(os.environ, CBR_SIM_GPIO='1', CBR_PUMP_SOCKET=os.path.join(directory, 'pump.sock'), CBR_PROFILE=profile,
+               PYTHONPATH=os.pathsep.join([repo_dir, os.environ.get('PYTHONPATH', '')]))
+    subprocess.run([sys.executable, os.path.abspath(__file__), '--child', directory, '--child-output', output]
+                   + (['--child-memory'] if memory else []), cwd=directory, env=env, check=True, stdout=subprocess.DEVNULL)
+    with open(output) as file:
+        return json.load(file)
+
+# Function to measure the GUI's resident memory per 100 recipes, from the difference between two menu sizes
+def bench_memory(directory, size):
+    import bench_startup
+    small, large = 100, max(size, 400)
+    results = {}
+    for mode, lean in (('default', False), ('lean', True)):
+        rss = {}
+        for recipes in (small, large):
+            menu_dir = os.path.join(directory, f"memory-{mode}-{recipes}")
+            os.makedirs(menu_dir)
+            bench_startup.make_menu(menu_dir, recipes)
+            child = bench_gui(menu_dir, memory=True, overrides={'lean_memory': lean})
+            rss[recipes] = child['rss_mb']
+        results[f"{mode}_rss_mb"] = rss[large]
+        results[f"{mode}_images_kept"] = child['images_kept']
+        results[f"{mode}_mb_per_100_recipes"] = (rss[large] - rss[small]) / (large - small) * 100
+    return results
+
+# Function to name the results after the commit they were measured on
+def commit_name():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repo_dir, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'local'
+    return f"{commit}-dirty" if dirty else commit
+
+# Function to compare results with a baseline, returning the metrics that got worse than the threshold.
+# Throughputs (_per_s) are better higher, everything else lower.
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as file:
+        baseline = json.load(file)['results']
+    print(f"Compared with {baseline_path}")
+    regressions = []
+    for suite, metrics in results.items():
+        for name, value in metrics.items():
+            old = baseline.get(suite, {}).get(name)
+            if not old or not value:
+                continue
+            change = value / old - 1
+            worse = -change if name.endswith('_per_s') else change
+            flag = "  REGRESSION" if worse > threshold else ""
+            print(f"{suite:10} {name:30} {old:12.3f} -> {value:12.3f} ({change:+.1%}){flag}")
+            if worse > threshold:
+                regressions.append(f"{suite}.{name}")
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Headless benchmark suite")
+    parser.add_argument('--only', default=','.join(suites), help="Comma separated benchmarks to run")
+    parser.add_argument('--menu-size', type=int, default=200, help="Cocktails in the generated menu")
+    parser.add_argument('--results-dir', default=os.path.join(repo_dir, 'bench_results'), help="Where results are kept per commit")
+    parser.add_argument('--baseline', help="Result file to compare against, the newest one in --results-dir by default")
+    parser.add_argument('--threshold', type=float, default=0.15, help="Allowed slowdown before a regression is reported")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--child-output', help=argparse.SUPPRESS)
+    parser.add_argument('--child-memory', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_gui_child(args.child, args.child_output, memory=args.child_memory)
+        sys.exit(0)
+
+    import bench_startup
+    import menu
+    wanted = args.only.split(',')
+    results = collections.OrderedDict()
+    with tempfile.TemporaryDirectory() as directory:
+        bench_startup.make_menu(directory, args.menu_size)
+        recipes = menu.load_recipes(os.path.join(directory, 'holiday.json'))
+        for suite in suites:
+            if suite not in wanted:
+                continue
+            print(f"Running {suite}...")
+            if suite == 'recipes':
+                results[suite] = bench_recipes(directory, args.menu_size)
+            elif suite == 'plan':
+                results[suite] = bench_plan(recipes)
+            elif suite == 'scheduler':
+                results[suite] = bench_scheduler(recipes)
+            elif suite == 'images':
+                results.setdefault('images', {})
+            elif suite == 'ui':
+                results.setdefault('ui', {})
+            elif suite == 'memory':
+                results[suite] = bench_memory(directory, args.menu_size)
+        # Images and UI come from the same headless GUI run
+        if 'images' in results or 'ui' in results:
+            gui = bench_gui(directory)
+            if 'images' in results:
+                results['images'] = {'images_per_s': gui.pop('images_per_s')}
+            if 'ui' in results:
+                results['ui'] = {name: value for name, value in gui.items() if name != 'images_per_s'}
+
+    for suite, metrics in results.items():
+        for name, value in metrics.items():
+            print(f"{suite:10} {name:30} {value:12.3f}")
+
+    os.makedirs(args.results_dir, exist_ok=True)
+    output = os.path.join(args.results_dir, f"{commit_name()}.json")
+    baseline = args.baseline
+    if baseline is None:
+        # The newest result, which is this commit's own when it is run again
+        earlier = glob.glob(os.path.join(args.results_dir, '*.json'))
+        baseline = max(earlier, key=os.path.getmtime) if earlier else None
+    regressions = compare(results, baseline, args.threshold) if baseline else []
+
+    with open(output, 'w') as file:
+        json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'menu_size': args.menu_size,
+                   'time': time.time(), 'results': results}, file, indent=2)
+    print(f"Results written to {output}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
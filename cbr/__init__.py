@@ -0,0 +1,20 @@
+# -*- coding: utf8 -*-
+
+# Cocktail bartender robot package.
+#
+# The scripts at the top of the repository used to differ only in their relay
+# pins, menu, image size and the way the pumps were sequenced. That now lives
+# here as deployment profiles (profiles.py) and dispense strategies
+# (strategies.py), the GUI is progressbar_added.py with a profile selected,
+# and bench.py compares the strategies in the simulator.
+
+import os
+import runpy
+
+from cbr.profiles import load_profile
+
+# Function to run the GUI with a deployment profile, for the scripts kept under their old names
+def launch(profile):
+    os.environ['CBR_PROFILE'] = profile
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    runpy.run_path(os.path.join(root, 'progressbar_added.py'), run_name='__main__')
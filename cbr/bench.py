@@ -0,0 +1,212 @@
+# -*- coding: utf8 -*-
+
+# Head-to-head benchmark of the dispense strategies on simulated GPIO.
+#
+# Every strategy pours the same orders twice: driven from this process the
+# way the original scripts did (direct), and through the timer loop of the
+# pump controller (controller, exact strategies only). The pumps run
+# --speedup times faster than the profile's flow rate so a run takes
+# seconds. Ready times are scaled back to the real flow rate, volume errors
+# are those of the sped-up pours: exact for a strategy that pours too long,
+# an overstatement of timing jitter by the speedup.
+#
+#     python3 -m cbr.bench --profile battletested --menu holiday.json --orders 10 --output strategy_bench.json
+#
+# The strategy fastest on the controller with a volume error within
+# --tolerance is the one to put in the deployment's profile. The spread is
+# the time between the first and the last pump of an order stopping.
+
+import argparse
+import collections
+import json
+import os
+import platform
+import statistics
+import tempfile
+import threading
+import time
+
+import menu
+import pump_controller
+import sim_gpio
+import telemetry
+from cbr import profiles
+from cbr import strategies
+
+# Function to make a menu when the profile's menu file is not around, from one to four
+# ingredients of 10 to 60 mL on the first motors
+def sample_recipes(motors):
+    recipes = {}
+    for n in range(8):
+        count = min(motors, n % 4 + 1)
+        recipes[f"Cocktail {n + 1}"] = {'ingredients': [{'name': f"Ingredient {(n + m) % motors + 1}", 'motor': (n + m) % motors + 1,
+                                                          'quantity': 10 + (n * 7 + m * 13) % 51} for m in range(count)]}
+    return recipes
+
+# Function to compare the requested and actual run time of every motor of one order.
+# Returns the worst timing error in seconds and the volume error per motor in mL.
+def pour_errors(requested, actual, flow_rate):
+    timing = max((abs(actual.get(motor, 0.0) - seconds) for motor, seconds in requested.items()), default=0.0)
+    volumes = [abs(actual.get(motor, 0.0) - seconds) * flow_rate for motor, seconds in requested.items()]
+    return timing, volumes
+
+# Function to pour the orders by driving the simulated relays from this process
+def bench_direct(strategy, orders, pins, flow_rate):
+    motor_mapping = {i + 1: pin for i, pin in enumerate(pins)}
+    motor_of_pin = {pin: motor for motor, pin in motor_mapping.items()}
+    sim_gpio.setmode(sim_gpio.BOARD)
+    for pin in pins:
+        sim_gpio.setup(pin, sim_gpio.OUT)
+    switched_on = {}
+    on_seconds = collections.defaultdict(float)
+    off_times = []
+
+    # Function to add up how long each relay was on, LOW switches it on
+    def on_output(pin, level, now):
+        if level == sim_gpio.LOW:
+            switched_on[pin] = now
+        elif pin in switched_on:
+            on_seconds[motor_of_pin[pin]] += now - switched_on.pop(pin)
+            off_times.append(now)
+
+    sim_gpio.listeners.append(on_output)
+    flow_rates = {motor: flow_rate for motor in motor_mapping}
+    samples = []
+    try:
+        for _, pours in orders:
+            on_seconds.clear()
+            off_times.clear()
+            started = time.monotonic()
+            strategy.run(strategy.plan(pours, flow_rates), sim_gpio, motor_mapping)
+            requested = collections.defaultdict(float)
+            for motor, volume in pours:
+                requested[motor] += volume / flow_rate
+            samples.append((max(off_times) - started,) + pour_errors(requested, on_seconds, flow_rate) +
+                           (max(off_times) - min(off_times),))
+    finally:
+        sim_gpio.listeners.remove(on_output)
+        sim_gpio.cleanup()
+    return samples
+
+# Function to pour the orders through a simulated pump controller running the strategy
+def bench_controller(strategy, orders, pins, flow_rate, directory, max_pumps=None):
+    path = os.path.join(directory, f"{strategy.name}.sock")
+    log = os.path.join(directory, f"{strategy.name}-pours.log")
+    client = pump_controller.connect_or_spawn(pins, flow_rate, path, sim=True,
+                                              extra_args=['--strategy', strategy.name, '--telemetry-log', log,
+                                                          '--inventory', os.path.join(directory, 'inventory.json'),
+                                                          '--journal', os.path.join(directory, f"{strategy.name}.journal"),
+                                                          '--order-log', os.path.join(directory, f"{strategy.name}-orders.log")] +
+                                              (['--max-pumps', str(max_pumps)] if max_pumps else []))
+    done = {}
+    finished = threading.Event()
+
+    # Function to note when each order is ready
+    def on_event(event):
+        if event['ev'] in ('done', 'error'):
+            done[event['order']] = event
+            finished.set()
+
+    client.add_listener(on_event)
+    ready = []
+    jobs = {}
+    try:
+        for n, (label, pours) in enumerate(orders):
+            order_id = f"bench-{n}"
+            finished.clear()
+            sent = time.monotonic()
+            client.pour(order_id, pours, label=label)
+            while order_id not in done:
+                finished.wait(60)
+            event = done[order_id]
+            if event['ev'] == 'error':
+                raise RuntimeError(f"Controller refused {label}: {event['error']}")
+            ready.append(event['t'] - sent)
+            jobs[order_id] = pours
+    finally:
+        client.close()
+
+    # The controller logs the requested and actual run time of every relay run
+    actual = collections.defaultdict(lambda: collections.defaultdict(float))
+    off_times = collections.defaultdict(list)
+    for orders, motor, _, seconds, _, end in telemetry.read_log(log):
+        for order_id in orders:
+            actual[order_id][motor] += seconds
+            off_times[order_id].append(end)
+    samples = []
+    for (order_id, pours), seconds in zip(jobs.items(), ready):
+        requested = collections.defaultdict(float)
+        for motor, volume in pours:
+            requested[motor] += volume / flow_rate
+        samples.append((seconds,) + pour_errors(requested, actual[order_id], flow_rate) +
+                       (max(off_times[order_id]) - min(off_times[order_id]),))
+    return samples
+
+# Function to time planning the orders, in microseconds per order
+def plan_time(strategy, orders, flow_rate):
+    flow_rates = collections.defaultdict(lambda: flow_rate)
+    started = time.perf_counter()
+    for _ in range(100):
+        for _, pours in orders:
+            strategy.plan(pours, flow_rates)
+    return (time.perf_counter() - started) / (100 * len(orders)) * 1e6
+
+# Function to reduce the samples of one strategy and executor
+def summarize(strategy, executor, samples, speedup, plan_us):
+    ready = [sample[0] * speedup for sample in samples]
+    volumes = [volume for sample in samples for volume in sample[2]]
+    return {'strategy': strategy.name, 'executor': executor, 'exact': strategy.exact, 'plan_us': plan_us,
+            'ready_median': statistics.median(ready), 'ready_max': max(ready),
+            'finish_spread_median': statistics.median(sample[3] * speedup for sample in samples),
+            'timing_error_ms_max': max(sample[1] for sample in samples) * 1000,
+            'volume_error_ml_mean': statistics.mean(volumes), 'volume_error_ml_max': max(volumes)}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the dispense strategies on simulated GPIO")
+    parser.add_argument('--profile', default=profiles.default_profile, help="Profile name or JSON file giving pins and flow rate")
+    parser.add_argument('--menu', help="Recipes to pour, the profile's menu by default")
+    parser.add_argument('--orders', type=int, default=5, help="Orders poured per strategy, cycling through the menu")
+    parser.add_argument('--speedup', type=float, default=50, help="Factor the simulated pumps run faster than the profile")
+    parser.add_argument('--tolerance', type=float, default=1.0, help="Largest volume error in mL for a strategy to be picked")
+    parser.add_argument('--strategies', default=','.join(strategies.strategies), help="Comma separated strategies to compare")
+    parser.add_argument('--max-pumps', type=int, help="Pump cap of the capped strategy, the profile's by default")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    profile = profiles.load_profile(args.profile)
+    menu_path = args.menu or profile['menu']
+    recipes = menu.load_recipes(menu_path) if os.path.exists(menu_path) else sample_recipes(len(profile['pins']))
+    cycle = list(recipes.items())
+    orders = [(name, menu.recipe_pours(recipe)) for name, recipe in (cycle[n % len(cycle)] for n in range(args.orders))]
+    flow_rate = profile['flow_rate'] * args.speedup
+    max_pumps = args.max_pumps or profile['max_pumps']
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.strategies.split(','):
+            strategy = strategies.get(name, max_pumps)
+            plan_us = plan_time(strategy, orders, flow_rate)
+            results.append(summarize(strategy, 'direct', bench_direct(strategy, orders, profile['pins'], flow_rate), args.speedup, plan_us))
+            if strategy.exact:
+                samples = bench_controller(strategy, orders, profile['pins'], flow_rate, directory, max_pumps)
+                results.append(summarize(strategy, 'controller', samples, args.speedup, plan_us))
+
+    print(f"{'strategy':16} {'executor':10} {'plan':>8} {'ready p50':>10} {'ready max':>10} {'spread':>8} {'timing max':>11} {'volume err':>11}")
+    for result in results:
+        print(f"{result['strategy']:16} {result['executor']:10} {result['plan_us']:6.0f}us {result['ready_median']:9.1f}s "
+              f"{result['ready_max']:9.1f}s {result['finish_spread_median']:7.1f}s {result['timing_error_ms_max']:9.1f}ms "
+              f"{result['volume_error_ml_max']:8.2f} mL")
+    # Profiles pick the strategy the controller runs, direct runs are there for comparison
+    within = [result for result in results if result['executor'] == 'controller' and result['volume_error_ml_max'] <= args.tolerance]
+    best = min(within, key=lambda result: result['ready_median']) if within else None
+    if best is None:
+        print(f"No strategy stayed within {args.tolerance} mL")
+    else:
+        print(f"Fastest on the controller within {args.tolerance} mL: {best['strategy']}, "
+              f"set \"strategy\": \"{best['strategy']}\" in the profile")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'profile': args.profile, 'menu': menu_path if os.path.exists(menu_path) else None,
+                       'orders': args.orders, 'speedup': args.speedup, 'machine': platform.machine(),
+                       'results': results, 'best': best}, file, indent=2)
@@ -0,0 +1,246 @@
+# -*- coding: utf8 -*-
+
+# Bottle layout optimizer: which ingredient to load on which motor.
+#
+# Takes the menu and how often each cocktail was ordered (the controller's
+# order log, or a JSON object of cocktail -> count) and proposes a bottle map
+# for pump_controller.py --bottles:
+#
+# 1. Pick the ingredients to load so that as many of the expected orders as
+#    possible can be made: recipes are added best orders-per-new-bottle first,
+#    then single swaps are tried until none helps.
+# 2. Give every motor left over to the ingredient whose extra pump saves the
+#    most expected pour time (pours are split over every motor holding an
+#    ingredient, see menu.split_pours), or failing that to the ingredient
+#    drawn the most per bottle.
+# 3. Keep bottles where they already are when the current map has them, the
+#    others go to the free motors.
+#
+# The current and the proposed layout are then both replayed on a simulated
+# controller with the same sample of orders to check the throughput gain:
+#
+#     python3 -m cbr.layout --menu holiday.json --history orders.log --current bottles.json --output bottles-new.json
+
+import argparse
+import collections
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+import journal
+import menu
+import pump_controller
+from cbr import profiles
+
+# Function to count the glasses ordered per cocktail, from an order log or a JSON object of counts
+def read_history(path):
+    if path.endswith('.json'):
+        with open(path) as file:
+            return collections.Counter({name: float(count) for name, count in json.load(file).items()})
+    counts = collections.Counter()
+    for record in journal.read_records(path):
+        if record.get('r') == 'order' and record.get('label'):
+            counts[record['label']] += record.get('glasses', 1)
+    return counts
+
+# Function to turn the counts into the share of orders expected for every cocktail of the menu.
+# Cocktails never ordered keep a small share so they still count a little.
+def demand(recipes, counts, smoothing=0.5):
+    weights = {name: counts.get(name, 0) + smoothing for name in recipes}
+    total = sum(weights.values())
+    return {name: weight / total for name, weight in weights.items()}
+
+# Function to list the volume of every ingredient of each recipe
+def recipe_needs(recipes):
+    needs = {}
+    for name, recipe in recipes.items():
+        volumes = collections.defaultdict(float)
+        for ingredient, volume in menu.recipe_ingredients(recipe):
+            volumes[ingredient] += volume
+        needs[name] = dict(volumes)
+    return needs
+
+# Function to add up the share of orders that can be made with a set of ingredients
+def coverage(needs, weights, loaded):
+    return sum(weights[name] for name, volumes in needs.items() if loaded.issuperset(volumes))
+
+# Function to pick at most motors ingredients covering as many expected orders as possible
+def choose_ingredients(needs, weights, motors):
+    chosen = set()
+    while True:
+        best = None
+        for name, volumes in needs.items():
+            new = set(volumes) - chosen
+            if not new or len(chosen) + len(new) > motors:
+                continue
+            gain = coverage(needs, weights, chosen | new) - coverage(needs, weights, chosen)
+            score = (gain / len(new), -len(new), name)
+            if gain > 0 and (best is None or score > best[0]):
+                best = (score, new)
+        if best is None:
+            break
+        chosen |= best[1]
+
+    # Swap one bottle for another while that makes more orders possible
+    everything = {ingredient for volumes in needs.values() for ingredient in volumes}
+    improved = True
+    while improved:
+        improved = False
+        current = coverage(needs, weights, chosen)
+        for out in sorted(chosen):
+            for candidate in sorted(everything - chosen):
+                swapped = (chosen - {out}) | {candidate}
+                if coverage(needs, weights, swapped) > current + 1e-9:
+                    chosen = swapped
+                    improved = True
+                    break
+            if improved:
+                break
+    return chosen
+
+# Function to compute the expected pour seconds per makeable order, copies maps every
+# loaded ingredient to the number of motors holding it
+def expected_time(needs, weights, copies, flow_rate):
+    total = 0.0
+    share = 0.0
+    for name, volumes in needs.items():
+        if all(copies.get(ingredient, 0) > 0 for ingredient in volumes):
+            total += weights[name] * max((volume / (copies[ingredient] * flow_rate) for ingredient, volume in volumes.items()), default=0)
+            share += weights[name]
+    return total / share if share else 0.0
+
+# Function to hand the motors left over to the ingredients that save the most pour time
+def add_copies(needs, weights, chosen, motors, flow_rate):
+    copies = {ingredient: 1 for ingredient in chosen}
+    # mL of every ingredient drawn per expected order, to spread the busiest bottles when time cannot be saved
+    drawn = collections.defaultdict(float)
+    for name, volumes in needs.items():
+        for ingredient, volume in volumes.items():
+            drawn[ingredient] += weights[name] * volume
+    for _ in range(motors - len(chosen)):
+        if not copies:
+            break
+        base = expected_time(needs, weights, copies, flow_rate)
+        best = max(copies, key=lambda ingredient: (base - expected_time(needs, weights, dict(copies, **{ingredient: copies[ingredient] + 1}), flow_rate),
+                                                  drawn[ingredient] / copies[ingredient], ingredient))
+        copies[best] += 1
+    return copies
+
+# Function to put the bottles on motor numbers, leaving those the current map already has in place
+def place(copies, motors, current=None):
+    bottles = {}
+    left = dict(copies)
+    for motor, ingredient in sorted((current or {}).items()):
+        if 1 <= motor <= motors and left.get(ingredient, 0) > 0:
+            bottles[motor] = ingredient
+            left[ingredient] -= 1
+    free = [motor for motor in range(1, motors + 1) if motor not in bottles]
+    for ingredient in sorted(left, key=lambda ingredient: (-left[ingredient], ingredient)):
+        for _ in range(left[ingredient]):
+            bottles[free.pop(0)] = ingredient
+    return dict(sorted(bottles.items()))
+
+# Function to propose a bottle map for the menu and order history
+def optimize(recipes, counts, motors, flow_rate, current=None):
+    needs = recipe_needs(recipes)
+    weights = demand(recipes, counts)
+    chosen = choose_ingredients(needs, weights, motors)
+    return place(add_copies(needs, weights, chosen, motors, flow_rate), motors, current)
+
+# Function to describe a bottle map: share of expected orders it can make and expected pour seconds
+def evaluate(recipes, counts, bottles, flow_rate):
+    needs = recipe_needs(recipes)
+    weights = demand(recipes, counts)
+    copies = collections.Counter(bottles.values())
+    return {'makeable': coverage(needs, weights, set(copies)), 'pour_seconds': expected_time(needs, weights, copies, flow_rate)}
+
+# Function to pour a sample of orders on a simulated controller loaded with the bottle map.
+# Every order is queued at once, so the time to drain the queue gives the throughput.
+def simulate(bottles, orders, recipes, pins, flow_rate, directory, name):
+    bottles_path = os.path.join(directory, f"{name}-bottles.json")
+    with open(bottles_path, 'w') as file:
+        json.dump({str(motor): ingredient for motor, ingredient in bottles.items()}, file)
+    client = pump_controller.connect_or_spawn(pins, flow_rate, os.path.join(directory, f"{name}.sock"), sim=True,
+                                              extra_args=['--bottles', bottles_path,
+                                                          '--inventory', os.path.join(directory, f"{name}-inventory.json"),
+                                                          '--telemetry-log', os.path.join(directory, f"{name}-pours.log"),
+                                                          '--journal', os.path.join(directory, f"{name}.journal"),
+                                                          '--order-log', os.path.join(directory, f"{name}-orders.log")])
+    results = {}
+    finished = threading.Event()
+
+    # Function to collect the outcome of every order
+    def on_event(event):
+        if event['ev'] in ('done', 'error') and event.get('order') in pending:
+            results[event['order']] = event
+            if len(results) == len(pending):
+                finished.set()
+
+    pending = {f"layout-{n}": label for n, label in enumerate(orders)}
+    client.add_listener(on_event)
+    started = time.monotonic()
+    try:
+        for order_id, label in pending.items():
+            client.pour(order_id, menu.recipe_ingredients(recipes[label]), label=label)
+        finished.wait(600)
+    finally:
+        client.close()
+    done = [event for event in results.values() if event['ev'] == 'done']
+    drained = max((event['t'] for event in done), default=started) - started
+    return {'orders': len(orders), 'made': len(done), 'seconds': drained}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Propose which ingredient to load on which motor")
+    parser.add_argument('--menu', default='holiday.json')
+    parser.add_argument('--history', default='orders.log', help="Order log of the controller, or a JSON object of cocktail -> orders")
+    parser.add_argument('--current', help="Bottle map loaded now, the recipes' motors by default")
+    parser.add_argument('--profile', default=profiles.default_profile, help="Profile giving the relay pins and flow rate")
+    parser.add_argument('--output', help="Write the proposed bottle map to this JSON file")
+    parser.add_argument('--sample', type=int, default=40, help="Orders replayed on the simulated controller, 0 to skip")
+    parser.add_argument('--speedup', type=float, default=50, help="Factor the simulated pumps run faster than the profile")
+    args = parser.parse_args()
+
+    profile = profiles.load_profile(args.profile)
+    recipes = menu.load_recipes(args.menu)
+    counts = read_history(args.history) if os.path.exists(args.history) else collections.Counter()
+    motors = len(profile['pins'])
+    if args.current:
+        current = menu.load_bottles(args.current)
+    else:
+        current = {}
+        for recipe in recipes.values():
+            for ingredient in recipe['ingredients']:
+                if 'motor' in ingredient:
+                    current.setdefault(ingredient['motor'], ingredient['name'])
+
+    proposed = optimize(recipes, counts, motors, profile['flow_rate'], current)
+    print(f"{sum(counts.values()):.0f} orders in the history, {len(recipes)} cocktails, {motors} motors")
+    for motor in range(1, motors + 1):
+        before, after = current.get(motor, '-'), proposed.get(motor, '-')
+        print(f"Motor {motor:2}: {after:20} {'(was ' + before + ')' if before != after else ''}")
+
+    layouts = {'current': current, 'proposed': proposed}
+    report = {}
+    for name, bottles in layouts.items():
+        report[name] = evaluate(recipes, counts, bottles, profile['flow_rate'])
+        print(f"{name:9} makes {report[name]['makeable'] * 100:5.1f}% of expected orders, "
+              f"{report[name]['pour_seconds']:.1f} s of pouring per order")
+
+    if args.sample:
+        weights = demand(recipes, counts)
+        orders = random.Random(1).choices(list(weights), weights=list(weights.values()), k=args.sample)
+        with tempfile.TemporaryDirectory() as directory:
+            for name, bottles in layouts.items():
+                result = simulate(bottles, orders, recipes, profile['pins'], profile['flow_rate'] * args.speedup, directory, name)
+                result['seconds'] *= args.speedup
+                report[name]['simulated'] = result
+                rate = result['made'] / result['seconds'] * 3600 if result['seconds'] else 0
+                print(f"{name:9} simulated: {result['made']}/{result['orders']} orders made in {result['seconds']:.0f} s, "
+                      f"{rate:.0f} drinks/hour")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({str(motor): ingredient for motor, ingredient in proposed.items()}, file, indent=2)
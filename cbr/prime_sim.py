@@ -0,0 +1,141 @@
+# -*- coding: utf8 -*-
+
+# Latency gain of predictive pre-priming, measured on a simulated controller.
+#
+# The same stream of orders (random arrivals, cocktails drawn from the order
+# history or, without one, a few favourites ordered most) is poured three
+# times:
+#
+#   warm       lines never drain, the best that priming can do
+#   cold       drained lines are filled by the order that needs them
+#   primed     the controller primes the likely lines while idle (priming.py)
+#
+# Pumps, arrival gaps and every controller time constant run --speedup times
+# faster, the times reported are scaled back. Latency is from sending the
+# order to the drink being ready, waste is what the primed lines lost by
+# draining before an order came.
+#
+#     python3 -m cbr.prime_sim --history orders.log --prime-volume 8 --budget 100
+
+import argparse
+import collections
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+import menu
+import pump_controller
+from cbr import bench
+from cbr import layout
+from cbr import profiles
+
+# Function to draw the orders as (seconds since the previous order, cocktail)
+def order_stream(recipes, counts, orders, gap, seed=1):
+    generator = random.Random(seed)
+    if counts:
+        weights = layout.demand(recipes, counts)
+    else:
+        # Without a history a few cocktails get most of the orders
+        weights = {name: 1 / (rank + 1) ** 1.5 for rank, name in enumerate(recipes)}
+    names = list(weights)
+    return [(generator.expovariate(1 / gap), generator.choices(names, weights=[weights[name] for name in names])[0])
+            for _ in range(orders)]
+
+# Function to replay the orders on a simulated controller, all times already sped up.
+# Returns the latency of every order, the cold pours and the controller's priming state.
+def replay(stream, recipes, pins, flow_rate, directory, name, controller_args):
+    client = pump_controller.connect_or_spawn(pins, flow_rate, os.path.join(directory, f"{name}.sock"), sim=True,
+                                              extra_args=['--inventory', os.path.join(directory, f"{name}-inventory.json"),
+                                                          '--telemetry-log', os.path.join(directory, f"{name}-pours.log"),
+                                                          '--journal', os.path.join(directory, f"{name}.journal"),
+                                                          '--order-log', os.path.join(directory, f"{name}-orders.log")] + controller_args)
+    sent = {}
+    latencies = {}
+    cold = collections.Counter()
+    states = []
+    finished = threading.Event()
+
+    # Function to time every order and count the drained lines it had to fill
+    def on_event(event):
+        if event['ev'] == 'started' and event.get('order') in sent:
+            cold[event['order']] = len(event.get('cold', []))
+        elif event['ev'] in ('done', 'error') and event.get('order') in sent:
+            latencies[event['order']] = event['t'] - sent[event['order']] if event['ev'] == 'done' else None
+            if len(latencies) == len(stream):
+                finished.set()
+        elif event['ev'] == 'state':
+            states.append(event)
+
+    client.add_listener(on_event)
+    try:
+        for n, (gap, label) in enumerate(stream):
+            time.sleep(gap)
+            order_id = f"prime-{n}"
+            sent[order_id] = time.monotonic()
+            client.pour(order_id, menu.recipe_pours(recipes[label]), label=label)
+        finished.wait(120)
+        client.send(op='state')
+        deadline = time.monotonic() + 5
+        while not states and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        client.close()
+    return [latency for latency in latencies.values() if latency is not None], sum(cold.values()), (states[0].get('priming') if states else None)
+
+# Function to reduce the latencies of one scenario, scaled back to real time
+def summarize(latencies, cold, priming, speedup):
+    latencies = sorted(latency * speedup for latency in latencies)
+    return {'orders': len(latencies), 'latency_mean': statistics.mean(latencies),
+            'latency_p90': latencies[int(0.9 * (len(latencies) - 1))], 'cold_pours': cold,
+            'wasted_ml': priming['wasted'] if priming else 0.0}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure the latency gain of predictive line priming in the simulator")
+    parser.add_argument('--profile', default=profiles.default_profile, help="Profile name or JSON file giving pins and flow rate")
+    parser.add_argument('--menu', help="Recipes to pour, the profile's menu by default")
+    parser.add_argument('--history', default='orders.log', help="Order log or JSON counts the cocktails are drawn from")
+    parser.add_argument('--orders', type=int, default=40)
+    parser.add_argument('--gap', type=float, default=120.0, help="Mean seconds between orders")
+    parser.add_argument('--prime-volume', type=float, default=8.0, help="mL filling a drained line")
+    parser.add_argument('--drain-seconds', type=float, default=300.0)
+    parser.add_argument('--budget', type=float, default=100.0, help="mL per hour priming may waste")
+    parser.add_argument('--half-life', type=float, default=600.0, help="Half-life of recent orders in the demand model")
+    parser.add_argument('--speedup', type=float, default=100, help="Factor the simulation runs faster than real time")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    profile = profiles.load_profile(args.profile)
+    menu_path = args.menu or profile['menu']
+    recipes = menu.load_recipes(menu_path) if os.path.exists(menu_path) else bench.sample_recipes(len(profile['pins']))
+    counts = layout.read_history(args.history) if os.path.exists(args.history) else collections.Counter()
+    speedup = args.speedup
+    stream = [(gap / speedup, label) for gap, label in order_stream(recipes, counts, args.orders, args.gap)]
+
+    # The model learns from the orders of the replay only, the history just picks the cocktails
+    timing = ['--drain-seconds', str(args.drain_seconds / speedup), '--demand-half-life', str(args.half_life / speedup),
+              '--idle-delay', str(2.0 / speedup)]
+    scenarios = {
+        'warm': [],
+        'cold': ['--prime-volume', str(args.prime_volume)] + timing,
+        'primed': ['--prime-volume', str(args.prime_volume), '--prime-budget', str(args.budget * speedup)] + timing,
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, controller_args in scenarios.items():
+            results[name] = summarize(*replay(stream, recipes, profile['pins'], profile['flow_rate'] * speedup, directory, name,
+                                              controller_args), speedup)
+            result = results[name]
+            print(f"{name:7} {result['orders']} orders, latency mean {result['latency_mean']:5.1f} s, p90 {result['latency_p90']:5.1f} s, "
+                  f"{result['cold_pours']} cold pours, {result['wasted_ml']:.0f} mL wasted")
+    gain = results['cold']['latency_mean'] - results['primed']['latency_mean']
+    print(f"Priming saves {gain:.1f} s per order on average, "
+          f"{gain / max(1e-9, results['cold']['latency_mean'] - results['warm']['latency_mean']) * 100:.0f}% of the cold line penalty")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'profile': args.profile, 'orders': args.orders, 'gap': args.gap, 'prime_volume': args.prime_volume,
+                       'drain_seconds': args.drain_seconds, 'budget': args.budget, 'speedup': speedup, 'results': results}, file, indent=2)
@@ -0,0 +1,79 @@
+# -*- coding: utf8 -*-
+
+# Deployment profiles: the relay pins, menu, image size, flow rate and
+# dispense strategy of every robot the scripts in this repository were
+# written for. The GUI picks one with CBR_PROFILE, by name or as a JSON file
+# that starts from a named profile and overrides some of its keys:
+#
+#   {"base": "battletested", "pins": [23, 21, 19, 15], "strategy": "capped", "max_pumps": 2}
+#
+# "bottles" names a bottle map file (see menu.py): the recipes are then
+# poured by ingredient name and an ingredient on several motors is split
+# over all of them. "calibration" names the controller's flow rate
+# calibration file, the menu ETAs follow the rates the controller reports.
+#
+# The menu lists the cocktails most ordered lately first, from "order_log".
+# The images of the first "pinned_images" are loaded right after the first
+# frame and always kept, the others load in idle time while "image_cache"
+# (None for no limit) has room for them, or when tapped.
+#
+# "lean_memory" is for boards with little RAM such as the Pi Zero: the
+# recipes are kept as compact slot records (menu.compact_recipes), JPEGs
+# are decoded straight at a fraction of their size, and unless "image_cache"
+# is set only the pinned images stay in memory.
+#
+# The original added_timePrint.py and noimages.py switched every pump on
+# together (the all_on strategy), they run concurrent now so the pours keep
+# their volume.
+
+import json
+import os
+
+from cbr import strategies
+
+# Profile used when none is selected
+default_profile = 'progressbar_added'
+
+# Every known deployment by the name of the script written for it
+profiles = {
+    'progressbar_added': {'pins': [40, 38, 36, 15, 13, 11, 7, 5, 31, 33], 'menu': 'holiday.json', 'image_size': 170,
+                          'flow_rate': 1.5, 'strategy': 'concurrent'},
+    'zero-frozen-bar': {'pins': [40, 38, 36, 15, 13, 11, 7, 5, 31, 33], 'menu': 'holiday.json', 'image_size': 170,
+                        'flow_rate': 1.5, 'strategy': 'concurrent', 'lean_memory': True},
+    'battletested': {'pins': [23, 21, 19, 15, 13, 11, 7, 5, 31, 33], 'menu': 'holiday.json', 'image_size': 170,
+                     'flow_rate': 1.5, 'strategy': 'concurrent'},
+    'newCBRmain': {'pins': [38, 21, 19, 15, 13, 11, 7, 5, 31, 33], 'menu': '/home/jongo/Desktop/cbr/holiday.json',
+                   'image_size': 170, 'flow_rate': 1.5, 'strategy': 'concurrent'},
+    'relayOnly_noCustomMotor': {'pins': [38, 21, 19, 15, 13, 11, 7, 5, 31, 33], 'menu': 'holiday.json', 'image_size': 170,
+                                'flow_rate': 1.5, 'strategy': 'concurrent'},
+    'noAllMotors_noTime': {'pins': [23, 21, 19, 15, 13, 11, 7, 5, 31, 33, 35], 'menu': '/home/jongo/Desktop/cbr/holiday.json',
+                           'image_size': 170, 'flow_rate': 105 / 60, 'strategy': 'sequential'},
+    'imgShowed_1by1': {'pins': [23, 21, 19, 15, 13, 11, 7, 5, 31, 33, 35], 'menu': 'holiday.json', 'image_size': 170,
+                       'flow_rate': 105 / 60, 'strategy': 'sequential'},
+    'huge_finishtime': {'pins': [23, 21, 19, 15, 13, 11, 7, 5, 31, 33, 35], 'menu': 'db.json', 'image_size': 210,
+                        'flow_rate': 105 / 60, 'strategy': 'sequential'},
+    'added_timePrint': {'pins': [23, 21, 19, 15, 13, 11, 7, 5, 31, 33, 35], 'menu': 'db.json', 'image_size': 210,
+                        'flow_rate': 105 / 60, 'strategy': 'concurrent'},
+    'noimages': {'pins': [23, 21, 19, 15, 13, 11, 7, 5, 31, 33, 35], 'menu': 'db.json', 'image_size': 210,
+                 'flow_rate': 105 / 60, 'strategy': 'concurrent', 'title': "Cocktail Bartending Robot", 'geometry': "700x500"},
+}
+
+# Keys every profile has, with their value when a profile leaves them out
+defaults = {'title': "Cocktail Bartender Robot", 'geometry': None, 'max_pumps': None, 'bottles': None,
+            'order_log': 'orders.log', 'pinned_images': 12, 'image_cache': None, 'lean_memory': False,
+            'max_batch': 4, 'calibration': None}
+
+# Function to load a profile by name, or from a JSON file
+def load_profile(name=None):
+    name = name or os.environ.get('CBR_PROFILE') or default_profile
+    if name.endswith('.json'):
+        with open(name) as file:
+            overrides = json.load(file)
+        profile = dict(load_profile(overrides.pop('base', default_profile)), **overrides)
+    elif name in profiles:
+        profile = dict(defaults, **profiles[name])
+    else:
+        raise ValueError(f"Unknown profile {name}, expected a JSON file or one of {', '.join(profiles)}")
+    if not strategies.get(profile['strategy']).exact:
+        raise ValueError(f"Strategy {profile['strategy']} does not pour exact volumes, it is for benchmarks only")
+    return profile
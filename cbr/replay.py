@@ -0,0 +1,233 @@
+# -*- coding: utf8 -*-
+
+# Load test: replay a recorded order log against the real controller queue.
+#
+# The orders of an order log (pump_controller.py --order-log) are sent again
+# with the gaps they originally arrived with, to a PumpController running in
+# this process on the simulated GPIO backend. Arrival gaps, pump flow, the
+# pump heat budget and the idle delay all run --speed times faster (10 to
+# 1000), so a Saturday night replays in a minute and the queue sees the same
+# load. Times in the report are scaled back to real time.
+#
+# Every relay switch is watched on the simulated pins and checked:
+#
+#   double-booked  a pin switched on while it was already on
+#   pump cap       more pumps on at once than --max-pumps allows
+#   left on        a pin still on once every order is done or shut down
+#
+# and the volume run through every motor is compared with what the orders
+# asked for (timing jitter weighs speed times more in that error than it
+# would at real speed). The JSON report can be diffed between versions, --baseline
+# compares throughput and latency with an earlier one and exits 1 on a
+# regression or any violation:
+#
+#     python3 -m cbr.replay saturday-orders.log --speed 100 --output replay.json
+#     python3 -m cbr.replay saturday-orders.log --speed 100 --baseline replay.json
+
+import argparse
+import collections
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+import journal
+import latency
+import pump_controller
+import sim_gpio
+from cbr import profiles
+from cbr import strategies
+
+# Function to read the orders of an order log as (seconds since the first order, label, glasses, pours per glass)
+def read_orders(path):
+    orders = []
+    for record in journal.read_records(path):
+        if record.get('r') != 'order' or not record.get('pours'):
+            continue
+        # The log has the time the order was ready, it was queued the wait and the pour before
+        queued = record['t'] - record.get('elapsed', 0) - record.get('wait', 0)
+        pours = [(pour['motor'], pour['volume']) for pour in record['pours']]
+        orders.append((queued, record.get('label'), record.get('glasses', 1), pours))
+    orders.sort(key=lambda order: order[0])
+    first = orders[0][0] if orders else 0
+    return [(queued - first, label, glasses, pours) for queued, label, glasses, pours in orders]
+
+# Class checking every switch of the simulated relay pins
+class PinChecker:
+    def __init__(self, motor_mapping, max_pumps=None):
+        self.motor_of_pin = {pin: motor for motor, pin in motor_mapping.items()}
+        self.max_pumps = max_pumps
+        self.on = {}  # Pin -> monotonic time it was switched on
+        self.on_seconds = collections.defaultdict(float)  # Motor -> seconds its pin was on
+        self.violations = []
+        self.lock = threading.Lock()
+
+    # Function called by sim_gpio on every output, LOW switches a relay on
+    def on_output(self, pin, level, now):
+        if pin not in self.motor_of_pin:
+            return
+        with self.lock:
+            if level == sim_gpio.LOW:
+                if pin in self.on:
+                    self.violations.append({'check': 'double-booked', 'motor': self.motor_of_pin[pin], 't': now})
+                    return
+                self.on[pin] = now
+                if self.max_pumps is not None and len(self.on) > self.max_pumps:
+                    self.violations.append({'check': 'pump cap', 'pumps': len(self.on), 't': now})
+            elif pin in self.on:
+                self.on_seconds[self.motor_of_pin[pin]] += now - self.on.pop(pin)
+
+    # Function to check that no relay is left on
+    def check_all_off(self, when):
+        with self.lock:
+            for pin in self.on:
+                self.violations.append({'check': 'left on', 'motor': self.motor_of_pin[pin], 'when': when})
+
+# Function to replay the orders on an in-process controller, speed times faster than real time
+def replay(orders, profile, speed, directory, strategy=None, max_pumps=None, max_burst=120.0):
+    pins = profile['pins']
+    flow_rate = profile['flow_rate'] * speed
+    path = os.path.join(directory, 'replay.sock')
+    controller = pump_controller.PumpController(sim_gpio, pins, flow_rate, max_burst=max_burst / speed,
+                                                strategy=strategy or profile['strategy'], max_pumps=max_pumps,
+                                                idle_delay=2.0 / speed)
+    controller.thermal.min_segment /= speed
+    checker = PinChecker(controller.motor_mapping, controller.strategy.max_pumps if controller.strategy.name == 'capped' else None)
+    sim_gpio.listeners.append(checker.on_output)
+    server = threading.Thread(target=controller.serve, args=(path,), daemon=True)
+    server.start()
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            client = pump_controller.PumpClient(path)
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+
+    sent = {}
+    results = {}
+    progress = threading.Event()
+
+    # Function to note when every order started and finished
+    def on_event(event):
+        order = event.get('order')
+        if order not in sent:
+            return
+        if event['ev'] == 'started':
+            sent[order]['started'] = event['t']
+        elif event['ev'] in ('done', 'error'):
+            results[order] = event
+            progress.set()
+
+    client.add_listener(on_event)
+    requested = collections.defaultdict(float)
+    pour_counts = collections.Counter()
+    began = time.monotonic()
+    try:
+        for n, (at, label, glasses, pours) in enumerate(orders):
+            delay = began + at / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            order_id = f"replay-{n}"
+            sent[order_id] = {'t': time.monotonic(), 'pours': pours, 'glasses': glasses}
+            client.pour(order_id, pours, label=label, glasses=glasses)
+        # Wait for the queue to drain, giving up once no order has finished for 10 minutes of replayed time
+        while len(results) < len(orders) and progress.wait(max(1.0, 600 / speed)):
+            progress.clear()
+        checker.check_all_off('after the last order')
+    finally:
+        client.send(op='shutdown')
+        server.join(10)
+        client.close()
+        sim_gpio.listeners.remove(checker.on_output)
+        checker.check_all_off('after shutdown')
+
+    # Latencies scaled back to real time
+    ready = latency.LatencyHistogram()
+    wait = latency.LatencyHistogram()
+    done = 0
+    last = began
+    for order_id, event in results.items():
+        if event['ev'] != 'done':
+            continue
+        done += 1
+        for motor, volume in sent[order_id]['pours']:
+            requested[motor] += volume * sent[order_id]['glasses']
+            pour_counts[motor] += 1
+        ready.record((event['t'] - sent[order_id]['t']) * speed)
+        if 'started' in sent[order_id]:
+            wait.record((sent[order_id]['started'] - sent[order_id]['t']) * speed)
+        last = max(last, event['t'])
+    span = (last - began) * speed
+    volume_errors = {motor: checker.on_seconds.get(motor, 0.0) * flow_rate - volume for motor, volume in requested.items()}
+    return {'orders': len(orders), 'made': done, 'refused': sum(1 for event in results.values() if event['ev'] == 'error'),
+            'lost': len(orders) - len(results), 'span_seconds': span, 'drinks_per_hour': done / span * 3600 if span else 0.0,
+            'ready': ready.summary((50, 90, 99)), 'queue_wait': wait.summary((50, 90, 99)),
+            'volume_error_ml_per_pour': max((abs(error) / pour_counts[motor] for motor, error in volume_errors.items()), default=0.0),
+            'violations': checker.violations}
+
+# Function to compare a report with a baseline, returning the regressions found
+def compare(report, baseline_path, threshold):
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    regressions = []
+    checks = [('drinks_per_hour', report['drinks_per_hour'], baseline['drinks_per_hour'], -1),
+              ('ready p90', report['ready'].get('p90'), baseline['ready'].get('p90'), 1),
+              ('queue wait p90', report['queue_wait'].get('p90'), baseline['queue_wait'].get('p90'), 1)]
+    for name, new, old, direction in checks:
+        if not new or not old:
+            continue
+        change = new / old - 1
+        print(f"{name:15} {old:10.2f} -> {new:10.2f} ({change:+.1%})")
+        if change * direction > threshold:
+            regressions.append(name)
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay an order log against the controller on simulated GPIO")
+    parser.add_argument('log', nargs='?', default='orders.log', help="Order log to replay")
+    parser.add_argument('--speed', type=float, default=100, help="Factor the replay runs faster than real time, 10 to 1000")
+    parser.add_argument('--profile', default=profiles.default_profile, help="Profile giving the pins, flow rate and strategy")
+    parser.add_argument('--strategy', choices=[name for name, strategy in strategies.strategies.items() if strategy.exact],
+                        help="Dispense strategy, the profile's by default")
+    parser.add_argument('--max-pumps', type=int, help="Pump cap of the capped strategy, the profile's by default")
+    parser.add_argument('--max-burst', type=float, default=120.0, help="Heat budget of each pump at real speed, see thermal.py")
+    parser.add_argument('--output', help="Write the report to this JSON file")
+    parser.add_argument('--baseline', help="Earlier report to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Allowed change before a regression is reported")
+    args = parser.parse_args()
+
+    if not 10 <= args.speed <= 1000:
+        parser.error("--speed must be between 10 and 1000")
+    profile = profiles.load_profile(args.profile)
+    orders = read_orders(args.log)
+    if not orders:
+        sys.exit(f"No orders to replay in {args.log}")
+    print(f"Replaying {len(orders)} orders spanning {orders[-1][0] / 60:.0f} minutes at {args.speed:g}x")
+
+    with tempfile.TemporaryDirectory() as directory:
+        report = replay(orders, profile, args.speed, directory, args.strategy, args.max_pumps or profile['max_pumps'], args.max_burst)
+    report.update(log=os.path.basename(args.log), speed=args.speed, strategy=args.strategy or profile['strategy'],
+                  python=platform.python_version(), machine=platform.machine())
+
+    print(f"{report['made']}/{report['orders']} made, {report['refused']} refused, {report['lost']} lost, "
+          f"{report['drinks_per_hour']:.0f} drinks/hour")
+    for name in ('ready', 'queue_wait'):
+        summary = report[name]
+        if summary['count']:
+            print(f"{name:10} p50 {summary['p50']:6.1f} s  p90 {summary['p90']:6.1f} s  p99 {summary['p99']:6.1f} s  max {summary['max']:6.1f} s")
+    print(f"Volume error per pour on the worst motor: {report['volume_error_ml_per_pour']:.2f} mL")
+    for violation in report['violations']:
+        print(f"Violation: {violation}")
+
+    regressions = compare(report, args.baseline, args.threshold) if args.baseline else []
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    if regressions or report['violations']:
+        sys.exit(1)
@@ -0,0 +1,150 @@
+# -*- coding: utf8 -*-
+
+# Dispense strategies, how the pours of one order are laid out in time.
+#
+# plan() turns the (motor, volume) pours of an order into one relay run per
+# pour as (motor, offset, seconds), in the order of the pours. The pump
+# controller puts those runs on its timer heap (--strategy). run() drives the
+# relays of a plan from the calling process the way the original scripts did,
+# so bench.py can compare both ways of pouring in the simulator.
+#
+#   concurrent  every pump starts at once and stops after its own volume, one
+#               thread per pump (battletested.py, newCBRmain.py, zero-frozen-bar.py)
+#   sequential  one pump after the other, smallest volume first
+#               (huge_finishtime.py, imgShowed_1by1.py, noAllMotors_noTime.py)
+#   finish_together
+#               every pump starts late enough to stop with the longest pour, the
+#               drink is ready as early as with concurrent but the ingredients
+#               land together and the short pours do not drip in an empty glass
+#   capped      shortest time to ready with at most max_pumps pumps on at once
+#               (for a power supply that cannot run every pump): longest pours
+#               first, each on the pump lane that frees up first, at most 4/3 of
+#               the best possible time. Every lane then starts as late as it can
+#               so the lanes finish together
+#   all_on      every pump on until the longest pour is done, then switched off
+#               one by one, waiting each pump's own run time in between
+#               (added_timePrint.py, noimages.py). It pours more than asked for
+#               and is only kept as a baseline for the benchmark.
+
+import threading
+import time
+
+# Class describing a dispense strategy, concurrent by default
+class Strategy:
+    name = 'concurrent'
+    exact = True  # Pours exactly the requested volumes, only exact strategies run in the controller
+
+    # Function to lay out the pours, flow_rates maps motor numbers to mL/second
+    def plan(self, pours, flow_rates):
+        return [(motor, 0.0, volume / flow_rates[motor]) for motor, volume in pours]
+
+    # Function to estimate the seconds a plan takes
+    def eta(self, pours, flow_rates):
+        return max((offset + seconds for _, offset, seconds in self.plan(pours, flow_rates)), default=0)
+
+    # Function to drive the relays of a plan with one thread per pump, blocking until all are off
+    def run(self, runs, gpio, motor_mapping):
+        threads = [threading.Thread(target=run_pump, args=(gpio, motor_mapping[motor], offset, seconds))
+                   for motor, offset, seconds in runs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+# Class pouring one ingredient after the other
+class Sequential(Strategy):
+    name = 'sequential'
+
+    def plan(self, pours, flow_rates):
+        runs = [None] * len(pours)
+        offset = 0.0
+        for index in sorted(range(len(pours)), key=lambda i: pours[i][1]):
+            motor, volume = pours[index]
+            runs[index] = (motor, offset, volume / flow_rates[motor])
+            offset += runs[index][2]
+        return runs
+
+    # Function to run the pumps one at a time from the calling thread
+    def run(self, runs, gpio, motor_mapping):
+        for motor, _, seconds in sorted(runs, key=lambda run: run[1]):
+            run_pump(gpio, motor_mapping[motor], 0, seconds)
+
+# Class starting every pump so they all stop together
+class FinishTogether(Strategy):
+    name = 'finish_together'
+
+    def plan(self, pours, flow_rates):
+        runs = super().plan(pours, flow_rates)
+        longest = max((seconds for _, _, seconds in runs), default=0)
+        return [(motor, longest - seconds, seconds) for motor, _, seconds in runs]
+
+# Class running at most max_pumps pumps at once
+class Capped(Strategy):
+    name = 'capped'
+
+    def __init__(self, max_pumps=3):
+        self.max_pumps = max(1, max_pumps)
+
+    def plan(self, pours, flow_rates):
+        seconds = [volume / flow_rates[motor] for motor, volume in pours]
+        lanes = [[0.0, []] for _ in range(min(self.max_pumps, len(pours)))]  # [busy seconds, pour indexes]
+        for index in sorted(range(len(pours)), key=lambda i: -seconds[i]):
+            lane = min(lanes, key=lambda lane: lane[0])
+            lane[1].append(index)
+            lane[0] += seconds[index]
+        makespan = max((lane[0] for lane in lanes), default=0)
+        runs = [None] * len(pours)
+        for busy, indexes in lanes:
+            offset = makespan - busy
+            for index in indexes:
+                runs[index] = (pours[index][0], offset, seconds[index])
+                offset += seconds[index]
+        return runs
+
+# Class switching every pump on together and off one by one, as noimages.py did
+class AllOn(Strategy):
+    name = 'all_on'
+    exact = False
+
+    def plan(self, pours, flow_rates):
+        order = sorted(range(len(pours)), key=lambda i: pours[i][1] / flow_rates[pours[i][0]])
+        longest = max((pours[i][1] / flow_rates[pours[i][0]] for i in order), default=0)
+        runs = [None] * len(pours)
+        off_at = longest
+        for index in order:
+            motor, volume = pours[index]
+            runs[index] = (motor, 0.0, off_at)
+            off_at += volume / flow_rates[motor]
+        return runs
+
+    def run(self, runs, gpio, motor_mapping):
+        # The run times are recovered from the gaps between the off times
+        runs = sorted(runs, key=lambda run: run[2])
+        for motor, _, _ in runs:
+            gpio.output(motor_mapping[motor], gpio.LOW)
+        previous = 0.0
+        for motor, _, off_at in runs:
+            time.sleep(off_at - previous)
+            gpio.output(motor_mapping[motor], gpio.HIGH)
+            previous = off_at
+
+# Function to run one pump for some seconds after a delay, LOW switches the relay on
+def run_pump(gpio, pin, offset, seconds):
+    if offset > 0:
+        time.sleep(offset)
+    gpio.output(pin, gpio.LOW)
+    try:
+        time.sleep(seconds)
+    finally:
+        gpio.output(pin, gpio.HIGH)
+
+# Every strategy by name
+strategies = {strategy.name: strategy for strategy in (Strategy(), Sequential(), FinishTogether(), Capped(), AllOn())}
+
+# Function to look up a strategy by name, max_pumps sets the cap of the capped strategy
+def get(name, max_pumps=None):
+    if name not in strategies:
+        raise ValueError(f"Unknown dispense strategy {name}, expected one of {', '.join(strategies)}")
+    if name == Capped.name and max_pumps is not None:
+        return Capped(max_pumps)
+    return strategies[name]
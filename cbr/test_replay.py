@@ -0,0 +1,44 @@
+# -*- coding: utf8 -*-
+
+# Replay of a small recorded order log: every order is made, the relays stay
+# within the pump cap and the report compares against a baseline.
+
+import json
+
+import pytest
+
+from cbr import profiles
+from cbr import replay
+
+# Orders as the controller logs them once ready, t is the time the order was ready
+records = [{'r': 'order', 't': 1060.0, 'order': 'gui-2', 'label': 'Screwdriver', 'glasses': 1, 'elapsed': 20.0, 'wait': 0.0,
+            'pours': [{'motor': 3, 'volume': 30.0}]},
+           {'r': 'order', 't': 1030.0, 'order': 'gui-1', 'label': 'Mojito', 'glasses': 2, 'elapsed': 25.0, 'wait': 5.0,
+            'pours': [{'motor': 1, 'volume': 30.0}, {'motor': 2, 'volume': 15.0}, {'motor': 4, 'volume': 7.5}]},
+           {'r': 'order', 't': 1070.0, 'order': 'gui-3', 'label': 'Shot', 'glasses': 1, 'elapsed': 4.0, 'wait': 0.0,
+            'pours': [{'motor': 1, 'volume': 6.0}]},
+           {'r': 'order', 't': 1080.0, 'order': 'gui-4', 'label': 'Nothing', 'pours': []}]
+
+@pytest.fixture
+def log(tmp_path):
+    path = tmp_path / 'orders.log'
+    path.write_text(''.join(json.dumps(record) + '\n' for record in records))
+    return str(path)
+
+def test_orders_are_read_in_arrival_order(log):
+    orders = replay.read_orders(log)
+    assert [label for _, label, _, _ in orders] == ['Mojito', 'Screwdriver', 'Shot']
+    assert [at for at, _, _, _ in orders] == [0.0, 40.0, 66.0]
+    assert orders[0][2:] == (2, [(1, 30.0), (2, 15.0), (4, 7.5)])
+
+def test_replay_makes_every_order_within_the_cap(log, tmp_path):
+    report = replay.replay(replay.read_orders(log), profiles.load_profile('progressbar_added'), 100, str(tmp_path),
+                           strategy='capped', max_pumps=2)
+    assert (report['made'], report['refused'], report['lost']) == (3, 0, 0)
+    assert report['violations'] == []
+    assert report['ready']['count'] == 3
+    assert report['volume_error_ml_per_pour'] < 5
+
+    baseline = tmp_path / 'baseline.json'
+    baseline.write_text(json.dumps(dict(report, drinks_per_hour=report['drinks_per_hour'] * 2)))
+    assert replay.compare(report, str(baseline), 0.10) == ['drinks_per_hour']
@@ -0,0 +1,35 @@
+# -*- coding: utf8 -*-
+
+# Dispense strategies: every pour keeps its volume, and the capped strategy
+# never has more than max_pumps on at once.
+
+import pytest
+
+from cbr import strategies
+
+pours = [(1, 45.0), (2, 30.0), (3, 15.0), (4, 15.0), (5, 7.5)]
+flow_rates = {1: 1.5, 2: 1.5, 3: 1.5, 4: 3.0, 5: 1.5}
+
+# Function to count the most runs overlapping at any time
+def most_at_once(runs):
+    switches = sorted([(offset, 1) for _, offset, _ in runs] + [(offset + seconds, -1) for _, offset, seconds in runs])
+    on = peak = 0
+    for _, change in switches:  # Switch-offs sort before switch-ons at the same time
+        on += change
+        peak = max(peak, on)
+    return peak
+
+@pytest.mark.parametrize('max_pumps', [1, 2, 3, 10])
+def test_capped_plan_stays_within_the_cap(max_pumps):
+    runs = strategies.Capped(max_pumps).plan(pours, flow_rates)
+    assert most_at_once(runs) <= max_pumps
+    assert [(motor, seconds * flow_rates[motor]) for motor, _, seconds in runs] == [(motor, pytest.approx(volume)) for motor, volume in pours]
+
+def test_capped_plan_finishes_every_lane_together():
+    runs = strategies.Capped(2).plan(pours, flow_rates)
+    ends = sorted(offset + seconds for _, offset, seconds in runs)
+    assert ends[-1] == pytest.approx(ends[-2])
+    assert ends[-1] == pytest.approx(sum(volume / flow_rates[motor] for motor, volume in pours) / 2)
+
+def test_capped_needs_at_least_one_pump():
+    assert strategies.Capped(0).max_pumps == 1
@@ -0,0 +1,303 @@
+#!/usr/bin/python3
+# -*- coding: utf8 -*-
+
+# Fleet coordinator for several cocktail robots at one event.
+#
+# Every unit runs its own pump_controller.py with its own relay pins and
+# bottles. The coordinator connects to each controller with the usual JSON
+# lines protocol (a socket path, or host:port for a controller on another Pi),
+# follows its queue and inventory events, and sends every order to the unit
+# with the lowest ETA that has all the ingredients. An order a unit refuses,
+# for instance because a bottle ran low, is retried on the next best unit.
+#
+# fleet.json lists the units and the ingredient behind each motor. Ingredients
+# recorded with a refill on a unit take precedence over the file. A unit
+# reached over TCP needs "token_file", the file its controller was started
+# with --token-file:
+#
+#   {"units": [{"name": "bar-1", "socket": "/tmp/cbr-bar1.sock", "pins": [40, 38, 36],
+#               "flow_rate": 1.5, "strategy": "concurrent", "bottles": {"1": "Rum", "2": "Lime", "3": "Mint"}}]}
+#
+# Orders come in through the same HTTP/WebSocket API as order_api.py, plus
+# GET /fleet for the state of every unit. --sim starts a simulated controller
+# for every unit that is not running, to try a whole fleet on one Linux box:
+#
+#     python3 fleet.py --config fleet.json --menu holiday.json --port 8080 --sim
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import threading
+import time
+
+import menu
+import order_api
+import pump_controller
+from cbr import strategies
+
+# Exception raised when no unit of the fleet can make an order
+class NoUnitAvailable(Exception):
+    pass
+
+# Class tracking the bottles and queue of one unit
+class FleetUnit:
+    def __init__(self, name, client, bottles, flow_rate, strategy=None):
+        self.name = name
+        self.client = client
+        self.bottles = bottles  # Motor number -> ingredient name
+        self.flow_rate = flow_rate
+        self.strategy = strategy or strategies.get('concurrent')  # Dispense strategy the unit's controller runs
+        self.levels = {}  # Motor number -> mL left, from the unit's inventory events
+        self.orders = {}  # Order id -> {'pours', 'glasses', 'eta', 'job', 'started'} sent and not finished
+        self.online = True
+
+    # Function to map a recipe onto the motors of this unit, None when an ingredient is missing.
+    # An ingredient loaded on several motors is split over all of them.
+    def pours_for(self, recipe):
+        try:
+            return menu.split_pours(menu.recipe_ingredients(recipe), self.bottles, collections.defaultdict(lambda: self.flow_rate))
+        except KeyError:
+            return None
+
+    # Function to check the bottles hold the pours on top of the orders in flight
+    def has_enough(self, pours, glasses):
+        for motor, volume in pours:
+            if motor not in self.levels:
+                continue  # Untracked bottle
+            pending = sum(v * order['glasses'] for order in self.orders.values() for m, v in order['pours'] if m == motor)
+            if self.levels[motor] < volume * glasses + pending:
+                return False
+        return True
+
+    # Function to estimate the seconds a run of the pours takes on this unit
+    def pour_eta(self, pours, glasses):
+        return self.strategy.eta([(motor, volume * glasses) for motor, volume in pours], collections.defaultdict(lambda: self.flow_rate))
+
+    # Function to estimate the seconds before the pumps of this unit are free
+    def backlog(self, now):
+        queued = 0
+        running = {}  # Job -> seconds left, orders poured as one batch share a job
+        for order in self.orders.values():
+            if order['started'] is None:
+                queued += order['eta']
+            else:
+                running[order['job']] = max(0, order['eta'] - (now - order['started']))
+        return queued + sum(running.values())
+
+    # Function to report the unit for GET /fleet
+    def snapshot(self, now):
+        return {'unit': self.name, 'online': self.online, 'backlog': self.backlog(now), 'orders': sorted(self.orders),
+                'bottles': {str(motor): ingredient for motor, ingredient in sorted(self.bottles.items())},
+                'levels': {str(motor): level for motor, level in sorted(self.levels.items())}}
+
+# Class routing orders across the units of the fleet
+class FleetCoordinator:
+    def __init__(self, units, recipes):
+        self.units = units
+        self.recipes = recipes
+        self.lock = threading.Lock()  # Unit events arrive on one reader thread per unit
+        self.listeners = []  # Functions called with every unit event, tagged with the unit name
+        self.routing = {}  # Order id -> (cocktail, glasses, names of the units tried)
+        for unit in units:
+            unit.client.add_listener(lambda event, unit=unit: self.on_unit_event(unit, event))
+            unit.client.request_inventory()
+
+    # Function to register a callback for fleet events, same interface as PumpClient
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    # Function to rank the units that can make an order, as [(eta, name, unit, pours)] soonest first
+    def candidates(self, cocktail, glasses, now, exclude=()):
+        recipe = self.recipes[cocktail]
+        ranked = []
+        for unit in self.units:
+            if not unit.online or unit.name in exclude:
+                continue
+            pours = unit.pours_for(recipe)
+            if pours is None or not unit.has_enough(pours, glasses):
+                continue
+            ranked.append((unit.backlog(now) + unit.pour_eta(pours, glasses), unit.name, unit, pours))
+        ranked.sort(key=lambda candidate: candidate[:2])
+        return ranked
+
+    # Function to estimate when an order would be ready, None when no unit can make it
+    def eta(self, cocktail, glasses=1):
+        with self.lock:
+            ranked = self.candidates(cocktail, glasses, time.monotonic())
+        return ranked[0][0] if ranked else None
+
+    # Function to send an order to the best unit, returning the unit name and ETA
+    def submit(self, order_id, cocktail, glasses=1):
+        with self.lock:
+            self.routing[order_id] = (cocktail, glasses, set())
+            routed = self.dispatch(order_id)
+        if routed is None:
+            raise NoUnitAvailable(f"No unit can make {glasses} x {cocktail}")
+        self.notify([routed])
+        return routed['unit'], routed['eta']
+
+    # Function to send an order to the best unit not tried yet, called with the lock held.
+    # Returns the "routed" event, or None when the order is out of units.
+    def dispatch(self, order_id):
+        cocktail, glasses, tried = self.routing[order_id]
+        for eta, name, unit, pours in self.candidates(cocktail, glasses, time.monotonic(), tried):
+            tried.add(name)
+            try:
+                unit.client.pour(order_id, pours, label=cocktail, glasses=glasses)
+            except OSError:
+                unit.online = False
+                continue
+            unit.orders[order_id] = {'pours': pours, 'glasses': glasses, 'eta': unit.pour_eta(pours, glasses),
+                                     'job': None, 'started': None}
+            return {'ev': 'routed', 'order': order_id, 'unit': name, 'eta': eta}
+        del self.routing[order_id]
+        return None
+
+    # Function to follow the events of one unit and pass them on
+    def on_unit_event(self, unit, event):
+        now = time.monotonic()
+        events = [dict(event, unit=unit.name)]
+        with self.lock:
+            order_id = event.get('order')
+            order = unit.orders.get(order_id)
+            if event['ev'] == 'started' and order is not None:
+                order.update(started=now, eta=event['eta'], job=event['job'])
+            elif event['ev'] == 'done' and order is not None:
+                del unit.orders[order_id]
+                self.routing.pop(order_id, None)
+                unit.client.request_inventory()
+            elif event['ev'] == 'error' and order is not None:
+                # The unit refused the order, try the next best one before giving up
+                del unit.orders[order_id]
+                routed = self.dispatch(order_id)
+                if routed is not None:
+                    events = [routed]
+            elif event['ev'] in ('stopped', 'watchdog'):
+                for cancelled in event['cancelled']:
+                    if unit.orders.pop(cancelled, None) is not None:
+                        self.routing.pop(cancelled, None)
+            elif event['ev'] == 'inventory':
+                for level in event.get('levels', []) + event['warnings']:
+                    self.levels_from(unit, level)
+            elif event['ev'] == 'disconnected':
+                events += self.unit_lost(unit)
+        self.notify(events)
+
+    # Function to record the level and ingredient of one bottle reported by a unit
+    def levels_from(self, unit, level):
+        unit.levels[level['motor']] = level['remaining']
+        if level.get('ingredient'):
+            unit.bottles[level['motor']] = level['ingredient']
+
+    # Function to take a unit out of the fleet when its controller goes away, called with the lock held.
+    # Orders still queued there move to other units, orders already pouring fail.
+    def unit_lost(self, unit):
+        unit.online = False
+        events = []
+        for order_id, order in list(unit.orders.items()):
+            del unit.orders[order_id]
+            routed = self.dispatch(order_id) if order['started'] is None else None
+            if routed is None:
+                self.routing.pop(order_id, None)
+                events.append({'ev': 'error', 'order': order_id, 'unit': unit.name, 'error': f"Unit {unit.name} went away"})
+            else:
+                events.append(routed)
+        return events
+
+    # Function to pass events on to the listeners
+    def notify(self, events):
+        for event in events:
+            for listener in self.listeners:
+                listener(event)
+
+    # Function to report every unit
+    def snapshot(self):
+        now = time.monotonic()
+        with self.lock:
+            return [unit.snapshot(now) for unit in self.units]
+
+# Ordering API placing orders through the coordinator instead of a single controller
+class FleetAPI(order_api.OrderAPI):
+    def __init__(self, coordinator):
+        super().__init__(coordinator, coordinator.recipes, None)
+        self.prefix = f"fleet-{os.getpid()}"
+
+    # Function to route an order to a unit, the order is forgotten when no unit can make it
+    def place(self, order_id, cocktail, glasses):
+        try:
+            unit, eta = self.client.submit(order_id, cocktail, glasses)
+        except NoUnitAvailable:
+            del self.orders[order_id]
+            raise
+        self.orders[order_id].update(unit=unit, eta=eta)
+
+    # Function to follow the unit an order was sent to
+    def handle_event(self, event):
+        if event['ev'] == 'routed' and event['order'] in self.orders:
+            self.orders[event['order']].update(unit=event['unit'], eta=event['eta'])
+        super().handle_event(event)
+
+    # Function to list the menu with the ETA on the best unit
+    def menu_items(self):
+        items = []
+        for name, recipe in self.recipes.items():
+            eta = self.client.eta(name)
+            items.append({'cocktail': name, 'ingredients': recipe['ingredients'], 'eta': eta, 'available': eta is not None})
+        return items
+
+    # Function to route one HTTP request, adding GET /fleet
+    def route(self, method, path, body):
+        if path == '/fleet':
+            return (200, self.client.snapshot()) if method == 'GET' else (405, {'error': 'GET only'})
+        try:
+            return super().route(method, path, body)
+        except NoUnitAvailable as e:
+            return 503, {'error': str(e)}
+
+# Function to connect to every unit listed in the fleet config, starting simulated ones if asked
+def connect_units(config, sim=False):
+    units = []
+    for spec in config['units']:
+        name = spec['name']
+        flow_rate = spec.get('flow_rate', 1.5)
+        strategy = strategies.get(spec.get('strategy', 'concurrent'), spec.get('max_pumps'))
+        token = pump_controller.read_token(spec['token_file']) if spec.get('token_file') else None
+        if sim:
+            # Each simulated unit keeps its own inventory, pour log, journal and order log
+            client = pump_controller.connect_or_spawn(spec.get('pins', [40, 38, 36, 15, 13, 11, 7, 5, 31, 33]), flow_rate,
+                                                      spec['socket'], sim=True, token=token,
+                                                      extra_args=['--inventory', f"inventory-{name}.json",
+                                                                  '--telemetry-log', f"pours-{name}.log",
+                                                                  '--journal', f"orders-{name}.journal",
+                                                                  '--order-log', f"orders-{name}.log",
+                                                                  '--strategy', strategy.name] +
+                                                                 (['--max-pumps', str(spec['max_pumps'])] if spec.get('max_pumps') else []) +
+                                                                 (['--token-file', spec['token_file']] if spec.get('token_file') else []))
+        else:
+            client = pump_controller.PumpClient(spec['socket'], token)
+        bottles = {int(motor): ingredient for motor, ingredient in spec.get('bottles', {}).items()}
+        units.append(FleetUnit(name, client, bottles, flow_rate, strategy))
+    return units
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Cocktail robot fleet coordinator")
+    parser.add_argument('--config', default='fleet.json', help="Units with their controller socket and bottles")
+    parser.add_argument('--menu', default='holiday.json')
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on, 0.0.0.0 lets anyone on the network order")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--sim', action='store_true', help="Start a simulated controller for every unit not running")
+    args = parser.parse_args()
+
+    with open(args.config) as file:
+        config = json.load(file)
+    units = connect_units(config, args.sim)
+    api = FleetAPI(FleetCoordinator(units, menu.load_recipes(args.menu)))
+    try:
+        asyncio.run(api.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Process interrupted by the user.")
+    finally:
+        for unit in units:
+            unit.client.close()
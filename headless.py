@@ -0,0 +1,307 @@
+# -*- coding: utf8 -*-
+
+# Stub tkinter, ttk, ImageTk and RPi.GPIO so the GUI scripts can run headless
+# on plain Linux, for benchmarks and the simulator.
+#
+#     import headless
+#     headless.install()
+#     runpy.run_path('progressbar_added.py', run_name='__main__')
+#
+# Widgets only remember their options. Tk.after() callbacks run from a fake
+# event loop: mainloop() runs everything that is due and returns, or keeps
+# running in real time for headless.mainloop_seconds seconds.
+
+import heapq
+import itertools
+import sys
+import time
+import types
+
+# How long mainloop() keeps running callbacks, 0 returns after the first frame
+mainloop_seconds = 0
+
+# Function checked by mainloop(), which returns early once it returns True
+until = None
+
+# The most recently created Tk root
+root = None
+
+# Class standing in for every Tk and ttk widget
+class Widget:
+    def __init__(self, master=None, **options):
+        self.master = master
+        self.options = dict(options)
+        self.children = []
+        self.bindings = {}
+        self.destroyed = False
+        if master is not None:
+            master.children.append(self)
+
+    def grid(self, **options):
+        self.options['grid'] = options
+
+    def pack(self, **options):
+        self.options['pack'] = options
+
+    def place(self, **options):
+        self.options['place'] = options
+
+    def place_forget(self):
+        self.options.pop('place', None)
+
+    def lift(self, above=None):
+        pass
+
+    def grid_remove(self):
+        self.options.pop('grid', None)
+
+    def grid_forget(self):
+        self.options.pop('grid', None)
+
+    def pack_forget(self):
+        self.options.pop('pack', None)
+
+    def config(self, **options):
+        self.options.update(options)
+
+    configure = config
+
+    def cget(self, key):
+        return self.options.get(key)
+
+    def __setitem__(self, key, value):
+        self.options[key] = value
+
+    def __getitem__(self, key):
+        return self.options.get(key)
+
+    def bind(self, sequence, func, add=None):
+        self.bindings.setdefault(sequence, []).append(func)
+
+    # Function to deliver a fake event to the handlers bound to sequence
+    def event_generate(self, sequence, **fields):
+        fields.setdefault('time', int(time.monotonic() * 1000))
+        event = types.SimpleNamespace(widget=self, **fields)
+        for func in self.bindings.get(sequence, []):
+            func(event)
+
+    # Function to press a button: bound press/release handlers, then the command
+    def invoke(self):
+        self.event_generate('<ButtonPress-1>')
+        self.event_generate('<ButtonRelease-1>')
+        command = self.options.get('command')
+        if command is not None and self.options.get('state') != 'disabled':
+            return command()
+
+    def destroy(self):
+        self.destroyed = True
+        if self.master is not None and self in self.master.children:
+            self.master.children.remove(self)
+
+    def winfo_children(self):
+        return list(self.children)
+
+    def title(self, text=None):
+        self.options['title'] = text
+
+    def after(self, ms, func=None, *args):
+        return root.after(ms, func, *args)
+
+    def after_idle(self, func, *args):
+        return root.after_idle(func, *args)
+
+    def after_cancel(self, after_id):
+        root.after_cancel(after_id)
+
+    def update_idletasks(self):
+        pass
+
+    def update(self):
+        root.run_due()
+
+    # Entry, Combobox and Progressbar values, kept in the textvariable when there is one
+    def get(self):
+        variable = self.options.get('textvariable')
+        return variable.get() if variable is not None else self.options.get('value', '')
+
+    def set(self, value):
+        variable = self.options.get('textvariable')
+        if variable is not None:
+            variable.set(value)
+        else:
+            self.options['value'] = value
+
+    def insert(self, index, text):
+        self.set(str(self.get()) + str(text))
+
+    def delete(self, first, last=None):
+        self.set('')
+
+    def current(self, index=None):
+        values = self.options.get('values', [])
+        if index is None:
+            return values.index(self.get()) if self.get() in values else -1
+        self.set(values[index])
+
+# Class standing in for ttk.Treeview, rows are kept as a list of values
+class Treeview(Widget):
+    def __init__(self, master=None, **options):
+        super().__init__(master, **options)
+        self.rows = {}
+
+    def heading(self, column, **options):
+        pass
+
+    def column(self, column, **options):
+        pass
+
+    def insert(self, parent, index, iid=None, **options):
+        iid = iid or f"I{len(self.rows) + 1:03}"
+        self.rows[iid] = options.get('values', [])
+        return iid
+
+    def get_children(self, item=None):
+        return tuple(self.rows)
+
+    def item(self, iid, **options):
+        return {'values': self.rows[iid]}
+
+    def delete(self, *items):
+        for iid in items:
+            self.rows.pop(iid, None)
+
+# Class standing in for tk.Tk, with a fake event loop
+class Tk(Widget):
+    def __init__(self, *args, **options):
+        global root
+        super().__init__(None, **options)
+        root = self
+        self.timers = []  # Heap of (due, seq, after id, func, args)
+        self.cancelled = set()
+        self.seq = itertools.count()
+        self.quit_requested = False
+
+    def attributes(self, *args):
+        pass
+
+    def geometry(self, spec=None):
+        self.options['geometry'] = spec
+
+    def grid_rowconfigure(self, index, **options):
+        pass
+
+    def grid_columnconfigure(self, index, **options):
+        pass
+
+    def protocol(self, name, func=None):
+        self.options[name] = func
+
+    def after(self, ms, func=None, *args):
+        if func is None:
+            time.sleep(ms / 1000)
+            return None
+        after_id = f"after#{next(self.seq)}"
+        heapq.heappush(self.timers, (time.monotonic() + ms / 1000, next(self.seq), after_id, func, args))
+        return after_id
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, after_id):
+        self.cancelled.add(after_id)
+
+    # Function to run every callback that is due now, returning how many ran
+    def run_due(self):
+        ran = 0
+        now = time.monotonic()
+        while self.timers and self.timers[0][0] <= now:
+            _, _, after_id, func, args = heapq.heappop(self.timers)
+            if after_id in self.cancelled:
+                self.cancelled.discard(after_id)
+                continue
+            func(*args)
+            ran += 1
+        return ran
+
+    def mainloop(self, n=0):
+        self.quit_requested = False
+        self.run_due()
+        deadline = time.monotonic() + mainloop_seconds
+        while not self.quit_requested and time.monotonic() < deadline and not (until is not None and until()):
+            next_due = self.timers[0][0] if self.timers else deadline
+            time.sleep(max(0, min(next_due, deadline) - time.monotonic()))
+            self.run_due()
+
+    def quit(self):
+        self.quit_requested = True
+
+    def destroy(self):
+        super().destroy()
+        self.quit_requested = True
+
+# Class standing in for tk.StringVar and friends
+class Variable:
+    def __init__(self, master=None, value=None, name=None):
+        self.value = value
+        self.callbacks = []
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+        for callback in self.callbacks:
+            callback(None, None, 'write')
+
+    def trace_add(self, mode, callback):
+        self.callbacks.append(callback)
+
+# Class standing in for ImageTk.PhotoImage, it keeps the size and an empty block as big as
+# the RGBA pixels Tk would hold, so memory measurements see the images
+class PhotoImage:
+    def __init__(self, image=None, size=None, **options):
+        self.size = image.size if image is not None else size
+        self.block = bytearray(self.size[0] * self.size[1] * 4) if self.size else None
+
+    def width(self):
+        return self.size[0] if self.size else 0
+
+    def height(self):
+        return self.size[1] if self.size else 0
+
+# Function to build a module object with the given attributes
+def make_module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+# Function to put the stub modules in sys.modules
+def install():
+    widgets = {name: type(name, (Widget,), {}) for name in
+               ('Frame', 'Label', 'Button', 'Entry', 'Canvas', 'Toplevel', 'Scale', 'Spinbox', 'Listbox', 'Scrollbar')}
+    constants = dict(NORMAL='normal', DISABLED='disabled', ACTIVE='active', HIDDEN='hidden', TOP='top', BOTTOM='bottom',
+                     LEFT='left', RIGHT='right', BOTH='both', X='x', Y='y', END='end', N='n', S='s', E='e', W='w',
+                     CENTER='center', HORIZONTAL='horizontal', VERTICAL='vertical')
+
+    ttk = make_module('tkinter.ttk', Separator=type('Separator', (Widget,), {}), Combobox=type('Combobox', (Widget,), {}),
+                      Progressbar=type('Progressbar', (Widget,), {}), Style=type('Style', (Widget,), {}),
+                      Notebook=type('Notebook', (Widget,), {}), Treeview=Treeview, **widgets)
+    tkinter = make_module('tkinter', Tk=Tk, Widget=Widget, ttk=ttk, PhotoImage=PhotoImage, StringVar=Variable,
+                          IntVar=Variable, DoubleVar=Variable, BooleanVar=Variable, Variable=Variable,
+                          **widgets, **constants)
+    sys.modules['tkinter'] = tkinter
+    sys.modules['tkinter.ttk'] = ttk
+
+    # GPIO goes to the simulated backend
+    import sim_gpio
+    sys.modules['RPi'] = make_module('RPi', GPIO=sim_gpio)
+    sys.modules['RPi.GPIO'] = sim_gpio
+
+    # ImageTk needs a real Tk, keep the real PIL for decoding and stub only ImageTk
+    image_tk = make_module('PIL.ImageTk', PhotoImage=PhotoImage)
+    sys.modules['PIL.ImageTk'] = image_tk
+    try:
+        import PIL
+        PIL.ImageTk = image_tk
+    except ImportError:
+        pass
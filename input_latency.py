@@ -0,0 +1,155 @@
+# -*- coding: utf8 -*-
+
+# Tap to feedback latency of the touch screen.
+#
+# A watched button has its <ButtonRelease-1> event timestamped with the time
+# the X server gave it (Tk runs a button's command on release), its command
+# timed, and the next frame marked by an idle callback queued once the
+# command returns: Tk redraws the widgets the command changed in idle time,
+# before it. The event time is in X server milliseconds, mapped onto the
+# monotonic clock with the smallest offset seen between the two, i.e. the
+# event delivered soonest. An event that waited in the queue behind slow
+# work on the Tk thread then counts that wait. Every interaction ('select',
+# 'order', ...) gets a histogram of
+#
+#   input_to_handler  release to the command starting, queueing included
+#   handler           time spent in the command
+#   input_to_frame    release to the next frame
+#
+# FrameMonitor is a debug mode (CBR_FRAME_DEBUG=1 in the GUI). It times every
+# callback the Tk thread runs from after() and after_idle(), plus a heartbeat
+# that catches any other work holding up the loop, and flags whatever takes
+# longer than one frame on stdout and in a red label over the window.
+
+import collections
+import time
+import tkinter as tk
+
+import latency
+
+# Latencies tracked for every interaction
+stages = ('input_to_handler', 'handler', 'input_to_frame')
+
+# Class timing the watched buttons from release to the next frame
+class InputLatencies:
+    def __init__(self, root, on_record=None):
+        self.root = root
+        self.on_record = on_record  # Called with (interaction, stage, seconds) for every latency, e.g. for metrics
+        self.histograms = latency.OrderLatencies(stages, key='interaction')
+        self.inputs = {}  # Interaction -> monotonic time of the release its command has not run for yet
+        self.offset = None  # Smallest monotonic time minus X server event time seen, in seconds
+        self.monitor = None  # FrameMonitor flagging slow commands, in debug mode
+
+    # Function to record one latency
+    def record(self, interaction, stage, seconds):
+        self.histograms.record(interaction, stage, seconds)
+        if self.on_record is not None:
+            self.on_record(interaction, stage, seconds)
+
+    # Function to run command when the button is pressed, timing it as the given interaction
+    def watch(self, widget, interaction, command):
+        widget.bind('<ButtonRelease-1>', lambda event: self.released(interaction, event), add='+')
+        widget.config(command=self.track(interaction, command))
+
+    # Function to turn the X server time of an event into monotonic time, now when the event has none
+    def event_time(self, event, now):
+        server_time = getattr(event, 'time', None)
+        if not isinstance(server_time, int) or server_time <= 0:
+            return now
+        offset = now - server_time / 1000
+        # The server time wraps every 49 days, which makes the offset jump: start over then
+        if self.offset is None or offset < self.offset or offset - self.offset > 3600:
+            self.offset = offset
+        return server_time / 1000 + self.offset
+
+    # Function to timestamp a release. The button's command runs right after it in the same event,
+    # a release that does not run it (dragged off the button, disabled) is dropped once Tk is idle.
+    def released(self, interaction, event):
+        self.inputs[interaction] = self.event_time(event, time.monotonic())
+        self.root.after_idle(self.inputs.pop, interaction, None)
+
+    # Function to wrap a command so it is timed as the given interaction
+    def track(self, interaction, command):
+        def run(*args):
+            tapped = self.inputs.pop(interaction, None)
+            started = time.monotonic()
+            try:
+                return command(*args)
+            finally:
+                took = time.monotonic() - started
+                self.record(interaction, 'handler', took)
+                if self.monitor is not None:
+                    self.monitor.check(f"{interaction} handler", took)
+                if tapped is not None:
+                    self.record(interaction, 'input_to_handler', started - tapped)
+                    self.root.after_idle(self.frame_drawn, interaction, tapped)
+        return run
+
+    # Function called once Tk has drawn the frame after a command
+    def frame_drawn(self, interaction, tapped):
+        self.record(interaction, 'input_to_frame', time.monotonic() - tapped)
+
+    # Function to summarize every interaction and stage
+    def report(self):
+        return self.histograms.report()
+
+    # Function to write the report as JSON, or as CSV when the path ends in .csv
+    def export(self, path):
+        self.histograms.export(path)
+
+# Class flagging work on the Tk thread that takes longer than a frame
+class FrameMonitor:
+    def __init__(self, root, fps=60, heartbeat_ms=100, show_seconds=3):
+        self.root = root
+        self.frame = 1 / fps
+        self.heartbeat_ms = heartbeat_ms
+        self.show_ms = int(show_seconds * 1000)
+        self.slow = collections.Counter()  # Name -> times it took longer than a frame
+        self.flagged_at = 0.0
+        self.hide_id = None
+        self.label = tk.Label(root, fg="white", bg="red")
+
+        # Time every callback scheduled on the root from now on
+        self.after = root.after
+        self.after_idle = root.after_idle
+        root.after = lambda ms, func=None, *args: self.after(ms, self.timed(func), *args) if func is not None else self.after(ms)
+        root.after_idle = lambda func, *args: self.after_idle(self.timed(func), *args)
+        self.after(self.heartbeat_ms, self.heartbeat, time.perf_counter() + self.heartbeat_ms / 1000)
+
+    # Function to wrap a Tk callback so it is timed
+    def timed(self, func):
+        def run(*args):
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                self.check(getattr(func, '__name__', repr(func)), time.perf_counter() - started)
+        return run
+
+    # Function to flag work that took longer than a frame
+    def check(self, name, seconds):
+        if seconds <= self.frame:
+            return
+        self.slow[name] += 1
+        self.flagged_at = time.perf_counter()
+        text = f"{name} took {seconds * 1000:.0f} ms (frame {self.frame * 1000:.1f} ms)"
+        print(f"Slow on the Tk thread: {text}")
+        self.label.config(text=text)
+        self.label.place(relx=1.0, rely=0.0, anchor="ne")
+        self.label.lift()
+        if self.hide_id is not None:
+            self.root.after_cancel(self.hide_id)
+        self.hide_id = self.after(self.show_ms, self.hide)
+
+    # Function to take the overlay off the window
+    def hide(self):
+        self.hide_id = None
+        self.label.place_forget()
+
+    # Function run every heartbeat_ms, a late run means something held up the Tk loop. Work already
+    # flagged by name since the last heartbeat is not flagged again.
+    def heartbeat(self, due):
+        now = time.perf_counter()
+        if now - due > self.frame and self.flagged_at < due - self.heartbeat_ms / 1000:
+            self.check("Tk loop", now - due)
+        self.after(self.heartbeat_ms, self.heartbeat, now + self.heartbeat_ms / 1000)
@@ -0,0 +1,100 @@
+# -*- coding: utf8 -*-
+
+# Bottle inventory behind each pump motor.
+#
+# The pump controller decrements the level of a motor after every pour using
+# the calibrated volume actually dispensed. Levels are saved to a JSON file
+# while the pumps are idle, and a consumption-rate forecast warns before a
+# bottle runs dry at the current order rate.
+
+import collections
+import json
+import os
+import time
+
+# Class tracking the liquid left behind every motor
+class Inventory:
+    def __init__(self, path, window=3600, warn_seconds=1800):
+        self.path = path
+        self.window = window  # Seconds of consumption used for the forecast
+        self.warn_seconds = warn_seconds  # Warn when a bottle runs out sooner than this
+        self.bottles = {}  # Motor number -> {'ingredient', 'capacity', 'remaining'}
+        self.refills = []  # Last refill events
+        self.usage = collections.defaultdict(collections.deque)  # Motor -> (monotonic time, mL) pours in the window
+        self.dirty = False
+        self.load()
+
+    # Function to load the saved levels, if any
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path) as file:
+            data = json.load(file)
+        self.bottles = {int(motor): bottle for motor, bottle in data.get('motors', {}).items()}
+        self.refills = data.get('refills', [])
+
+    # Function to write the levels atomically
+    def save(self):
+        if not self.path:
+            return
+        data = {'motors': {str(motor): bottle for motor, bottle in sorted(self.bottles.items())}, 'refills': self.refills[-100:]}
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(data, file, indent=2)
+        os.replace(temp_path, self.path)
+        self.dirty = False
+
+    # Function to take a dispensed volume off a bottle, called after every pour
+    def dispense(self, motor, volume, now):
+        bottle = self.bottles.get(motor)
+        if bottle is None:
+            return
+        bottle['remaining'] = max(0.0, bottle['remaining'] - volume)
+        usage = self.usage[motor]
+        usage.append((now, volume))
+        while usage[0][0] < now - self.window:
+            usage.popleft()
+        self.dirty = True
+
+    # Function to record a refill, to full capacity unless a volume is given
+    def refill(self, motor, volume=None, ingredient=None, capacity=None):
+        bottle = self.bottles.setdefault(motor, {'ingredient': None, 'capacity': 750.0, 'remaining': 0.0})
+        if ingredient is not None:
+            bottle['ingredient'] = ingredient
+        if capacity is not None:
+            bottle['capacity'] = float(capacity)
+        bottle['remaining'] = float(bottle['capacity'] if volume is None else volume)
+        self.refills.append({'motor': motor, 'volume': bottle['remaining'], 'time': time.time()})
+        self.dirty = True
+
+    # Function to check that a bottle holds at least volume, untracked bottles always do
+    def has(self, motor, volume):
+        bottle = self.bottles.get(motor)
+        return bottle is None or bottle['remaining'] >= volume
+
+    # Function to estimate the mL per second drawn from a motor over the window
+    def rate(self, motor, now):
+        usage = self.usage.get(motor)
+        if not usage:
+            return 0.0
+        span = max(60.0, min(self.window, now - usage[0][0]))
+        return sum(volume for t, volume in usage if t >= now - self.window) / span
+
+    # Function to list the bottles that will run out soon at the current rate
+    def forecast(self, now):
+        warnings = []
+        for motor, bottle in sorted(self.bottles.items()):
+            rate = self.rate(motor, now)
+            seconds_left = bottle['remaining'] / rate if rate > 0 else None
+            if bottle['remaining'] <= 0 or (seconds_left is not None and seconds_left < self.warn_seconds):
+                warnings.append({'motor': motor, 'ingredient': bottle['ingredient'], 'remaining': bottle['remaining'],
+                                 'seconds_left': seconds_left})
+        return warnings
+
+    # Function to report every bottle with its forecast
+    def snapshot(self, now):
+        levels = []
+        for motor, bottle in sorted(self.bottles.items()):
+            rate = self.rate(motor, now)
+            levels.append(dict(bottle, motor=motor, rate=rate, seconds_left=bottle['remaining'] / rate if rate > 0 else None))
+        return levels
@@ -0,0 +1,199 @@
+# -*- coding: utf8 -*-
+
+# Crash-safe journal of orders and pours for the pump controller.
+#
+# Every queued job, relay switch and job end is appended as one JSON line. The
+# timing loop only puts the line on a deque, a background thread writes and
+# fsyncs whatever is waiting every interval (group commit), so the SD card never
+# delays a relay. While a pump runs the thread also writes a "tick" with the
+# current monotonic time, a lower bound on how long a relay that was on when
+# the power went out actually ran.
+#
+# On start the controller replays the journal: jobs that were queued or half
+# poured are held with the volume each motor still has to pour, until a
+# client resumes or discards them. Up to one interval of pouring can go
+# unrecorded, so a resumed drink may get at most interval x flow rate extra.
+#
+# The same class writes the order log, which is rotated by size instead.
+#
+# Run "python3 journal.py orders.journal" to print what would be recovered.
+
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+# Class appending records to the journal file from a background thread,
+# rotated once it would grow past max_bytes if given
+class OrderJournal:
+    def __init__(self, path, interval=0.2, max_bytes=None, backups=5):
+        self.path = path
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.pending = collections.deque()  # Encoded lines waiting for the next group commit
+        self.ticking = False  # Set by the controller while a relay is on
+        self.lock = threading.Lock()  # Held while the file is written or replaced
+        self.file = None
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    # Function to open the journal for appending and start the writer thread
+    def start(self):
+        if self.file is None:
+            self.file = open(self.path, 'ab')
+        self.append({'r': 'boot', 'time': time.time()})
+        self.thread.start()
+
+    # Function to queue one record, called from the timing loop
+    def append(self, record):
+        self.pending.append(json.dumps(record, separators=(',', ':')) + '\n')
+
+    # Function to commit periodically until stopped
+    def run(self):
+        while self.running:
+            time.sleep(self.interval)
+            if self.ticking:
+                self.append({'r': 'tick', 't': time.monotonic()})
+            self.flush()
+
+    # Function to write and fsync every queued record
+    def flush(self):
+        with self.lock:
+            lines = []
+            while self.pending:
+                lines.append(self.pending.popleft())
+            if not lines or self.file is None:
+                return
+            data = ''.join(lines).encode()
+            if self.max_bytes is not None and 0 < self.file.tell() and self.file.tell() + len(data) > self.max_bytes:
+                self.rotate()
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    # Function to move the file to path.1 and older ones up, keeping backups of them, and start a new one
+    def rotate(self):
+        self.file.close()
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{n}"):
+                os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+        os.replace(self.path, f"{self.path}.1")
+        self.file = open(self.path, 'ab')
+
+    # Function to size the journal, for deciding when to compact it
+    def size(self):
+        with self.lock:
+            return self.file.tell() if self.file is not None else 0
+
+    # Function to replace the journal with just the given records, when nothing is pouring.
+    # The new file is fsynced before it atomically takes the place of the old one.
+    def checkpoint(self, records):
+        with self.lock:
+            self.pending.clear()
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'wb') as file:
+                file.write(''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records).encode())
+                file.flush()
+                os.fsync(file.fileno())
+            if self.file is not None:
+                self.file.close()
+            os.replace(temp_path, self.path)
+            directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+            self.file = open(self.path, 'ab')
+
+    # Function to stop the thread and commit what is left
+    def stop(self):
+        self.running = False
+        self.ticking = False
+        self.flush()
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+# Function to read the records of a journal, ignoring a line torn by a power cut
+def read_records(path):
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                return
+
+# Function to replay a journal and return the jobs left unfinished. Each job has its
+# orders, label, glasses, the pours it needs in total as {motor: mL}, the seconds
+# every motor already ran, the mL of those runs that went into filling drained lines
+# as {motor: mL}, and whether any pump had started on it.
+def replay(path):
+    jobs = {}
+    running = {}  # (job id, motor) -> (monotonic on time, requested seconds)
+    last_seen = None  # Latest monotonic time known to have passed in this boot
+
+    # Function to count the relays left on when a boot ended, up to the last time seen
+    def close_running():
+        for (job_id, motor), (on_time, seconds) in running.items():
+            if job_id in jobs and last_seen is not None:
+                ran = jobs[job_id]['ran']
+                ran[motor] = ran.get(motor, 0.0) + min(seconds, max(0.0, last_seen - on_time))
+        running.clear()
+
+    for record in read_records(path):
+        kind = record['r']
+        if kind == 'boot':
+            close_running()
+            last_seen = None
+        elif kind == 'queued':
+            jobs[record['job']] = {'job': record['job'], 'orders': record['orders'], 'label': record.get('label'),
+                                   'glasses': record['glasses'], 'per_glass': record['pours'], 'ran': {}, 'primed': {},
+                                   'started': record.get('started', False), 'scaled': record.get('scaled', False)}
+        elif kind == 'start':
+            job = jobs.get(record['job'])
+            if job is None:
+                continue
+            for other in record.get('merged', []):
+                merged = jobs.pop(other, None)
+                if merged is not None:
+                    job['orders'] += merged['orders']
+                    job['glasses'] += merged['glasses']
+            job['started'] = True
+            job['primed'] = {prime['motor']: prime['volume'] for prime in record.get('primed', [])}
+        elif kind == 'on':
+            running[(record['job'], record['motor'])] = (record['t'], record['s'])
+            last_seen = record['t'] if last_seen is None else max(last_seen, record['t'])
+        elif kind == 'off':
+            on_time, _ = running.pop((record['job'], record['motor']), (None, None))
+            if on_time is not None and record['job'] in jobs:
+                ran = jobs[record['job']]['ran']
+                ran[record['motor']] = ran.get(record['motor'], 0.0) + record['t'] - on_time
+            last_seen = record['t'] if last_seen is None else max(last_seen, record['t'])
+        elif kind == 'tick':
+            last_seen = record['t'] if last_seen is None else max(last_seen, record['t'])
+        elif kind in ('done', 'discard'):
+            jobs.pop(record['job'], None)
+        elif kind == 'cancel':
+            for job_id in record['jobs']:
+                jobs.pop(job_id, None)
+    close_running()
+
+    for job in jobs.values():
+        volumes = collections.defaultdict(float)
+        for pour in job.pop('per_glass'):
+            volumes[pour['motor']] += pour['volume'] * (1 if job['scaled'] else job['glasses'])
+        job['volumes'] = dict(volumes)
+        del job['scaled']
+    return list(jobs.values())
+
+if __name__ == '__main__':
+    for job in replay(sys.argv[1] if len(sys.argv) > 1 else 'orders.journal'):
+        state = "partly poured" if job['started'] else "queued"
+        ran = ", ".join(f"Motor {motor} ran {seconds:.2f} s" for motor, seconds in sorted(job['ran'].items()))
+        print(f"Job {job['job']} {job['label']} x{job['glasses']} ({', '.join(job['orders'])}): {state}. {ran}")
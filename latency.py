@@ -0,0 +1,108 @@
+# -*- coding: utf8 -*-
+
+# Fixed-memory latency histograms with HDR-style log-linear buckets.
+#
+# Values are recorded in microseconds. Every power of two is split into
+# sub-buckets so each bucket is within about 1.6% of the value it holds, and
+# the counts array never grows: recording is an index computation and an add.
+
+import array
+import csv
+import json
+
+# Class counting latencies into log-linear buckets
+class LatencyHistogram:
+    def __init__(self, max_seconds=3600, sub_bucket_bits=7):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.half_count = self.sub_bucket_count // 2
+        self.max_value = int(max_seconds * 1e6)
+        self.counts = array.array('q', bytes(8 * (self.index_of(self.max_value) + 1)))
+        self.total = 0
+        self.min_value = None
+        self.max_seen = 0
+        self.sum = 0
+
+    # Function to find the bucket of a value in microseconds
+    def index_of(self, value):
+        bucket = max(0, value.bit_length() - self.sub_bucket_bits)
+        return bucket * self.half_count + (value >> bucket)
+
+    # Function to find the highest value, in microseconds, held by a bucket
+    def highest_value_at(self, index):
+        if index < self.sub_bucket_count:
+            return index
+        bucket = (index - self.sub_bucket_count) // self.half_count + 1
+        sub = (index - self.sub_bucket_count) % self.half_count + self.half_count
+        return ((sub + 1) << bucket) - 1
+
+    # Function to record one latency given in seconds
+    def record(self, seconds):
+        value = min(max(int(seconds * 1e6), 0), self.max_value)
+        self.counts[self.index_of(value)] += 1
+        self.total += 1
+        self.sum += value
+        if self.min_value is None or value < self.min_value:
+            self.min_value = value
+        if value > self.max_seen:
+            self.max_seen = value
+
+    # Function to return the latency in seconds below which p percent of the values fall
+    def percentile(self, p):
+        if self.total == 0:
+            return None
+        wanted = max(1, -(-self.total * p // 100))  # Rank of the value, rounded up
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(self.highest_value_at(index), self.max_seen) / 1e6
+        return self.max_seen / 1e6
+
+    # Function to summarize the histogram in seconds
+    def summary(self, percentiles=(50, 90, 95, 99, 99.9)):
+        result = {'count': self.total}
+        if self.total:
+            result['min'] = self.min_value / 1e6
+            result['mean'] = self.sum / self.total / 1e6
+            result['max'] = self.max_seen / 1e6
+            for p in percentiles:
+                result[f"p{p:g}"] = self.percentile(p)
+        return result
+
+# Latencies tracked for every cocktail
+stages = ('queue_wait', 'tap_to_first_relay', 'first_relay_to_ready')
+
+# Class holding one histogram per stage for every cocktail, or for anything named by key
+class OrderLatencies:
+    def __init__(self, stages=stages, key='cocktail'):
+        self.stages = stages
+        self.key = key
+        self.histograms = {}  # Cocktail -> {stage: LatencyHistogram}
+
+    # Function to record one stage of an order
+    def record(self, cocktail, stage, seconds):
+        histograms = self.histograms.get(cocktail)
+        if histograms is None:
+            histograms = self.histograms[cocktail] = {name: LatencyHistogram() for name in self.stages}
+        histograms[stage].record(seconds)
+
+    # Function to summarize every cocktail and stage
+    def report(self):
+        return {cocktail: {stage: histogram.summary() for stage, histogram in histograms.items()}
+                for cocktail, histograms in sorted(self.histograms.items())}
+
+    # Function to write the report as JSON, or as CSV when the path ends in .csv
+    def export(self, path):
+        report = self.report()
+        if not path.endswith('.csv'):
+            with open(path, 'w') as file:
+                json.dump(report, file, indent=2)
+            return
+        columns = ['count', 'min', 'mean', 'p50', 'p90', 'p95', 'p99', 'p99.9', 'max']
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow([self.key, 'stage'] + columns)
+            for cocktail, summaries in report.items():
+                for stage, summary in summaries.items():
+                    writer.writerow([cocktail, stage] + [summary.get(column, '') for column in columns])
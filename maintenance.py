@@ -0,0 +1,102 @@
+# -*- coding: utf8 -*-
+
+# Line cleaning and flushing run by the pump controller while it is idle.
+#
+# A program queues a run time per motor. Runs only start once the pumps have
+# had nothing to pour for idle_delay seconds, and an order arriving switches
+# them off at once: what is left goes back to the front of the queue and
+# carries on in the next idle gap, so maintenance never delays a drink.
+#
+#   clean  the line draws from a water bottle: the pour is not taken off the
+#          inventory and orders needing the motor are refused until it is done
+#   flush  the line draws from its own bottle (priming after a refill, pushing
+#          out stale liquid): the pour is taken off the inventory
+#   prime  a flush just long enough to fill a drained line, queued by the
+#          controller ahead of expected orders (see priming.py)
+#
+# The relays themselves are switched by the controller, this class only
+# decides what runs when.
+
+import collections
+
+# Programs a client can ask for, and whether the line holds water while it runs
+programs = {'clean': True, 'flush': False, 'prime': False}
+
+# Class keeping the queue of maintenance runs and the runs switched on
+class MaintenanceScheduler:
+    def __init__(self, idle_delay=2.0):
+        self.idle_delay = idle_delay  # Seconds the pumps must have been idle before a run starts
+        self.pending = collections.OrderedDict()  # Motor -> [program, seconds left]
+        self.running = {}  # Motor -> (on time, off deadline, program)
+        self.idle_since = None  # Monotonic time the pumps last became idle, None while an order runs
+
+    # Function to queue a program on a motor, adding to any time it already has queued
+    def add(self, motor, program, seconds):
+        task = self.pending.setdefault(motor, [program, 0.0])
+        task[0] = program
+        task[1] += seconds
+
+    # Function to tell whether orders must keep off a motor because its line holds water
+    def blocked(self, motor):
+        task = self.pending.get(motor)
+        running = self.running.get(motor)
+        return (task is not None and programs[task[0]]) or (running is not None and programs[running[2]])
+
+    # Function to record whether the pumps are idle, called every loop iteration
+    def set_idle(self, idle, now):
+        if not idle:
+            self.idle_since = None
+        elif self.idle_since is None:
+            self.idle_since = now
+
+    # Function to list the motors whose run should start now, as (motor, program, seconds left).
+    # room(motor, seconds) gives how long the pump may run now, 0 when it has to cool first.
+    def due(self, now, room, cap=None):
+        if self.idle_since is None or now - self.idle_since < self.idle_delay:
+            return []
+        started = []
+        for motor, (program, left) in list(self.pending.items()):
+            if motor in self.running:
+                continue
+            if cap is not None and len(self.running) >= cap:
+                break
+            seconds = min(left, room(motor, left))
+            if seconds <= 0:
+                continue
+            self.running[motor] = (now, now + seconds, program)
+            started.append((motor, program, seconds))
+        return started
+
+    # Function to give the next time a run has to be switched off, None when nothing runs
+    def deadline(self):
+        return min((deadline for _, deadline, _ in self.running.values()), default=None)
+
+    # Function to end runs, the ones past their deadline or all of them when preempted.
+    # Returns (motor, program, seconds ran, seconds still queued) for every run ended.
+    def stop(self, now, expired_only=True):
+        stopped = []
+        for motor, (on_time, deadline, program) in list(self.running.items()):
+            if expired_only and deadline > now:
+                continue
+            del self.running[motor]
+            ran = min(now, deadline) - on_time
+            task = self.pending[motor]
+            task[1] -= ran
+            if task[1] <= 1e-3:
+                del self.pending[motor]
+                stopped.append((motor, program, ran, 0.0))
+            else:
+                self.pending.move_to_end(motor, last=False)
+                stopped.append((motor, program, ran, task[1]))
+        return stopped
+
+    # Function to drop queued programs, for some motors or all of them, only program when given
+    def cancel(self, motors=None, program=None):
+        for motor in list(self.pending):
+            if (motors is None or motor in motors) and motor not in self.running and program in (None, self.pending[motor][0]):
+                del self.pending[motor]
+
+    # Function to describe the queue for clients
+    def snapshot(self):
+        return [{'motor': motor, 'program': program, 'seconds': left, 'running': motor in self.running}
+                for motor, (program, left) in self.pending.items()]
@@ -0,0 +1,166 @@
+# -*- coding: utf8 -*-
+
+# Recipe helpers shared by the GUI and the ordering API, so both turn a
+# cocktail into exactly the same pours for the pump controller.
+#
+# Recipes give every ingredient a motor. With a bottle map ({motor: ingredient},
+# bottles.json) they are poured by ingredient name instead, and an ingredient
+# loaded on several motors is split over all of them.
+
+import collections
+import json
+import os
+import sys
+import time
+
+# Function to load recipes from JSON
+def load_recipes(path):
+    with open(path) as file:
+        return json.load(file)
+
+# Class for the compact recipe records below, read like the dicts they replace
+class Record:
+    __slots__ = ()
+    fields = ()  # Keys read from the slots
+
+    def __getitem__(self, key):
+        value = getattr(self, key) if key in self.fields else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def keys(self):
+        return [key for key in self.fields if key in self]
+
+# Class holding one ingredient of a compact recipe, shared by every recipe pouring the same
+class Ingredient(Record):
+    __slots__ = ('name', 'motor', 'quantity')
+    fields = __slots__
+
+    def __init__(self, name, motor, quantity):
+        self.name = name
+        self.motor = motor
+        self.quantity = quantity
+
+# Class holding a compact recipe, keys other than these three are kept in extra
+class Recipe(Record):
+    __slots__ = ('ingredients', 'imgpath', 'image_url', 'extra')
+    fields = ('ingredients', 'imgpath', 'image_url')
+
+    def __init__(self, ingredients, imgpath, image_url, extra=None):
+        self.ingredients = ingredients
+        self.imgpath = imgpath
+        self.image_url = image_url
+        self.extra = extra
+
+    def __getitem__(self, key):
+        if key not in self.fields and self.extra is not None and key in self.extra:
+            return self.extra[key]
+        return super().__getitem__(key)
+
+    def keys(self):
+        return super().keys() + list(self.extra or ())
+
+# Function to turn loaded recipes into slot records for low memory. The names and image paths are
+# interned and identical ingredients are one shared record, so a big menu holds few strings and dicts.
+def compact_recipes(recipes):
+    ingredients = {}
+    compact = {}
+    for name, recipe in recipes.items():
+        parts = []
+        for ingredient in recipe['ingredients']:
+            key = (ingredient['name'], ingredient.get('motor'), ingredient['quantity'])
+            if key not in ingredients:
+                ingredients[key] = Ingredient(sys.intern(key[0]), key[1], key[2])
+            parts.append(ingredients[key])
+        imgpath, image_url = (sys.intern(path) if path else path for path in (recipe.get('imgpath'), recipe.get('image_url')))
+        extra = {key: value for key, value in recipe.items() if key not in Recipe.fields}
+        compact[sys.intern(name)] = Recipe(tuple(parts), imgpath, image_url, extra or None)
+    return compact
+
+# Function to weigh how much each cocktail was ordered lately, from the end of the controller's
+# order log. An order counts half as much for every half_life_days of age. Only the last
+# max_bytes of the log are read so a long history does not slow down startup.
+def popularity(path, half_life_days=7.0, max_bytes=256 * 1024):
+    counts = collections.Counter()
+    if not os.path.exists(path):
+        return counts
+    with open(path, 'rb') as file:
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+        file.seek(max(0, size - max_bytes))
+        lines = file.read().splitlines()
+    if size > max_bytes:
+        lines = lines[1:]  # Started mid-line
+    now = time.time()
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get('r') == 'order' and record.get('label'):
+            counts[record['label']] += record.get('glasses', 1) * 0.5 ** ((now - record['t']) / (half_life_days * 86400))
+    return counts
+
+# Function to turn a recipe into the (motor, volume) pours sent to the controller
+def recipe_pours(recipe):
+    return [(ingredient['motor'], ingredient['quantity']) for ingredient in recipe['ingredients']]
+
+# Function to estimate the seconds a recipe takes, with every pump running at once
+# unless a dispense strategy from cbr/strategies.py is given. With a bottle map the
+# ingredients are split over their motors, None when one is not loaded.
+def recipe_eta(recipe, flow_rate, strategy=None, bottles=None):
+    flow_rates = collections.defaultdict(lambda: flow_rate)
+    pours = recipe_pours(recipe)
+    if bottles:
+        try:
+            pours = split_pours(recipe_ingredients(recipe), bottles, flow_rates)
+        except KeyError:
+            return None
+    if strategy is not None:
+        return strategy.eta(pours, flow_rates)
+    return max((volume / flow_rate for _, volume in pours), default=0)
+
+# Function to list a recipe as (ingredient name, volume), for units with their own motor layout
+def recipe_ingredients(recipe):
+    return [(ingredient['name'], ingredient['quantity']) for ingredient in recipe['ingredients']]
+
+# Function to load a bottle map, a JSON object of motor number to ingredient name
+def load_bottles(path):
+    with open(path) as file:
+        return {int(motor): ingredient for motor, ingredient in json.load(file).items()}
+
+# Function to turn a recipe into the pours sent to the controller, by ingredient name
+# when the controller has a bottle map
+def order_pours(recipe, bottles=None):
+    return recipe_ingredients(recipe) if bottles else recipe_pours(recipe)
+
+# Function to split (ingredient name, volume) pours over the motors of a bottle map.
+# Each ingredient is shared by every motor holding it in proportion to its flow rate,
+# so they all finish together. usable(motor, volume) can rule out a bottle too low for
+# its share. Raises KeyError with the ingredient name when no usable motor holds it.
+def split_pours(ingredients, bottles, flow_rates, usable=None):
+    pours = []
+    for name, volume in ingredients:
+        motors = sorted(motor for motor, held in bottles.items() if held == name)
+        shares = []
+        while motors:
+            total = sum(flow_rates[motor] for motor in motors)
+            shares = [(motor, volume * flow_rates[motor] / total) for motor in motors]
+            kept = [motor for motor, share in shares if usable is None or usable(motor, share)]
+            if len(kept) == len(motors):
+                break
+            motors = kept
+        if not motors:
+            raise KeyError(name)
+        pours += shares
+    return pours
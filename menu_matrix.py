@@ -0,0 +1,82 @@
+# -*- coding: utf8 -*-
+
+# Whole-menu ETAs and availability as NumPy array operations.
+#
+# The recipes are stored once as a dense recipe x line matrix of mL per
+# glass. A line is a motor, or with a bottle map an ingredient poured by
+# every motor holding it (split so they finish together, see
+# menu.split_pours). Calibrated flow rates, the pump cap, bottle levels,
+# glass size and the number of glasses then only change a vector or a
+# scalar, and every cocktail's ETA and "makeable" flag is recomputed in a
+# few array operations instead of a Python loop over each recipe's
+# ingredients.
+#
+# The ETA follows the dispense strategy: the longest line for concurrent and
+# finish_together, the sum of the lines for sequential. For capped it is
+# the lower bound of the plan (the longest line, or the pump seconds shared
+# over max_pumps), the controller's plan is within 4/3 of it.
+
+import numpy as np
+
+# Class holding the menu as a recipe x line volume matrix
+class MenuMatrix:
+    def __init__(self, recipes, flow_rates, strategy=None, bottles=None):
+        self.names = list(recipes)
+        self.rows = {name: row for row, name in enumerate(self.names)}
+        self.bottles = dict(bottles) if bottles else None
+        key = 'name' if self.bottles else 'motor'
+        self.lines = sorted({ingredient[key] for recipe in recipes.values() for ingredient in recipe['ingredients']})
+        columns = {line: column for column, line in enumerate(self.lines)}
+        self.volumes = np.zeros((len(self.names), len(self.lines)))
+        for row, recipe in enumerate(recipes.values()):
+            for ingredient in recipe['ingredients']:
+                self.volumes[row, columns[ingredient[key]]] += ingredient['quantity']
+        self.strategy = strategy
+        self.available = np.full(len(self.lines), np.inf)  # mL left behind every line, unknown bottles count as full
+        self.set_flow_rates(flow_rates)
+
+    # Function to set the mL/second of every motor, after a calibration or a new bottle map
+    def set_flow_rates(self, flow_rates, bottles=None):
+        if bottles is not None:
+            self.bottles = dict(bottles)
+        # Motors behind every line, one per motor line or every motor holding the ingredient
+        motors = [[motor for motor, held in self.bottles.items() if held == line] if self.bottles else [line] for line in self.lines]
+        self.line_motors = motors
+        self.flow = np.array([sum(flow_rates.get(motor, 0.0) for motor in line) for line in motors], dtype=float)
+        self.copies = np.array([len(line) for line in motors], dtype=float)
+
+    # Function to set the bottle levels from the controller's inventory event, {motor: mL left}
+    def set_levels(self, levels):
+        self.available = np.array([sum(levels.get(motor, np.inf) for motor in line) if line else 0.0 for line in self.line_motors])
+
+    # Function to compute the seconds every line runs for each recipe, inf where no motor holds it
+    def run_times(self, glasses=1, scale=1.0):
+        volumes = self.volumes * (glasses * scale)
+        times = np.divide(volumes, self.flow, out=np.full_like(volumes, np.inf), where=self.flow > 0)
+        times[volumes == 0] = 0.0
+        return times
+
+    # Function to flag the recipes every bottle they need is loaded and full enough for
+    def makeable(self, glasses=1, scale=1.0):
+        needed = self.volumes * (glasses * scale)
+        return np.all((needed == 0) | ((self.flow > 0) & (needed <= self.available)), axis=1)
+
+    # Function to compute the ETA of every recipe in seconds, backlog seconds of queued work
+    # added, NaN where it cannot be made
+    def etas(self, glasses=1, scale=1.0, backlog=0.0):
+        times = self.run_times(glasses, scale)
+        name = getattr(self.strategy, 'name', 'concurrent')
+        if name == 'sequential':
+            etas = times.sum(axis=1)
+        elif name == 'capped':
+            pump_seconds = np.multiply(times, self.copies, out=np.full_like(times, np.inf), where=self.copies > 0)
+            etas = np.maximum(times.max(axis=1, initial=0.0), pump_seconds.sum(axis=1) / self.strategy.max_pumps)
+        else:
+            etas = times.max(axis=1, initial=0.0)
+        etas = etas + backlog
+        etas[~self.makeable(glasses, scale)] = np.nan
+        return etas
+
+    # Function to give the ETAs as {cocktail: seconds or None}
+    def eta_map(self, glasses=1, scale=1.0, backlog=0.0):
+        return {name: None if np.isnan(eta) else float(eta) for name, eta in zip(self.names, self.etas(glasses, scale, backlog))}
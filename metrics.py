@@ -0,0 +1,143 @@
+# -*- coding: utf8 -*-
+
+# Minimal Prometheus-style metrics with an optional local HTTP endpoint.
+#
+# Updating a metric is a dict lookup and a float add, cheap enough for the
+# pump controller's timing loop. Each metric is meant to be updated from one
+# thread (the Tk thread in the GUI, the timing loop in the controller), so no
+# locks are taken; the HTTP thread only reads.
+#
+# Metrics are registered by name: a metric created again under a name already
+# registered, say by a new PumpController in the same process, replaces the
+# old one, so /metrics lists every family once and drops the old instance.
+
+import math
+import threading
+
+# Metric name -> latest metric created under it, in the order the names were first created
+registry = {}
+
+# Function to format label values for the text exposition format
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+# Function to format a sample value
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+# Class for a value that only goes up
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.values = {}
+        if not self.label_names:
+            self.values[()] = 0.0
+        registry[self.name] = self
+
+    # Function to add to the counter for the given label values
+    def inc(self, amount=1, *label_values):
+        self.values[label_values] = self.values.get(label_values, 0.0) + amount
+
+    # Function to list the exposition lines of this metric
+    def samples(self):
+        return [f"{self.name}{format_labels(self.label_names, key)} {format_value(value)}" for key, value in list(self.values.items())]
+
+# Class for a value that can go up and down, or be computed when scraped
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labels=(), function=None):
+        super().__init__(name, help_text, labels)
+        self.function = function  # Returns {label values: value} at scrape time
+
+    # Function to set the gauge for the given label values
+    def set(self, value, *label_values):
+        self.values[label_values] = value
+
+    def samples(self):
+        if self.function is not None:
+            self.values = dict(self.function())
+        return super().samples()
+
+# Class counting observations into fixed buckets
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.label_names = tuple(labels)
+        self.series = {}  # Label values -> [bucket counts..., sum, count]
+        registry[self.name] = self
+
+    # Function to record one observation
+    def observe(self, value, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self):
+        lines = []
+        for key, series in list(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(self.label_names, key, ('le', format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, key)} {format_value(series[-2])}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, key)} {series[-1]}")
+        return lines
+
+# Function to render every registered metric in the Prometheus text format
+def render():
+    lines = []
+    for metric in list(registry.values()):
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+# Function to serve /metrics on a local port from a daemon thread.
+# http.server is only imported here, processes that never serve metrics skip it.
+def start_http_server(port, address='127.0.0.1'):
+    import http.server
+
+    # Class answering GET /metrics
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        # Keep scrapes out of the console
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,301 @@
+#!/usr/bin/python3
+# -*- coding: utf8 -*-
+
+# Local HTTP ordering API with WebSocket status push.
+#
+# Phones or a POS submit orders to the same pump controller queue the touch
+# screen uses, with the same recipe-to-pour conversion (menu.py). Everything
+# runs on one asyncio event loop, so hundreds of idle WebSocket clients cost a
+# socket and a small buffer each rather than a thread.
+#
+#   GET  /menu              cocktails with their ingredients, pour ETA and availability
+#   POST /orders            {"cocktail": "Mojito", "glasses": 2} -> 202 {"order": "..."}
+#   GET  /orders/<id>       status and progress of one order
+#   GET  /ws[?order=<id>]   WebSocket pushing controller events as JSON
+#
+# Run it on its own next to the GUI:
+#
+#     python3 order_api.py --port 8080 --menu holiday.json
+#
+# It has no authentication and listens on localhost unless --host says
+# otherwise: anyone who can reach the port can order. Request bodies and
+# WebSocket frames are capped in size, and only the latest finished orders
+# are kept for GET /orders/<id>.
+
+import argparse
+import asyncio
+import base64
+import collections
+import hashlib
+import itertools
+import json
+import os
+import struct
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import menu
+import menu_matrix
+import pump_controller
+from cbr import strategies
+
+# GUID from RFC 6455 used to answer the WebSocket handshake
+websocket_guid = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+# Reason phrases for the statuses we send
+status_texts = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                413: 'Payload Too Large', 503: 'Service Unavailable'}
+
+# Largest request body, WebSocket frame from a client and number of headers accepted
+max_body = 64 * 1024
+max_frame = 64 * 1024
+max_headers = 100
+
+# Class serving orders for one pump controller client
+class OrderAPI:
+    def __init__(self, client, recipes, flow_rate, strategy=None, bottles=None):
+        self.client = client
+        self.recipes = recipes
+        self.flow_rate = flow_rate
+        self.strategy = strategy  # Dispense strategy of the controller, for menu ETAs
+        self.bottles = bottles  # Bottle map of the controller, orders then go by ingredient name
+        # Every motor the recipes or the bottle map use, at the nominal flow rate. Without a flow rate
+        # (the fleet, whose units each have their own) menu_items is overridden and there is no matrix.
+        self.matrix = None
+        if flow_rate is not None:
+            motors = bottles or {ingredient['motor'] for recipe in recipes.values() for ingredient in recipe['ingredients']}
+            self.matrix = menu_matrix.MenuMatrix(recipes, {motor: flow_rate for motor in motors}, strategy, bottles)
+        self.orders = {}  # Order id -> status dict
+        self.finished = collections.deque()  # Ids of the finished orders still kept, oldest first
+        self.keep_finished = 1000  # Finished orders kept for GET /orders/<id>
+        self.max_orders = 10000  # Orders kept in all, the oldest are dropped past it even if never finished
+        self.order_numbers = itertools.count(1)
+        self.prefix = f"api-{os.getpid()}"
+        self.sockets = set()  # (writer, order filter) of every open WebSocket
+        self.loop = None
+        client.add_listener(self.on_controller_event)
+
+    # Function called from the client reader thread, hands the event to the event loop
+    def on_controller_event(self, event):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.handle_event, event)
+
+    # Function to update order status and push the event to WebSocket clients
+    def handle_event(self, event):
+        order = self.orders.get(event.get('order'))
+        if order is not None:
+            if event['ev'] == 'queued':
+                order.update(status='queued', depth=event['depth'])
+            elif event['ev'] == 'started':
+                order.update(status='pouring', started=event['t'], eta=event['eta'])
+            elif event['ev'] == 'done':
+                order.update(status='ready', ready=event['t'], elapsed=event['elapsed'])
+                self.order_finished(event['order'])
+            elif event['ev'] == 'error':
+                order.update(status='failed', error=event['error'])
+                self.order_finished(event['order'])
+        if event['ev'] == 'inventory' and 'flow_rates' in event and self.matrix is not None:
+            self.matrix.set_flow_rates({rate['motor']: rate['rate'] for rate in event['flow_rates']})
+        if event['ev'] == 'inventory' and 'levels' in event and self.matrix is not None:
+            self.matrix.set_levels({level['motor']: level['remaining'] for level in event['levels']})
+        for order_id in event.get('cancelled', []):
+            if order_id in self.orders:
+                self.orders[order_id].update(status='cancelled')
+                self.order_finished(order_id)
+
+        frame = websocket_frame(json.dumps(event).encode())
+        for writer, order_filter in list(self.sockets):
+            if order_filter is None or order_filter == event.get('order') or 'cancelled' in event:
+                # A client that stopped reading is dropped rather than buffered forever
+                if writer.transport.get_write_buffer_size() > 1 << 20:
+                    self.sockets.discard((writer, order_filter))
+                    writer.close()
+                    continue
+                writer.write(frame)
+
+    # Function to keep a finished order for a while, forgetting the oldest finished ones
+    def order_finished(self, order_id):
+        self.finished.append(order_id)
+        while len(self.finished) > self.keep_finished:
+            self.orders.pop(self.finished.popleft(), None)
+
+    # Function to place an order with the pump controller
+    def submit(self, cocktail, glasses=1):
+        while len(self.orders) >= self.max_orders:
+            del self.orders[next(iter(self.orders))]
+        order_id = f"{self.prefix}-{next(self.order_numbers)}"
+        self.orders[order_id] = {'order': order_id, 'cocktail': cocktail, 'glasses': glasses, 'status': 'sent', 'placed': time.monotonic()}
+        self.place(order_id, cocktail, glasses)
+        return order_id
+
+    # Function to hand an order to the pump controller
+    def place(self, order_id, cocktail, glasses):
+        self.client.pour(order_id, menu.order_pours(self.recipes[cocktail], self.bottles), label=cocktail, glasses=glasses)
+
+    # Function to describe an order, with progress while it pours
+    def order_status(self, order_id):
+        order = dict(self.orders[order_id])
+        if order['status'] == 'pouring' and order['eta'] > 0:
+            order['progress'] = min(1.0, (time.monotonic() - order['started']) / order['eta'])
+        return order
+
+    # Function to list the menu
+    def menu_items(self):
+        etas = self.matrix.eta_map()
+        return [{'cocktail': name, 'ingredients': [dict(ingredient) for ingredient in recipe['ingredients']], 'eta': etas[name],
+                 'available': etas[name] is not None}
+                for name, recipe in self.recipes.items()]
+
+    # Function to route one HTTP request, returning (status, body)
+    def route(self, method, path, body):
+        if path == '/menu':
+            return (200, self.menu_items()) if method == 'GET' else (405, {'error': 'GET only'})
+        if path == '/orders':
+            if method != 'POST':
+                return 405, {'error': 'POST only'}
+            try:
+                request = json.loads(body or b'{}')
+            except ValueError:
+                request = None
+            cocktail = request.get('cocktail') if isinstance(request, dict) else None
+            glasses = request.get('glasses', 1) if isinstance(request, dict) else None
+            if not isinstance(cocktail, str) or not isinstance(glasses, int) or isinstance(glasses, bool):
+                return 400, {'error': 'Expected {"cocktail": name, "glasses": n}'}
+            if cocktail not in self.recipes:
+                return 404, {'error': f"Unknown cocktail {cocktail}"}
+            if glasses < 1:
+                return 400, {'error': 'glasses must be at least 1'}
+            return 202, {'order': self.submit(cocktail, glasses)}
+        if path.startswith('/orders/'):
+            order_id = path[len('/orders/'):]
+            if order_id not in self.orders:
+                return 404, {'error': f"Unknown order {order_id}"}
+            return 200, self.order_status(order_id)
+        return 404, {'error': 'Not found'}
+
+    # Function to serve one connection, keeping it alive between requests
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                for _ in range(max_headers + 1):
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                else:
+                    await self.respond(writer, 400, {'error': 'Too many headers'})
+                    break
+                length = int(headers.get('content-length', 0))
+                if not 0 <= length <= max_body:
+                    await self.respond(writer, 413 if length > 0 else 400, {'error': f"Bodies are at most {max_body} bytes"})
+                    break
+                body = await reader.readexactly(length)
+
+                url = urlsplit(target)
+                if headers.get('upgrade', '').lower() == 'websocket' and url.path == '/ws':
+                    if 'sec-websocket-key' not in headers:
+                        await self.respond(writer, 400, {'error': 'Missing Sec-WebSocket-Key'})
+                        break
+                    order_filter = parse_qs(url.query).get('order', [None])[0]
+                    await self.serve_websocket(reader, writer, headers, order_filter)
+                    return
+
+                await self.respond(writer, *self.route(method, url.path, body))
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    # Function to send one JSON response
+    async def respond(self, writer, status, payload):
+        data = json.dumps(payload).encode()
+        writer.write(f"HTTP/1.1 {status} {status_texts[status]}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+        await writer.drain()
+
+    # Function to upgrade a connection to a WebSocket and hold it open until the client leaves
+    async def serve_websocket(self, reader, writer, headers, order_filter):
+        accept = base64.b64encode(hashlib.sha1((headers['sec-websocket-key'] + websocket_guid).encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        entry = (writer, order_filter)
+        self.sockets.add(entry)
+        if order_filter in self.orders:
+            writer.write(websocket_frame(json.dumps(dict(self.order_status(order_filter), ev='status')).encode()))
+        try:
+            while True:
+                opcode, payload = await read_websocket_frame(reader)
+                if opcode == 0x8:  # Close
+                    writer.write(websocket_frame(payload, 0x8))
+                    break
+                if opcode == 0x9:  # Ping
+                    writer.write(websocket_frame(payload, 0xA))
+        finally:
+            self.sockets.discard(entry)
+
+    # Function to run the server until cancelled
+    async def serve(self, host, port):
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+# Function to build an unmasked WebSocket frame
+def websocket_frame(payload, opcode=0x1):
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+# Function to read one WebSocket frame sent by a client, returning (opcode, payload)
+async def read_websocket_frame(reader):
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    if length > max_frame:
+        raise ValueError(f"WebSocket frame of {length} bytes")
+    mask = await reader.readexactly(4) if second & 0x80 else b'\0\0\0\0'
+    payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(await reader.readexactly(length)))
+    return first & 0x0F, payload
+
+# Function to run the API on a daemon thread, sharing a client with the GUI
+def start_in_thread(client, recipes, flow_rate, port, host='127.0.0.1', strategy=None, bottles=None):
+    api = OrderAPI(client, recipes, flow_rate, strategy, bottles)
+    thread = threading.Thread(target=asyncio.run, args=(api.serve(host, port),), daemon=True)
+    thread.start()
+    return api
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Cocktail robot ordering API")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on, 0.0.0.0 lets anyone on the network order")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--menu', default='holiday.json')
+    parser.add_argument('--socket', default=pump_controller.socket_path)
+    parser.add_argument('--flow-rate', type=float, default=1.5, help="Pump flow rate in mL/second, for ETAs")
+    parser.add_argument('--strategy', default='concurrent', help="Dispense strategy of the controller, for ETAs")
+    parser.add_argument('--max-pumps', type=int, help="Pump cap of the capped strategy")
+    parser.add_argument('--bottles', help="Bottle map of the controller, to order by ingredient name")
+    args = parser.parse_args()
+
+    api = OrderAPI(pump_controller.PumpClient(args.socket), menu.load_recipes(args.menu), args.flow_rate,
+                   strategies.get(args.strategy, args.max_pumps), menu.load_bottles(args.bottles) if args.bottles else None)
+    try:
+        asyncio.run(api.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Process interrupted by the user.")
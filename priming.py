@@ -0,0 +1,126 @@
+# -*- coding: utf8 -*-
+
+# Cold line model and predictive pre-priming.
+#
+# After a line has been idle for drain_seconds the liquid has run back into
+# the bottle, and the next pour first spends prime_volume / flow rate filling
+# the tube. The controller adds that time to the pour so the glass still gets
+# the full volume, at the cost of latency.
+#
+# To avoid it the controller primes lines ahead of demand while idle. Demand
+# per motor is an exponentially decayed order rate (half_life) blended with
+# the rate at this hour of the day in the order log. A cold line is primed
+# when the chance of an order using it before it drains again reaches
+# threshold. A primed line that drains unused wastes prime_volume, and the
+# waste is capped by a token bucket of budget mL per hour: a finished prime
+# takes prime_volume from it and an order using the line gives it back.
+
+import math
+import time
+
+# Class tracking which lines hold liquid and which ones to prime next
+class LinePriming:
+    def __init__(self, motors, prime_volume, drain_seconds=300.0, budget=0.0, half_life=600.0, threshold=0.3):
+        self.prime_volume = prime_volume  # mL filling a drained line up to the nozzle
+        self.drain_seconds = drain_seconds
+        self.budget = budget  # mL per hour pre-priming may waste
+        self.tokens = budget
+        self.tokens_at = None
+        self.decay = math.log(2) / half_life
+        self.threshold = threshold
+        self.last_used = {motor: None for motor in motors}  # Monotonic time liquid last went through each line
+        self.primed = {}  # Motor -> time it was pre-primed, until an order uses it or it drains
+        self.rates = {motor: (0.0, None) for motor in motors}  # Motor -> (decayed orders per second, time of the estimate)
+        self.hourly = {motor: [0.0] * 24 for motor in motors}  # Orders per second at every hour of the day, from the order log
+        self.wasted = 0.0  # mL primed into lines that drained unused
+
+    # Function to learn the orders per hour of day of every motor from order log records
+    def load_history(self, records):
+        counts = {motor: [0.0] * 24 for motor in self.hourly}
+        first = last = None
+        for record in records:
+            if record.get('r') != 'order':
+                continue
+            first = record['t'] if first is None else min(first, record['t'])
+            last = record['t'] if last is None else max(last, record['t'])
+            hour = time.localtime(record['t']).tm_hour
+            for pour in record.get('pours', []):
+                if pour['motor'] in counts:
+                    counts[pour['motor']][hour] += record.get('glasses', 1)
+        if first is None:
+            return
+        days = max(1.0, (last - first) / 86400)
+        self.hourly = {motor: [count / days / 3600 for count in hours] for motor, hours in counts.items()}
+
+    # Function to tell whether a line still holds liquid
+    def warm(self, motor, now):
+        last = self.last_used.get(motor)
+        return last is not None and now - last < self.drain_seconds
+
+    # Function to give the seconds a pour has to add to fill a drained line first
+    def prime_seconds(self, motor, now, flow_rate):
+        return 0.0 if self.warm(motor, now) else self.prime_volume / flow_rate
+
+    # Function to count an order for a motor in its demand estimate
+    def observe(self, motor, now):
+        rate, at = self.rates[motor]
+        if at is not None:
+            rate *= math.exp(-self.decay * (now - at))
+        self.rates[motor] = (rate + self.decay, now)
+
+    # Function to estimate the orders per second expected for a motor
+    def demand(self, motor, now, hour=None):
+        rate, at = self.rates[motor]
+        recent = rate * math.exp(-self.decay * (now - at)) if at is not None else 0.0
+        if not any(self.hourly[motor]):
+            return recent
+        return (recent + self.hourly[motor][time.localtime().tm_hour if hour is None else hour]) / 2
+
+    # Function to record liquid going through a line for an order, a pre-primed line paid off
+    def used(self, motor, now):
+        self.last_used[motor] = now
+        if self.primed.pop(motor, None) is not None:
+            self.tokens = min(self.budget, self.tokens + self.prime_volume)
+
+    # Function to record a line filled by a flush or pre-prime, primed marks the ones to account for
+    def filled(self, motor, now, primed=False):
+        self.last_used[motor] = now
+        if primed:
+            self.primed[motor] = now
+            self.tokens = max(0.0, self.tokens - self.prime_volume)
+
+    # Function to record a line left holding water after cleaning
+    def emptied(self, motor):
+        self.last_used[motor] = None
+        self.primed.pop(motor, None)
+
+    # Function to count the pre-primed lines that drained unused, returning the mL wasted
+    def drained(self, now):
+        wasted = 0.0
+        for motor in [motor for motor in self.primed if not self.warm(motor, now)]:
+            del self.primed[motor]
+            wasted += self.prime_volume
+        self.wasted += wasted
+        return wasted
+
+    # Function to pick the cold lines worth priming now, most likely to be used first,
+    # as many as the budget left can pay for once the reserved primes already queued are done
+    def candidates(self, now, skip=(), reserved=0):
+        if self.tokens_at is not None:
+            self.tokens = min(self.budget, self.tokens + self.budget * (now - self.tokens_at) / 3600)
+        self.tokens_at = now
+        hour = time.localtime().tm_hour
+        ranked = []
+        for motor in self.last_used:
+            if motor in skip or self.warm(motor, now):
+                continue
+            chance = 1 - math.exp(-self.demand(motor, now, hour) * self.drain_seconds)
+            if chance >= self.threshold:
+                ranked.append((chance, motor))
+        affordable = int(self.tokens // self.prime_volume) - reserved if self.prime_volume > 0 else 0
+        return [motor for _, motor in sorted(ranked, reverse=True)[:max(0, affordable)]]
+
+    # Function to report the priming state
+    def snapshot(self, now):
+        return {'warm': sorted(motor for motor in self.last_used if self.warm(motor, now)), 'primed': sorted(self.primed),
+                'wasted': self.wasted, 'budget_left': self.tokens}
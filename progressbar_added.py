@@ -1,164 +1,480 @@
 #!/usr/bin/python3
 # -*- coding: utf8 -*-
 
+# Imported first so the other imports are timed
+import startup_profile
+startup_profile.begin()
+
+import concurrent.futures
 import tkinter as tk
 from tkinter import ttk
-from PIL import Image, ImageTk
-import json
-import requests
-from io import BytesIO
-import RPi.GPIO as GPIO
 import time
 import os
-import threading
+import queue
+import itertools
+import latency
+import input_latency
+import menu
+import cbr
+from cbr import strategies
+import metrics
+import pump_controller
+import thumbnails
+import weakref
+
+# PIL, requests, NumPy (menu_matrix) and order_api are imported where they are first needed, after the first frame
+
+# Metrics served on the local port given by CBR_METRICS_PORT
+drinks_metric = metrics.Counter('cbr_drinks_served_total', "Cocktails finished", ['cocktail'])
+ready_metric = metrics.Histogram('cbr_order_to_ready_seconds', "Time from tapping order to cocktail ready",
+                                 [5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300], ['cocktail'])
+image_hits_metric = metrics.Counter('cbr_image_cache_hits_total', "Cocktail images loaded from the local imgpath")
+image_misses_metric = metrics.Counter('cbr_image_cache_misses_total', "Cocktail images downloaded from image_url")
+startup_metric = metrics.Gauge('cbr_startup_phase_seconds', "Duration of each startup phase", ['phase'])
+input_metric = metrics.Histogram('cbr_input_latency_seconds', "Button release to handler, in the handler and to the next frame",
+                                 [0.005, 0.01, 0.017, 0.033, 0.05, 0.1, 0.2, 0.5, 1], ['interaction', 'stage'])
+
+# Function to record how long the startup phase that just ended took
+def mark_startup_phase(phase):
+    startup_metric.set(startup_profile.mark(phase), phase)
+
+mark_startup_phase('imports')
+
+# Deployment profile selected with CBR_PROFILE, see cbr/profiles.py
+profile = cbr.load_profile()
 
 # Defining the GPIO pins connected to the relay module
-relay_pins = [40, 38, 36, 15, 13, 11, 7, 5, 31, 33]
+relay_pins = profile['pins']
 
 # Flow rate of the pump motors in mL/second
-flow_rate = 1.5
+flow_rate = profile['flow_rate']
+
+# Size of the cocktail images in pixels
+image_size = profile['image_size']
+
+# Loading recipes from JSON, as compact records in lean memory mode
+recipes = menu.load_recipes(profile['menu'])
+if profile['lean_memory']:
+    recipes = menu.compact_recipes(recipes)
 
-# Loading recipes from JSON
-with open('holiday.json') as file:
-    recipes = json.load(file)
+# Cocktails most ordered lately first, from the controller's order log, menu order for the others
+popularity = menu.popularity(profile['order_log'])
+menu_order = sorted(recipes, key=lambda name: -popularity.get(name, 0))
+mark_startup_phase('recipes')
 
 # Map the index of relay_pins with the pump motor number
 motor_mapping = {i + 1: pin for i, pin in enumerate(relay_pins)}
 
-# Variables to record start and end times for each pump
-pump_start_times = {}
-pump_end_times = {}
+# Ingredient loaded on each motor when the recipes are poured by ingredient name
+bottles = menu.load_bottles(profile['bottles']) if profile['bottles'] else None
+
+# Name of the ingredient loaded on each motor, from the bottle map or as used by the recipes
+motor_ingredients = dict(bottles or {})
+for recipe in recipes.values():
+    for ingredient in recipe['ingredients']:
+        if 'motor' in ingredient and not bottles:
+            motor_ingredients.setdefault(ingredient['motor'], ingredient['name'])
 
 # Variable to record the cocktail start time
 cocktail_start_time = None
 
-# Function to start all motors using threads
+# Connect to the pump controller process, starting it if it is not running.
+# The controller owns the relays so GUI work can never delay a pump shut-off.
+# It connects on a background thread: the controller sets up every relay pin
+# while this window is built, and the pump controls are enabled once it is up.
+controller_connection = pump_controller.BackgroundConnect(relay_pins, flow_rate,
+                                                          path=os.environ.get('CBR_PUMP_SOCKET', pump_controller.socket_path),
+                                                          sim=os.environ.get('CBR_SIM_GPIO') == '1',
+                                                          extra_args=['--strategy', profile['strategy'], '--order-log', profile['order_log'],
+                                                                      '--max-batch', str(profile['max_batch'])] +
+                                                                     (['--max-pumps', str(profile['max_pumps'])] if profile['max_pumps'] else []) +
+                                                                     (['--bottles', profile['bottles']] if profile['bottles'] else []) +
+                                                                     (['--calibration', profile['calibration']] if profile['calibration'] else []))
+pump_client = None
+
+# Controller events are handed to the Tk thread through this queue
+pump_events = queue.Queue()
+
+# Heartbeat sent to the controller watchdog, relays go off if the Tk thread stalls longer than the timeout
+heartbeat_interval_ms = 250
+heartbeat_timeout = 1.0
+
+# Per-cocktail latency histograms shown in the admin panel
+order_latencies = latency.OrderLatencies()
+
+# Numbering for the orders sent from this window
+order_numbers = itertools.count(1)
+
+# Orders sent to the controller and not finished yet, keyed by order id
+active_orders = {}
+
+# ETA and availability of every cocktail (menu_matrix.py), built once the controller is connected
+eta_matrix = None
+
+# Function to start all motors at once
 def start_all_motors(volume):
-    threads = []
-
-    # Iterate through all motors and start them in separate threads
-    for motor_pin in relay_pins:
-        thread = threading.Thread(target=start_pump, args=(motor_pin, volume))
-        threads.append(thread)
-        thread.start()
-
-    # Wait for all threads to finish
-    for thread in threads:
-        thread.join()
-
-# Initialize GPIO setup
-GPIO.setmode(GPIO.BOARD)
-GPIO.setwarnings(False)
-for pin in relay_pins:
-    GPIO.setup(pin, GPIO.OUT)
-    GPIO.output(pin, GPIO.HIGH)
-
-# Function to load a cocktail image
+    order = f"gui-{next(order_numbers)}"
+    active_orders[order] = {'label': "All Motors", 'tapped': time.time(), 'volume': volume}
+    pump_client.pour(order, [(motor, volume) for motor in motor_mapping], label="All Motors")
+
+# PhotoImages by image file or URL, so cocktails sharing an image share one PhotoImage while a button shows it
+shared_images = weakref.WeakValueDictionary()
+
+# Function to decode an image and resize it for a button. The PIL images are closed as soon as
+# Tk has copied the pixels, and in lean memory mode JPEGs are decoded at a fraction of their size.
+def make_photo_image(file):
+    from PIL import Image, ImageTk
+    with Image.open(file) as image:
+        if profile['lean_memory']:
+            image.draft(image.mode, (image_size, image_size))
+        with image.resize((image_size, image_size), Image.BILINEAR) as resized:
+            return ImageTk.PhotoImage(resized)
+
+# Seconds a cocktail image download may take
+image_download_timeout = 5
+
+# Downloads of remote cocktail images running on worker threads, image URL -> (future, cocktails waiting for it)
+image_downloads = {}
+image_download_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+
+# Function to download an image on a worker thread, the Tk thread must keep sending the controller heartbeat
+def download_image(url):
+    import requests
+    response = requests.get(url, timeout=image_download_timeout)
+    response.raise_for_status()
+    return response.content
+
+# Function to load a cocktail image. Local files are decoded here, a remote image is downloaded on
+# a worker thread and None returned: its button gets the image once finish_download has it.
 def load_cocktail_image(cocktail):
     local_img_path = recipes[cocktail]['imgpath']
-    if os.path.exists(local_img_path):
-        try:
-            image = Image.open(local_img_path)
-            image = image.resize((170, 170), Image.BILINEAR)
-            return ImageTk.PhotoImage(image)
-        except Exception as e:
-            print(f"Error loading image for {cocktail} from local imgpath: {e}")
-    else:
-        # Load the image from "image_url"
-        response = requests.get(recipes[cocktail]['image_url'])
-        try:
-            image = Image.open(BytesIO(response.content))
-            image = image.resize((170, 170), Image.BILINEAR)
-            return ImageTk.PhotoImage(image)
-        except Exception as e:
-            print(f"Error loading image for {cocktail} from image_url: {e}")
-    # Return None if image loading fails
-    return None
-
-# Function to start a pump
-def start_pump(motor_pin, volume):
-    run_time = volume / flow_rate  # run time based on volume
-    
+    source = local_img_path if os.path.exists(local_img_path) else recipes[cocktail]['image_url']
+    image = shared_images.get(source)
+    if image is not None:
+        return image
+    if source != local_img_path:
+        if source in image_downloads:
+            image_downloads[source][1].add(cocktail)
+        elif source:
+            image_misses_metric.inc()
+            image_downloads[source] = (image_download_pool.submit(download_image, source), {cocktail})
+            root.after(50, finish_download, source)
+        return None
+    image_hits_metric.inc()
     try:
-        GPIO.output(motor_pin, GPIO.LOW)  # Turn on the motor
-        start_time = time.time()  # Record the start time
-        time.sleep(run_time)  # Run the motor for the calculated time
-        end_time = time.time()  # Record the end time
-    except KeyboardInterrupt:
-        print("Process interrupted by the user.")
-    finally:
-        GPIO.output(motor_pin, GPIO.HIGH)  # Turn off the motor
-        elapsed_time = end_time - start_time
-        pump_start_times[motor_pin] = start_time  # Record the start time
-        pump_end_times[motor_pin] = end_time  # Record the end time
-        print(f"Pumping {volume} mL from Motor {relay_pins.index(motor_pin) + 1}. Time: {int(elapsed_time // 60)} minutes {int(elapsed_time % 60)} seconds")
-        return elapsed_time
+        image = make_photo_image(local_img_path)
+    except Exception as e:
+        print(f"Error loading image for {cocktail} from local imgpath: {e}")
+        return None
+    shared_images[source] = image
+    return image
+
+# Function to build the PhotoImage of a finished download on the Tk thread and show it on the buttons waiting for it
+def finish_download(url):
+    download, cocktails = image_downloads[url]
+    if not download.done():
+        root.after(50, finish_download, url)
+        return
+    del image_downloads[url]
+    from io import BytesIO
+    try:
+        image = make_photo_image(BytesIO(download.result()))
+    except Exception as e:
+        print(f"Error loading image for {', '.join(sorted(cocktails))} from image_url: {e}")
+        return
+    shared_images[url] = image
+    for cocktail in cocktails:
+        show_button_image(cocktail)
 
 # Function to show cocktail details
 def show_cocktail_details(cocktail):
+    if cocktail not in thumbnail_cache:
+        show_button_image(cocktail)
     selected_cocktail.set(cocktail)
     cocktail_data = recipes[cocktail]
 
     details_label.config(text=f"Selected Cocktail\n{cocktail}")
     ingredients_label.config(text="\n".join([f"{ingredient['name']}: {ingredient['quantity']} mL" for ingredient in cocktail_data['ingredients']]))
 
-    order_button.config(state=tk.NORMAL)
-
-# Function to make a cocktail with a progress bar
-def make_cocktail(cocktail, volume):
+    order_button.config(state=tk.NORMAL if pump_client is not None else tk.DISABLED)
+
+# Function to start the motor selected in the dropdown, or all of them
+def start_selected_motor(volume):
+    if selected_motor.get() == "All Motors":
+        start_all_motors(volume)
+        return
+    motor = int(selected_motor.get().split()[-1])
+    order = f"gui-{next(order_numbers)}"
+    active_orders[order] = {'label': selected_motor.get(), 'tapped': time.time(), 'volume': volume}
+    pump_client.pour(order, [(motor, volume)], label=selected_motor.get())
+
+# Function to clean the line of the motor selected in the dropdown, or of all of them, with the entered volume of water.
+# The controller runs it while no order is pouring and pauses it when one comes in.
+def clean_selected_motor():
+    volume = float(volume_entry.get()) if volume_entry.get() else 50
+    if selected_motor.get() == "All Motors":
+        pump_client.clean(None, volume)
+    elif selected_motor.get().startswith("Motor"):
+        pump_client.clean([int(selected_motor.get().split()[-1])], volume)
+
+# Function to make a cocktail with a progress bar, the recipe is poured once per glass
+def make_cocktail(cocktail, glasses):
     global cocktail_start_time
     cocktail_start_time = time.time()  # Record the cocktail start time
 
-    # Getting the ingredient motors and volumes for the selected cocktail
-    ingredients = recipes[cocktail]['ingredients']
-
-    # Calculate the estimated pump run times based on ingredient volumes
-    run_times = [(motor_mapping[ingredient['motor']], ingredient['quantity']) for ingredient in ingredients]
-
-    # Sort the run_times in ascending order of volume
-    run_times.sort(key=lambda x: x[1])
-
-    total_time = sum(volume / flow_rate for _, volume in run_times)  # Total time to make the cocktail
+    # Pours for the controller as (motor, volume) pairs for the selected cocktail, or by ingredient with a bottle map
+    pours = menu.order_pours(recipes[cocktail], bottles)
 
     # Initialize progress bar
     progress = ttk.Progressbar(order_frame, length=200, mode="determinate")
     progress.grid(row=2, column=0, columnspan=2, pady=10)
 
-    # Function to update the progress bar
-    def update_progress():
-        for i in range(int(total_time * 20)):  # 20 updates per second
-            progress['value'] = (i / (total_time * 20)) * 100
-            root.update_idletasks()
-            time.sleep(0.05)
-        progress['value'] = 100  # Set progress to 100% when done
-
-    # Turn on all required motors using threads
-    threads = []
-    for motor_pin, volume in run_times:
-        thread = threading.Thread(target=start_pump, args=(motor_pin, volume))
-        threads.append(thread)
-        thread.start()
-
-    # Start updating the progress bar
-    progress_thread = threading.Thread(target=update_progress)
-    progress_thread.start()
-
-    # Wait for all threads to finish
-    for thread in threads:
-        thread.join()
-
-    end_time = time.time()  # Record the end time for the last motor
-
-    print("Cocktail ready!")
-
-    # Calculate and print total time
-    total_time = end_time - cocktail_start_time
-    print(f"Total time: {int(total_time // 60)} minutes {int(total_time % 60)} seconds")
-    progress['value'] = 0  # Reset progress bar
+    # The controller runs the pumps, the window only follows its events
+    order = f"gui-{next(order_numbers)}"
+    active_orders[order] = {'label': cocktail, 'tapped': cocktail_start_time, 'tapped_mono': time.monotonic(), 'progress': progress,
+                            'glasses': glasses}
+    pump_client.pour(order, pours, label=cocktail, glasses=glasses)
+
+# Function to take the progress bar of a finished, failed or cancelled order off the window,
+# unless another order of the same recovered job still follows it
+def drop_progress(order):
+    progress = order.get('progress')
+    if progress is not None and not any(other.get('progress') is progress for other in active_orders.values()):
+        progress.destroy()
+
+# Function to clear the selected cocktail once it is poured
+def clear_selection():
+    selected_cocktail.set("")
+    details_label.config(text="Selected Cocktail")
+    ingredients_label.config(text="")
+    order_button.config(state=tk.DISABLED)
+
+# Function to stop using a controller that went away: the pump controls are disabled and the
+# orders in flight dropped, the robot needs restarting
+def controller_lost():
+    global pump_client, recovery_panel
+    if pump_client is None:
+        return
+    print("Pump controller disconnected")
+    pump_client = None
+    for button in (start_button, refill_button, clean_button, order_button):
+        button.config(state=tk.DISABLED)
+    for order_id in list(active_orders):
+        drop_progress(active_orders.pop(order_id))
+    if recovery_panel is not None:
+        recovery_panel.destroy()
+        recovery_panel = None
+    inventory_label.config(text="Pump controller stopped, restart the robot")
+
+# Function to handle one event sent by the pump controller
+def handle_pump_event(event):
+    if event['ev'] == 'relay':
+        for order_id in event['orders']:
+            order = active_orders.get(order_id)
+            if event['on'] and order is not None and 'first_relay' not in order:
+                order['first_relay'] = event['t']
+        if not event['on']:
+            elapsed_time = event['elapsed']
+            print(f"Motor {event['motor']} done. Time: {int(elapsed_time // 60)} minutes {int(elapsed_time % 60)} seconds")
+        return
+    if event['ev'] == 'error':
+        print(f"Pump controller error: {event['error']}")
+        order = active_orders.pop(event.get('order'), None)
+        if order is not None:
+            drop_progress(order)
+        return
+    if event['ev'] == 'inventory':
+        show_inventory_warnings(event['warnings'])
+        if 'flow_rates' in event and eta_matrix is not None:
+            eta_matrix.set_flow_rates({rate['motor']: rate['rate'] for rate in event['flow_rates']})
+        if 'levels' in event and eta_matrix is not None:
+            eta_matrix.set_levels({level['motor']: level['remaining'] for level in event['levels']})
+        return
+    if event['ev'] == 'recovered':
+        show_recovered_orders(event['jobs'])
+        return
+    if event['ev'] == 'disconnected':
+        controller_lost()
+        return
+    if event['ev'] == 'maintenance':
+        if 'motor' in event:
+            print(f"Motor {event['motor']} {event['program']}: {event['state']}, {event['seconds']:.0f} seconds left")
+        return
+    if event['ev'] in ('watchdog', 'stopped'):
+        if event['ev'] == 'watchdog':
+            print(f"Pumps stopped by the watchdog: {event['reason']}")
+        for order_id in event['cancelled']:
+            order = active_orders.pop(order_id, None)
+            if order is not None:
+                drop_progress(order)
+        return
+
+    order = active_orders.get(event.get('order'))
+    if order is None:
+        return
+    if event['ev'] == 'started':
+        order['started'] = time.monotonic()
+        order['eta'] = event['eta']
+        for motor, rest in event['cooldown'].items():
+            print(f"Motor {motor} is hot, adding {rest:.0f} seconds of rest to {order['label']}")
+        if 'tapped_mono' in order:
+            order_latencies.record(order['label'], 'queue_wait', event['t'] - order['tapped_mono'])
+    elif event['ev'] == 'done':
+        del active_orders[event['order']]
+        pump_client.request_inventory()  # Bottle levels for the menu
+        if 'progress' in order:
+            print("Cocktail ready!" if order['glasses'] == 1 else f"{order['glasses']} x {order['label']} ready!")
+        else:
+            print(f"Pumping {order['volume']} mL from {order['label']}")
+
+        # Calculate and print total time
+        total_time = time.time() - order['tapped']
+        print(f"Total time: {int(total_time // 60)} minutes {int(total_time % 60)} seconds")
+        if 'progress' in order:
+            drop_progress(order)
+            if selected_cocktail.get() == order['label']:
+                clear_selection()
+            drinks_metric.inc(order['glasses'], order['label'])
+            ready_metric.observe(total_time, order['label'])
+            if 'first_relay' in order:
+                order_latencies.record(order['label'], 'tap_to_first_relay', order['first_relay'] - order['tapped_mono'])
+                order_latencies.record(order['label'], 'first_relay_to_ready', event['t'] - order['first_relay'])
+
+# Function to show the bottles that are about to run dry
+def show_inventory_warnings(warnings):
+    lines = []
+    for warning in warnings:
+        name = warning['ingredient'] or f"Motor {warning['motor']}"
+        if warning['seconds_left'] is None:
+            lines.append(f"{name} (Motor {warning['motor']}): {warning['remaining']:.0f} mL left")
+        else:
+            lines.append(f"{name} (Motor {warning['motor']}): {warning['remaining']:.0f} mL, ~{int(warning['seconds_left'] // 60)} min left")
+    inventory_label.config(text="\n".join(["Refill soon:"] + lines) if lines else "")
+
+# Window listing the orders a power cut left unfinished, None while closed
+recovery_panel = None
+
+# Function to offer finishing the orders the controller recovered from its journal after a crash
+def show_recovered_orders(jobs):
+    global recovery_panel
+    if recovery_panel is not None:
+        recovery_panel.destroy()
+        recovery_panel = None
+    if not jobs:
+        return
+    recovery_panel = tk.Toplevel(root)
+    recovery_panel.title("Interrupted orders")
+    for row, job in enumerate(jobs):
+        state = "partly poured" if job['partial'] else "not started"
+        lines = [f"{job['label']} x{job['glasses']} ({state})"]
+        for pour in job['pours']:
+            name = motor_ingredients.get(pour['motor']) or f"Motor {pour['motor']}"
+            lines.append(f"{name}: {pour['volume']:.1f} mL missing")
+        ttk.Label(recovery_panel, text="\n".join(lines)).grid(row=row, column=0, padx=10, pady=5, sticky="w")
+        ttk.Button(recovery_panel, text="Finish", command=lambda j=job: finish_recovered_order(j)).grid(row=row, column=1, padx=5)
+        ttk.Button(recovery_panel, text="Discard", command=lambda j=job: pump_client.discard(j['job'])).grid(row=row, column=2, padx=5)
+
+# Function to pour exactly what a recovered order is missing, with a progress bar
+def finish_recovered_order(job):
+    progress = ttk.Progressbar(order_frame, length=200, mode="determinate")
+    progress.grid(row=2, column=0, columnspan=2, pady=10)
+    for order in job['orders']:
+        active_orders[order] = {'label': job['label'], 'tapped': time.time(), 'tapped_mono': time.monotonic(), 'progress': progress,
+                                'glasses': max(1, job['glasses'] // len(job['orders']))}
+    pump_client.resume(job['job'])
+
+# Function to record a refill of the motor selected in the dropdown
+def refill_selected_motor():
+    if not selected_motor.get().startswith("Motor"):
+        return
+    motor = int(selected_motor.get().split()[-1])
+    volume = volume_entry.get()
+    pump_client.refill(motor, float(volume) if volume else None, ingredient=motor_ingredients.get(motor))
+
+# Function to show on every cocktail button its ETA for the glasses selected, after the orders already sent
+def update_menu_etas(*_):
+    if eta_matrix is None:
+        return
+    now = time.monotonic()
+    backlog = 0.0
+    queued = {}  # Glasses -> ETAs of the whole menu for that many, for the orders not started yet
+    for order in active_orders.values():
+        if 'started' in order:
+            backlog += max(0.0, order['eta'] - (now - order['started']))
+        elif order['label'] in eta_matrix.rows and 'glasses' in order:
+            if order['glasses'] not in queued:
+                queued[order['glasses']] = eta_matrix.etas(glasses=order['glasses'])
+            eta = queued[order['glasses']][eta_matrix.rows[order['label']]]
+            backlog += 0.0 if eta != eta else eta  # An order that cannot be made is refused, it adds nothing
+    for cocktail, eta in zip(eta_matrix.names, eta_matrix.etas(glasses=int(selected_glasses.get()), backlog=backlog)):
+        cocktail_buttons[cocktail].config(text=f"{cocktail}\n{'unavailable' if eta != eta else f'~{eta:.0f} s'}")
+
+# Function to process controller events and animate progress bars, 20 updates per second
+def poll_pump_events():
+    handled = False
+    while True:
+        try:
+            event = pump_events.get_nowait()
+        except queue.Empty:
+            break
+        handle_pump_event(event)
+        handled = True
+    if handled:
+        update_menu_etas()
+
+    for order in active_orders.values():
+        if 'progress' in order and 'started' in order and order['eta'] > 0:
+            done = (time.monotonic() - order['started']) / order['eta']
+            order['progress']['value'] = min(done, 1) * 100
+    root.after(50, poll_pump_events)
+
+# Function to open the admin panel with latency percentiles per cocktail
+def show_admin_panel():
+    panel = tk.Toplevel(root)
+    panel.title("Order latency")
+
+    columns = ('cocktail', 'stage', 'count', 'p50', 'p90', 'p99', 'max')
+    table = ttk.Treeview(panel, columns=columns, show="headings", height=15)
+    for column in columns:
+        table.heading(column, text=column)
+        table.column(column, width=140 if column in ('cocktail', 'stage') else 70)
+    table.grid(row=0, column=0, columnspan=2, padx=10, pady=10)
+
+    # Function to fill the table from the histograms, the button latencies after the orders
+    def refresh():
+        table.delete(*table.get_children())
+        rows = list(order_latencies.report().items())
+        rows += [(f"button: {interaction}", summaries) for interaction, summaries in input_latencies.report().items()]
+        for cocktail, summaries in rows:
+            for stage, summary in summaries.items():
+                values = [f"{summary[key]:.3f}" if key in summary else "-" for key in ('p50', 'p90', 'p99', 'max')]
+                table.insert("", tk.END, values=[cocktail, stage, summary['count']] + values)
+
+    # Function to export the histograms next to the recipes
+    def export():
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        order_latencies.export(f"latency-{stamp}.json")
+        order_latencies.export(f"latency-{stamp}.csv")
+        input_latencies.export(f"latency-buttons-{stamp}.json")
+        input_latencies.export(f"latency-buttons-{stamp}.csv")
+        print(f"Latency report written to latency-{stamp}.json and latency-{stamp}.csv, "
+              f"button latencies to latency-buttons-{stamp}.json and latency-buttons-{stamp}.csv")
+
+    ttk.Button(panel, text="Refresh", command=refresh).grid(row=1, column=0, pady=10)
+    ttk.Button(panel, text="Export", command=export).grid(row=1, column=1, pady=10)
+    refresh()
 
 # Create the main tkinter window
 root = tk.Tk()
-root.title("Cocktail Bartender Robot")
+root.title(profile['title'])
+if profile['geometry']:
+    root.geometry(profile['geometry'])
+
+# Button release to handler and to the next frame, shown in the admin panel. CBR_FRAME_DEBUG=1 flags
+# any work on the Tk thread longer than a frame in a label over the window.
+input_latencies = input_latency.InputLatencies(root, lambda interaction, stage, seconds: input_metric.observe(seconds, interaction, stage))
+if os.environ.get('CBR_FRAME_DEBUG'):
+    input_latencies.monitor = input_latency.FrameMonitor(root)
 
 # Create frames
 btn_frame = ttk.Frame(root, padding=10)
@@ -196,9 +512,24 @@ volume_entry = ttk.Entry(custom_frame)
 volume_entry.pack()
 
 # Start button to activate the selected motor or all motors
-start_button = ttk.Button(custom_frame, text="Start", command=lambda: start_all_motors(int(volume_entry.get())) if selected_motor.get() == "All Motors" else make_cocktail(selected_cocktail.get(), int(volume_entry.get())))
+start_button = ttk.Button(custom_frame, text="Start", state=tk.DISABLED)
+input_latencies.watch(start_button, 'start', lambda: start_selected_motor(int(volume_entry.get())))
 start_button.pack(pady=10)
 
+# Button to record a refill of the selected motor, to the entered volume or full capacity
+refill_button = ttk.Button(custom_frame, text="Refill", state=tk.DISABLED)
+input_latencies.watch(refill_button, 'refill', refill_selected_motor)
+refill_button.pack(pady=10)
+
+# Button to clean the selected line, or all of them, while no order is pouring
+clean_button = ttk.Button(custom_frame, text="Clean", state=tk.DISABLED)
+input_latencies.watch(clean_button, 'clean', clean_selected_motor)
+clean_button.pack(pady=10)
+
+# Button to open the admin panel
+admin_button = ttk.Button(custom_frame, text="Admin", command=show_admin_panel)
+admin_button.pack(pady=10)
+
 # Initialize labels
 details_label = ttk.Label(order_frame, text="Selected Cocktail", font=("Helvetica", 14, "bold"))
 details_label.grid(row=0, column=0, columnspan=2, pady=10)
@@ -206,18 +537,75 @@ details_label.grid(row=0, column=0, columnspan=2, pady=10)
 ingredients_label = ttk.Label(order_frame, text="", font=("Helvetica", 12))
 ingredients_label.grid(row=1, column=0, columnspan=2, pady=10)
 
-order_button = ttk.Button(order_frame, text="Click to order", command=lambda: make_cocktail(selected_cocktail.get(), 1), state=tk.DISABLED)
+# Dropdown to pour several glasses of the selected cocktail in one run
+glasses_label = ttk.Label(order_frame, text="Glasses:")
+glasses_label.grid(row=4, column=0, pady=10, sticky="e")
+selected_glasses = tk.StringVar()
+glasses_dropdown = ttk.Combobox(order_frame, textvariable=selected_glasses, width=3, state="readonly")
+glasses_dropdown['values'] = [str(n) for n in range(1, profile['max_batch'] + 1)]  # The controller refuses more
+glasses_dropdown.set("1")
+glasses_dropdown.grid(row=4, column=1, pady=10, sticky="w")
+glasses_dropdown.bind("<<ComboboxSelected>>", lambda event: update_menu_etas())
+
+order_button = ttk.Button(order_frame, text="Click to order", state=tk.DISABLED)
+input_latencies.watch(order_button, 'order', lambda: make_cocktail(selected_cocktail.get(), int(selected_glasses.get())))
 order_button.grid(row=2, column=0, columnspan=2, pady=10)
 
-# Load cocktail images and create buttons
-cocktail_buttons = []
-for i, cocktail in enumerate(recipes):
-    image = load_cocktail_image(cocktail)
-    if image:
-        cocktail_button = ttk.Button(btn_frame, image=image, text=cocktail, compound=tk.TOP, command=lambda c=cocktail: show_cocktail_details(c))
-        cocktail_button.image = image  # Store the PhotoImage object
-        cocktail_button.grid(row=i // 2, column=i % 2, padx=10, pady=10)
-        cocktail_buttons.append(cocktail_button)
+inventory_label = ttk.Label(order_frame, text="", font=("Helvetica", 12), foreground="red")
+inventory_label.grid(row=3, column=0, columnspan=2, pady=10)
+
+mark_startup_phase('widgets')
+
+# Create the cocktail buttons, most popular first, their images are loaded once the window is up
+cocktail_buttons = {}
+for i, cocktail in enumerate(menu_order):
+    cocktail_button = ttk.Button(btn_frame, text=cocktail, compound=tk.TOP)
+    input_latencies.watch(cocktail_button, 'select', lambda c=cocktail: show_cocktail_details(c))
+    cocktail_button.grid(row=i // 2, column=i % 2, padx=10, pady=10)
+    cocktail_buttons[cocktail] = cocktail_button
+
+# Function to take the image off a button whose image was dropped from the cache
+def drop_button_image(cocktail):
+    cocktail_buttons[cocktail].config(image='')
+    cocktail_buttons[cocktail].image = None
+
+# Images of the cocktail buttons, the most popular ones always kept. In lean memory mode only those
+# stay by default, the others are dropped again after being shown.
+image_cache = profile['image_cache']
+if image_cache is None and profile['lean_memory']:
+    image_cache = profile['pinned_images']
+thumbnail_cache = thumbnails.ThumbnailCache(image_cache, drop_button_image)
+thumbnail_cache.pin(menu_order[:profile['pinned_images']])
+
+# Function to put a cocktail's image on its button, loading it if it is not in the cache
+def show_button_image(cocktail):
+    image = thumbnail_cache.get(cocktail)
+    if image is None:
+        image = load_cocktail_image(cocktail)
+        if image is None:
+            return
+        thumbnail_cache.put(cocktail, image)
+    cocktail_buttons[cocktail].config(image=image)
+    cocktail_buttons[cocktail].image = image  # Store the PhotoImage object
+
+# Function to load the pinned cocktail images in slices of about 20 ms, so the window stays responsive
+def load_images(pending):
+    deadline = time.perf_counter() + 0.02
+    for cocktail in pending:
+        show_button_image(cocktail)
+        if time.perf_counter() > deadline:
+            root.after(1, load_images, pending)
+            return
+    deferred_startup_done('images')
+    root.after(100, load_rare_images, iter(menu_order[profile['pinned_images']:]))
+
+# Function to load the images of the less ordered cocktails one at a time in idle gaps, while the cache has room
+def load_rare_images(pending):
+    cocktail = next(pending, None)
+    if cocktail is None or not thumbnail_cache.has_room():
+        return
+    show_button_image(cocktail)
+    root.after(100, root.after_idle, load_rare_images, pending)
 
 # Configure grid weights for frame resizing
 root.grid_rowconfigure(0, weight=1)
@@ -225,8 +613,77 @@ root.grid_columnconfigure(0, weight=1)
 root.grid_columnconfigure(1, weight=0)
 root.grid_columnconfigure(2, weight=1)
 
+# Function to feed the controller watchdog from the Tk thread
+def send_heartbeat():
+    if pump_client is None:
+        return
+    try:
+        pump_client.heartbeat(heartbeat_timeout)
+    except OSError:
+        return  # The reader thread reports the controller gone
+    root.after(heartbeat_interval_ms, send_heartbeat)
+
+# Serve metrics locally if a port is configured
+if os.environ.get('CBR_METRICS_PORT'):
+    metrics.start_http_server(int(os.environ['CBR_METRICS_PORT']))
+
+# Function to record the first frame drawn by mainloop
+def first_frame():
+    startup_metric.set(startup_profile.first_frame(), 'first_frame_total')
+
+# Startup work still running after the first frame
+deferred_startup = {'images', 'controller'}
+
+# Function to record the end of deferred startup work, the window is fully loaded once all of it is done
+def deferred_startup_done(name):
+    startup_metric.set(time.perf_counter() - startup_profile.began, f"{name}_ready")
+    deferred_startup.discard(name)
+    if not deferred_startup:
+        startup_metric.set(startup_profile.loaded(), 'loaded_total')
+
+# Function to finish startup once the controller is connected, checked from the Tk loop
+def wait_for_controller():
+    global pump_client, eta_matrix
+    if controller_connection.is_alive():
+        root.after(20, wait_for_controller)
+        return
+    pump_client = controller_connection.result()
+    deferred_startup_done('controller')
+    pump_client.add_listener(pump_events.put)
+    for button in (start_button, refill_button, clean_button):
+        button.config(state=tk.NORMAL)
+    if selected_cocktail.get():
+        order_button.config(state=tk.NORMAL)
+
+    # Follow the pump controller from the Tk thread
+    root.after(50, poll_pump_events)
+    send_heartbeat()
+    pump_client.request_inventory()
+    pump_client.request_recovered()
+
+    # ETAs on the cocktail buttons, recomputed for the whole menu on every queue, inventory or glasses change
+    import menu_matrix
+    eta_matrix = menu_matrix.MenuMatrix(recipes, {motor: flow_rate for motor in motor_mapping},
+                                        strategies.get(profile['strategy'], profile['max_pumps']), bottles)
+    update_menu_etas()
+
+    # Take orders from phones and the POS on the same controller queue if a port is configured
+    if os.environ.get('CBR_API_PORT'):
+        import order_api
+        order_api.start_in_thread(pump_client, recipes, flow_rate, int(os.environ['CBR_API_PORT']), os.environ.get('CBR_API_HOST', '127.0.0.1'),
+                                  strategy=strategies.get(profile['strategy'], profile['max_pumps']), bottles=bottles)
+
+root.after_idle(first_frame)
+root.after_idle(load_images, iter(menu_order[:profile['pinned_images']]))
+root.after_idle(wait_for_controller)
+
 # Start the tkinter main loop
 root.mainloop()
 
-# Cleanup GPIO
-GPIO.cleanup()
+# Stop the pumps and disconnect from the controller, unless it already went away
+pump_client = controller_connection.result()
+try:
+    pump_client.stop()
+except OSError:
+    pass
+pump_client.close()
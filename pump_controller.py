@@ -0,0 +1,1156 @@
+#!/usr/bin/python3
+# -*- coding: utf8 -*-
+
+# Pump controller running in its own process.
+#
+# The controller owns the relay pins and is the only place where pump timing
+# happens, so a slow Tk frame or image decode in the GUI can no longer delay a
+# relay shut-off. Clients talk to it over a local socket with one JSON message
+# per line:
+#
+#   {"op": "pour", "order": "gui-1", "label": "Mojito", "glasses": 2,
+#    "pours": [{"motor": 1, "volume": 30}, {"ingredient": "Lime", "volume": 15}]}
+#   {"op": "hb", "timeout": 1.0}
+#   {"op": "refill", "motor": 3, "ingredient": "Rum", "capacity": 750}
+#   {"op": "inventory"}
+#   {"op": "stop"}
+#   {"op": "state"}
+#   {"op": "recovered"} / {"op": "resume", "job": 1} / {"op": "discard", "job": 1}
+#   {"op": "clean", "motors": [3], "volume": 50, "program": "clean"} / {"op": "cancel_clean"}
+#
+# and receive events such as "queued", "started", "relay", "done" and "state"
+# (PumpClient adds a final "disconnected" when the controller goes away).
+# A message with a missing field or a field of the wrong type is answered
+# with an "error" event and changes nothing.
+# Pour volumes are per glass. A pour by ingredient is split over every motor
+# the bottle map (--bottles, and ingredients recorded with refills) has it on
+# and that holds enough of it. Queued orders with identical pours are
+# coalesced into one multi-glass run, each order still gets its own
+# "started" and "done" events.
+#
+# The controller listens on a Unix socket path, or on host:port over TCP so a
+# fleet coordinator (fleet.py) on another Pi can reach it. Over TCP the host
+# must be given and a shared token is required (--token-file): every client
+# first sends {"op": "auth", "token": "..."}, anything else before it gets an
+# error and the connection closed, and no events are sent to it until then.
+#
+# A client that sends heartbeats arms the watchdog: if it misses its deadline,
+# or disconnects without {"op": "disarm"}, every relay is forced off and the
+# queue is dropped.
+#
+# Orders and relay switches are written to a crash-safe journal (journal.py).
+# After a power cut the controller holds the jobs it did not finish, with the
+# volume still missing per motor, until a client resumes or discards them.
+#
+# Cleaning and flush programs (maintenance.py) run per motor while the pumps
+# are idle and are switched off the moment an order comes in.
+#
+# With --prime-volume a line idle for --drain-seconds counts as drained and
+# its next pour runs longer to fill it first. Lines the order history says
+# are about to be needed are primed in idle gaps instead, within a waste
+# budget of --prime-budget mL per hour (priming.py).
+#
+# --strategy picks how the pours of an order are laid out in time: all pumps
+# at once (concurrent), one after the other (sequential), all finishing
+# together (finish_together) or at most --max-pumps at once (capped), see
+# cbr/strategies.py. The "started" event carries the ETA of the plan.
+
+import argparse
+import collections
+import heapq
+import hmac
+import inventory
+import journal
+import json
+import maintenance
+import math
+import os
+import priming
+import selectors
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import menu
+import metrics
+import relay_watchdog
+import telemetry
+import thermal
+from cbr import strategies
+
+# Default path of the socket shared by the controller and its clients
+socket_path = '/tmp/cbr-pump.sock'
+
+# Function to resolve a controller address, a socket path or host:port, to (family, address)
+def socket_address(address):
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and not address.startswith('/'):
+        if not host:
+            raise ValueError(f"Address {address} has no host, give the one to use such as 10.0.0.11:{port}")
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+# Exception raised for a client message with a missing field or a field of the wrong type
+class BadMessage(ValueError):
+    pass
+
+# Marks a message field without a default
+required = object()
+
+# Function to read a field of a client message as kind (int, float or str), default when it is
+# absent or null. Raises BadMessage when it is required and absent, or not a valid kind.
+def message_field(message, key, kind=float, default=required):
+    value = message.get(key)
+    if value is None:
+        if default is required:
+            raise BadMessage(f"Missing {key}")
+        return default
+    if kind is str:
+        if not isinstance(value, str):
+            raise BadMessage(f"{key} must be a string, not {value!r}")
+        return value
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise BadMessage(f"{key} must be a number, not {value!r}")
+    try:
+        number = float(value)
+    except ValueError:
+        raise BadMessage(f"{key} must be a number, not {value!r}")
+    if not math.isfinite(number) or (kind is int and not number.is_integer()):
+        raise BadMessage(f"{key} must be {'a whole' if kind is int else 'a finite'} number, not {value!r}")
+    return int(number) if kind is int else number
+
+# Function to read a list field of a client message, default when it is absent or null
+def message_list(message, key, default=required):
+    value = message.get(key)
+    if value is None:
+        if default is required:
+            raise BadMessage(f"Missing {key}")
+        return default
+    if not isinstance(value, list):
+        raise BadMessage(f"{key} must be a list, not {value!r}")
+    return value
+
+# Function to read the shared token clients must send before any other message
+def read_token(path):
+    with open(path) as file:
+        token = file.read().strip()
+    if not token:
+        raise ValueError(f"Token file {path} is empty")
+    return token
+
+# Class holding one queued pour job
+class PourJob:
+    def __init__(self, job_id, order, label, pours, conn, glasses=1):
+        self.job_id = job_id
+        self.order = order
+        self.label = label
+        self.per_glass = pours  # Pours for one glass
+        self.orders = [order]  # Every order poured by this job once batches are merged
+        self.glasses = glasses
+        self.order_glasses = {order: glasses}  # Glasses of every order, for the order log
+        self.conn = conn
+        self.queued_at = time.monotonic()
+        self.started_at = None
+        self.bypassed = 0  # Times a later job was started first to let a hot pump cool
+        self.scale()
+        self.remaining = len(self.pours)
+
+    # Function to compute the pours for every glass of the job
+    def scale(self):
+        self.pours = [dict(pour, volume=pour['volume'] * self.glasses) for pour in self.per_glass]
+
+    # Function to identify jobs that can be poured together
+    def batch_key(self):
+        return tuple(sorted((pour['motor'], pour['volume'], pour['offset']) for pour in self.per_glass))
+
+    # Function to fold another job into this one
+    def merge(self, other):
+        self.orders += other.orders
+        self.glasses += other.glasses
+        self.order_glasses.update(other.order_glasses)
+        self.queued_at = min(self.queued_at, other.queued_at)
+        self.scale()
+
+# Class running the relays from a single timing loop
+class PumpController:
+    def __init__(self, gpio, relay_pins, flow_rate, loop_timeout=0.5, hw_watchdog=None, telemetry_log=None, metrics_port=None,
+                 flow_rates=None, inventory_path=None, max_burst=120.0, cool_rate=0.5, max_batch=4, journal_path=None, strategy='concurrent', max_pumps=None, bottles=None,
+                 order_log=None, prime_volume=0.0, drain_seconds=300.0, prime_budget=0.0, demand_half_life=600.0, idle_delay=2.0,
+                 token=None):
+        self.gpio = gpio
+        self.relay_pins = relay_pins
+        self.flow_rate = flow_rate
+
+        # Map the index of relay_pins with the pump motor number
+        self.motor_mapping = {i + 1: pin for i, pin in enumerate(relay_pins)}
+
+        # Calibrated flow rate of every motor in mL/second, flow_rate where not calibrated
+        self.flow_rates = {motor: (flow_rates or {}).get(motor, flow_rate) for motor in self.motor_mapping}
+
+        # Bottle levels, decremented after every pour and saved while the pumps are idle
+        self.inventory = inventory.Inventory(inventory_path)
+
+        # Ingredient loaded on each motor, for pours by ingredient name
+        self.bottles = dict(bottles or {})
+
+        # Duty cycle and heat of every pump, pours are split with rests to stay within budget
+        self.thermal = thermal.PumpThermal(self.motor_mapping, max_burst, cool_rate)
+        self.lookahead = 3  # Queued jobs considered when the next job would wait for a hot pump
+        self.max_bypass = 2  # Times a job may be overtaken that way
+        self.max_batch = max_batch  # Most glasses poured in one coalesced run
+
+        # How the pours of a job are laid out in time, see cbr/strategies.py
+        self.strategy = strategies.get(strategy, max_pumps)
+
+        self.jobs = collections.deque()  # Jobs waiting for the pumps
+        self.current = None  # Job being poured
+        self.timers = []  # Heap of (deadline, seq, motor, seconds), seconds is None for "off"
+        self.timer_seq = 0
+        self.relay_on_times = {}  # Motor number -> (monotonic time the relay was switched on, requested seconds, job id, order ids)
+        self.next_job_id = 1
+
+        self.selector = selectors.DefaultSelector()
+        self.buffers = {}  # Client socket -> bytes received but not yet parsed
+        self.token = token  # Shared token clients must send first, None to trust every client of the socket
+        self.authenticated = set()  # Client sockets that sent the token, the only ones events are sent to
+        self.running = True
+
+        # Heartbeats from the GUI and the watchdog thread checking this loop
+        self.heartbeat = relay_watchdog.HeartbeatWatchdog()
+        self.heartbeat_conn = None  # Client that armed the heartbeat watchdog
+        self.loop_watchdog = relay_watchdog.LoopWatchdog(loop_timeout, self.loop_stalled, hw_watchdog)
+        self.loop_stall_pending = False
+
+        # Every finished pour goes into the ring, a background thread writes it to the log
+        self.pour_ring = telemetry.PourRing()
+        self.telemetry = telemetry.TelemetryFlusher(self.pour_ring, telemetry_log) if telemetry_log else None
+
+        # Write-ahead journal of jobs and relay switches, and the jobs recovered from it after a crash
+        self.journal = journal.OrderJournal(journal_path) if journal_path else None
+        self.held = {}  # Job id -> recovered job waiting to be resumed or discarded
+        self.journal_limit = 256 * 1024  # Bytes after which the journal is compacted while idle
+
+        # Cleaning and flush runs slotted into idle time, preempted by orders
+        self.maintenance = maintenance.MaintenanceScheduler(idle_delay)
+
+        # Which lines hold liquid, and the lines to prime ahead of expected orders
+        self.priming = None
+        if prime_volume > 0:
+            self.priming = priming.LinePriming(self.motor_mapping, prime_volume, drain_seconds, prime_budget, demand_half_life)
+            if order_log:
+                # The hours of the day seen just before the last rotation still count
+                records = list(journal.read_records(f"{order_log}.1")) + list(journal.read_records(order_log))
+                self.priming.load_history(records)
+
+        # History of finished orders, one JSON line each, for the menu and bottle layout tools, rotated at 1 MB
+        self.order_log = journal.OrderJournal(order_log, interval=1.0, max_bytes=1024 * 1024) if order_log else None
+
+        # Metrics updated from the timing loop and served on metrics_port if given
+        self.metrics_port = metrics_port
+        self.started_at = time.monotonic()
+        self.jobs_metric = metrics.Counter('cbr_jobs_total', "Pour jobs finished by the controller")
+        self.pours_metric = metrics.Counter('cbr_pours_total', "Pours finished per motor", ['motor'])
+        self.on_seconds_metric = metrics.Counter('cbr_pump_on_seconds_total', "Seconds each pump relay has been on", ['motor'])
+        self.queue_metric = metrics.Gauge('cbr_queue_depth', "Pour jobs waiting for the pumps")
+        self.glasses_metric = metrics.Histogram('cbr_glasses_per_run', "Glasses poured by each run after coalescing", [1, 2, 3, 4, 6, 8])
+        self.wait_metric = metrics.Histogram('cbr_queue_wait_seconds', "Time pour jobs spent queued before the pumps started",
+                                             [0.1, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300])
+        self.cooldown_metric = metrics.Counter('cbr_pump_cooldown_seconds_total', "Rest inserted to keep pumps within their heat budget", ['motor'])
+        self.maintenance_metric = metrics.Counter('cbr_maintenance_seconds_total', "Seconds each pump ran cleaning or flush programs", ['motor', 'program'])
+        self.preempted_metric = metrics.Counter('cbr_maintenance_preempted_total', "Maintenance runs switched off for an order")
+        self.cold_metric = metrics.Counter('cbr_cold_pours_total', "Pours that had to fill a drained line first", ['motor'])
+        self.prime_waste_metric = metrics.Counter('cbr_prime_waste_ml_total', "mL primed into lines that drained before an order used them")
+        metrics.Gauge('cbr_motor_duty_cycle', "Fraction of the last 10 minutes each pump has been on", ['motor'], self.duty_cycles)
+        metrics.Gauge('cbr_motor_heat', "Heat of each pump as a fraction of its budget", ['motor'], self.heat_levels)
+
+    # Function to initialize GPIO setup with every relay off
+    def setup_gpio(self):
+        self.gpio.setmode(self.gpio.BOARD)
+        self.gpio.setwarnings(False)
+        for pin in self.relay_pins:
+            self.gpio.setup(pin, self.gpio.OUT)
+            self.gpio.output(pin, self.gpio.HIGH)
+
+    # Function to force every relay off and forget pending relay timers
+    def all_off(self):
+        for pin in self.relay_pins:
+            self.gpio.output(pin, self.gpio.HIGH)
+        off_time = time.monotonic()
+        # Pours cut short still go into telemetry with their actual duration
+        for motor, (on_time, seconds, job_id, orders) in self.relay_on_times.items():
+            self.thermal.relay_off(motor, off_time)
+            self.pour_ring.record(orders, motor, seconds, on_time, off_time)
+            self.on_seconds_metric.inc(off_time - on_time, str(motor))
+            self.inventory.dispense(motor, (off_time - on_time) * self.flow_rates[motor], off_time)
+            self.line_used(motor, off_time)
+            self.log({'r': 'off', 'job': job_id, 'motor': motor, 't': off_time})
+        self.timers = []
+        self.relay_on_times.clear()
+        self.stop_maintenance(off_time)
+
+    # Function to add a record to the journal, if there is one
+    def log(self, record):
+        if self.journal is not None:
+            self.journal.append(record)
+
+    # Function to send an event to one client, or to all clients when conn is None
+    def publish(self, event, conn=None):
+        data = (json.dumps(event) + '\n').encode()
+        targets = [conn] if conn is not None else list(self.authenticated)
+        for client in targets:
+            try:
+                client.sendall(data)
+            except OSError:
+                self.drop_client(client)
+
+    # Function to compute the rolling duty cycle of every motor for the metrics endpoint.
+    # The gauges run on the metrics HTTP thread while the loop switches relays, see PumpThermal.duty_cycle.
+    def duty_cycles(self):
+        now = time.monotonic()
+        return {(str(motor),): self.thermal.duty_cycle(motor, now) for motor in self.motor_mapping}
+
+    # Function to compute the heat of every motor for the metrics endpoint
+    def heat_levels(self):
+        now = time.monotonic()
+        return {(str(motor),): self.thermal.heat_at(motor, now) / self.thermal.max_burst for motor in self.motor_mapping}
+
+    # Function to add a relay timer to the heap
+    def push_timer(self, deadline, motor, seconds):
+        self.timer_seq += 1
+        heapq.heappush(self.timers, (deadline, self.timer_seq, motor, seconds))
+
+    # Function to map every motor to the ingredient behind it, refills naming an ingredient take precedence
+    def bottle_map(self):
+        bottles = dict(self.bottles)
+        for motor, bottle in self.inventory.bottles.items():
+            if bottle.get('ingredient'):
+                bottles[motor] = bottle['ingredient']
+        return {motor: ingredient for motor, ingredient in bottles.items() if motor in self.motor_mapping}
+
+    # Function to queue a pour requested by a client, returning the job or None if it was refused
+    def enqueue(self, message, conn, orders=None):
+        try:
+            glasses = message_field(message, 'glasses', int, 1)
+        except BadMessage:
+            glasses = 0
+        if not 1 <= glasses <= self.max_batch:
+            self.publish({'ev': 'error', 'order': message.get('order'),
+                          'error': f"Glasses must be between 1 and {self.max_batch}, not {message.get('glasses')}"}, conn)
+            return None
+        message_field(message, 'order', str, None)
+        message_field(message, 'label', str, None)
+        pours = []
+        for pour in message_list(message, 'pours', []):
+            if not isinstance(pour, dict):
+                raise BadMessage(f"Pours must be objects, not {pour!r}")
+            volume = message_field(pour, 'volume')
+            offset = message_field(pour, 'offset', float, 0.0)
+            if volume <= 0 or offset < 0:
+                self.publish({'ev': 'error', 'order': message.get('order'),
+                              'error': f"Pour volumes must be above 0 and offsets at least 0, not {volume} mL at {offset} s"}, conn)
+                return None
+            if 'ingredient' in pour:
+                ingredient = message_field(pour, 'ingredient', str)
+                # Share the ingredient between the motors holding enough of it
+                bottles = self.bottle_map()
+                try:
+                    split = menu.split_pours([(ingredient, volume)], bottles, self.flow_rates,
+                                             lambda motor, volume: self.inventory.has(motor, volume * glasses + self.pending_volume(motor)))
+                except KeyError:
+                    error = (f"Not enough {ingredient} left for {volume * glasses} mL"
+                             if ingredient in bottles.values() else f"No motor holds {ingredient}")
+                    self.publish({'ev': 'error', 'order': message.get('order'), 'ingredient': ingredient, 'error': error}, conn)
+                    return None
+                pours += [{'motor': motor, 'volume': volume, 'offset': offset} for motor, volume in split]
+                continue
+            motor = message_field(pour, 'motor', int)
+            if motor not in self.motor_mapping:
+                self.publish({'ev': 'error', 'order': message.get('order'), 'error': f"Unknown motor {motor}"}, conn)
+                return None
+            pours.append({'motor': motor, 'volume': volume, 'offset': offset})
+
+        # A motor runs once per job, relay state is kept per motor: pours on the same motor, say an
+        # ingredient split onto it and a pour naming it, are merged from the earliest offset
+        merged = {}
+        for pour in pours:
+            if pour['motor'] in merged:
+                merged[pour['motor']]['volume'] += pour['volume']
+                merged[pour['motor']]['offset'] = min(merged[pour['motor']]['offset'], pour['offset'])
+            else:
+                merged[pour['motor']] = dict(pour)
+        pours = list(merged.values())
+
+        # Refuse pours the bottles cannot finish, counting what queued jobs will take first
+        for pour in pours:
+            if self.maintenance.blocked(pour['motor']):
+                self.publish({'ev': 'error', 'order': message.get('order'), 'motor': pour['motor'],
+                              'error': f"Motor {pour['motor']} is being cleaned"}, conn)
+                return None
+            needed = pour['volume'] * glasses + self.pending_volume(pour['motor'])
+            if not self.inventory.has(pour['motor'], needed):
+                self.publish({'ev': 'error', 'order': message.get('order'), 'motor': pour['motor'],
+                              'error': f"Not enough left behind Motor {pour['motor']} for {pour['volume'] * glasses} mL"}, conn)
+                return None
+
+        job = PourJob(self.next_job_id, message.get('order'), message.get('label'), pours, conn, glasses)
+        if orders:
+            job.orders = list(orders)
+        self.next_job_id += 1
+        self.jobs.append(job)
+        if self.priming is not None:
+            now = time.monotonic()
+            for motor in {pour['motor'] for pour in pours}:
+                self.priming.observe(motor, now)
+        self.queue_metric.set(len(self.jobs))
+        if self.maintenance.running:
+            self.preempted_metric.inc(len(self.maintenance.running))
+            self.stop_maintenance(time.monotonic(), preempted=True)
+        self.log({'r': 'queued', 'job': job.job_id, 'orders': job.orders, 'label': job.label, 'glasses': glasses, 'pours': pours})
+        for order in job.orders:
+            self.publish({'ev': 'queued', 'order': order, 'job': job.job_id, 'depth': len(self.jobs)})
+        return job
+
+    # Function to add up the volume queued or being poured for a motor
+    def pending_volume(self, motor):
+        jobs = list(self.jobs) + ([self.current] if self.current is not None else [])
+        return sum(pour['volume'] for job in jobs for pour in job.pours if pour['motor'] == motor)
+
+    # Function to build the inventory event sent to clients
+    def inventory_event(self, levels=False):
+        now = time.monotonic()
+        event = {'ev': 'inventory', 'warnings': self.inventory.forecast(now)}
+        if levels:
+            event['levels'] = self.inventory.snapshot(now)
+            event['flow_rates'] = [{'motor': motor, 'rate': rate} for motor, rate in sorted(self.flow_rates.items())]
+        return event
+
+    # Function to split the pours of a job into relay segments within the pumps' heat budget.
+    # Returns the segments as (motor, offset, seconds), the ETA and the rest added per motor.
+    def plan_job(self, job, now):
+        segments = []
+        rests = {}
+        eta = 0
+        # Run times come from the calibrated flow rates, the strategy adds to the offset asked for by the client.
+        # The first pour through a drained line also fills it.
+        volumes = []
+        for pour in job.pours:
+            cold = self.priming is not None and not self.priming.warm(pour['motor'], now) and pour['motor'] not in (motor for motor, _ in volumes)
+            volumes.append((pour['motor'], pour['volume'] + (self.priming.prime_volume if cold else 0)))
+        runs = self.strategy.plan(volumes, self.flow_rates)
+        for pour, (motor, start, run_time) in zip(job.pours, runs):
+            start += pour['offset']
+            end = start
+            for offset, seconds in self.thermal.plan(motor, run_time, now, start):
+                segments.append((motor, offset, seconds))
+                end = offset + seconds
+            eta = max(eta, end)
+            if end - start - run_time > 1e-9:
+                rests[motor] = end - start - run_time
+        return segments, eta, rests
+
+    # Function to pick the next job, letting a job that needs no cooling overtake one that does
+    def pick_next_job(self, now):
+        head = self.jobs[0]
+        if head.bypassed < self.max_bypass and self.plan_job(head, now)[2]:
+            for job in list(self.jobs)[1:self.lookahead]:
+                if not self.plan_job(job, now)[2]:
+                    head.bypassed += 1
+                    self.jobs.remove(job)
+                    return job
+        return self.jobs.popleft()
+
+    # Function to start the next queued job when the pumps are free
+    def start_next_job(self, now):
+        if self.current is not None or not self.jobs:
+            return
+        job = self.pick_next_job(now)
+
+        # Coalesce queued jobs with the same pours into one multi-glass run
+        merged = []
+        for other in list(self.jobs):
+            if other.batch_key() == job.batch_key() and job.glasses + other.glasses <= self.max_batch:
+                self.jobs.remove(other)
+                job.merge(other)
+                merged.append(other.job_id)
+        self.glasses_metric.observe(job.glasses)
+        # Drained lines are filled first, journaled so a recovered job does not count the fill as poured
+        cold = sorted({pour['motor'] for pour in job.pours if self.priming is not None and not self.priming.warm(pour['motor'], now)})
+        self.log({'r': 'start', 'job': job.job_id, 'merged': merged,
+                  'primed': [{'motor': motor, 'volume': self.priming.prime_volume} for motor in cold]})
+
+        job.started_at = now
+        self.current = job
+        self.queue_metric.set(len(self.jobs))
+        self.wait_metric.observe(now - job.queued_at)
+
+        segments, eta, rests = self.plan_job(job, now)
+        job.remaining = len(segments)
+        for motor, offset, seconds in segments:
+            self.push_timer(now + offset, motor, seconds)
+        for motor, rest in rests.items():
+            self.cooldown_metric.inc(rest, str(motor))
+        for motor in cold:
+            self.cold_metric.inc(1, str(motor))
+
+        for order in job.orders:
+            self.publish({'ev': 'started', 'order': order, 'job': job.job_id, 't': now, 'eta': eta, 'glasses': job.glasses,
+                          'cooldown': {str(motor): rest for motor, rest in rests.items()}, 'cold': cold, 'depth': len(self.jobs)})
+        if job.remaining == 0:
+            self.finish_job(now)
+
+    # Function to close the current job once its last relay is off
+    def finish_job(self, now):
+        job = self.current
+        self.current = None
+        self.jobs_metric.inc()
+        self.log({'r': 'done', 'job': job.job_id})
+        if self.order_log is not None:
+            for order in job.orders:
+                self.order_log.append({'r': 'order', 't': time.time(), 'order': order, 'label': job.label,
+                                       'glasses': job.order_glasses.get(order, 1), 'wait': job.started_at - job.queued_at,
+                                       'elapsed': now - job.started_at, 'pours': job.per_glass})
+        for order in job.orders:
+            self.publish({'ev': 'done', 'order': order, 'job': job.job_id, 't': now, 'elapsed': now - job.started_at,
+                          'glasses': job.glasses})
+        self.publish(self.inventory_event())
+
+    # Function to switch the relays whose deadline has passed
+    def fire_timers(self):
+        now = time.monotonic()
+        while self.timers and self.timers[0][0] <= now:
+            _, _, motor, seconds = heapq.heappop(self.timers)
+            pin = self.motor_mapping[motor]
+            cap = getattr(self.strategy, 'max_pumps', None)
+            if seconds is not None and cap is not None and len(self.relay_on_times) >= cap:
+                # The pump this run follows on its lane is switched off a little late, wait for a free slot
+                self.push_timer(min(deadline for deadline, _, _, off in self.timers if off is None), motor, seconds)
+                continue
+            if seconds is not None:
+                self.gpio.output(pin, self.gpio.LOW)  # Turn on the motor
+                on_time = time.monotonic()
+                self.thermal.relay_on(motor, on_time)
+                self.relay_on_times[motor] = (on_time, seconds, self.current.job_id, self.current.orders)
+                self.push_timer(on_time + seconds, motor, None)
+                self.log({'r': 'on', 'job': self.current.job_id, 'motor': motor, 't': on_time, 's': seconds})
+                self.publish({'ev': 'relay', 'order': self.current.order, 'orders': self.current.orders, 'motor': motor, 'on': True, 't': on_time})
+            else:
+                self.gpio.output(pin, self.gpio.HIGH)  # Turn off the motor
+                off_time = time.monotonic()
+                on_time, requested, job_id, orders = self.relay_on_times.pop(motor)
+                self.thermal.relay_off(motor, off_time)
+                self.pour_ring.record(orders, motor, requested, on_time, off_time)
+                self.pours_metric.inc(1, str(motor))
+                self.on_seconds_metric.inc(off_time - on_time, str(motor))
+                self.inventory.dispense(motor, (off_time - on_time) * self.flow_rates[motor], off_time)
+                self.line_used(motor, off_time)
+                self.log({'r': 'off', 'job': job_id, 'motor': motor, 't': off_time})
+                self.publish({'ev': 'relay', 'order': self.current.order if self.current is not None else None,
+                              'orders': self.current.orders if self.current is not None else [], 'motor': motor, 'on': False, 't': off_time, 'elapsed': off_time - on_time})
+                if self.current is not None:
+                    self.current.remaining -= 1
+                    if self.current.remaining == 0:
+                        self.finish_job(off_time)
+            now = time.monotonic()
+        self.start_next_job(now)
+        self.run_maintenance(now)
+        if self.journal is not None:
+            self.journal.ticking = bool(self.relay_on_times)
+
+    # Function to start and end cleaning and flush runs while no order needs the pumps
+    def run_maintenance(self, now):
+        self.stop_maintenance(now, expired_only=True)
+        idle = self.current is None and not self.jobs
+        self.maintenance.set_idle(idle, now)
+        if self.priming is not None:
+            self.prime_waste_metric.inc(self.priming.drained(now))
+            if idle:
+                # Queue primes for the lines most likely needed next, the budget pays for those already queued first
+                queued = sum(1 for program, _ in self.maintenance.pending.values() if program == 'prime')
+                for motor in self.priming.candidates(now, self.maintenance.pending, queued):
+                    self.maintenance.add(motor, 'prime', self.priming.prime_volume / self.flow_rates[motor])
+
+        # Function to give how long a pump may run now without a rest, the rest of the program waits for it to cool
+        def room(motor, seconds):
+            return next((length for offset, length in self.thermal.plan(motor, seconds, now) if offset <= 0), 0)
+
+        for motor, program, seconds in self.maintenance.due(now, room, getattr(self.strategy, 'max_pumps', None)):
+            self.gpio.output(self.motor_mapping[motor], self.gpio.LOW)
+            self.thermal.relay_on(motor, now)
+            self.publish({'ev': 'maintenance', 'motor': motor, 'program': program, 'state': 'running', 'seconds': seconds, 't': now})
+
+    # Function to switch off maintenance runs, the finished ones or all of them when preempted or stopped
+    def stop_maintenance(self, now, expired_only=False, preempted=False):
+        for motor, program, ran, left in self.maintenance.stop(now, expired_only):
+            self.gpio.output(self.motor_mapping[motor], self.gpio.HIGH)
+            self.thermal.relay_off(motor, now)
+            self.on_seconds_metric.inc(ran, str(motor))
+            self.maintenance_metric.inc(ran, str(motor), program)
+            if not maintenance.programs[program]:
+                self.inventory.dispense(motor, ran * self.flow_rates[motor], now)
+            if self.priming is not None:
+                if maintenance.programs[program]:
+                    self.priming.emptied(motor)
+                elif program != 'prime' or left <= 0:
+                    self.priming.filled(motor, now, primed=program == 'prime')
+            state = 'done' if left <= 0 else 'paused' if preempted else 'waiting'
+            self.publish({'ev': 'maintenance', 'motor': motor, 'program': program, 'state': state, 'seconds': left, 't': now})
+
+    # Function to record an order's liquid going through a line, a prime still queued for it is no longer needed
+    def line_used(self, motor, now):
+        if self.priming is not None:
+            self.priming.used(motor, now)
+            self.maintenance.cancel([motor], 'prime')
+
+    # Function to read the "motors" list of a client message, None when absent or empty
+    def message_motors(self, message):
+        motors = [message_field({'motor': motor}, 'motor', int) for motor in message_list(message, 'motors', [])]
+        unknown = [motor for motor in motors if motor not in self.motor_mapping]
+        if unknown:
+            raise BadMessage(f"Unknown motors {unknown}")
+        return motors or None
+
+    # Function to queue a cleaning or flush program, volume mL through each motor
+    def clean(self, message, conn):
+        program = message_field(message, 'program', str, 'clean')
+        motors = self.message_motors(message) or list(self.motor_mapping)
+        volume = message_field(message, 'volume', float, 50.0)
+        if program not in maintenance.programs or volume <= 0:
+            self.publish({'ev': 'error', 'error': f"Cannot run {program} of {volume} mL on motors {motors}"}, conn)
+            return
+        for motor in motors:
+            self.maintenance.add(motor, program, volume / self.flow_rates[motor])
+        self.publish({'ev': 'maintenance', 'state': 'queued', 'queue': self.maintenance.snapshot()})
+
+    # Function to drop cleaning and flush programs, switching off the ones running
+    def cancel_clean(self, motors=None):
+        self.stop_maintenance(time.monotonic())
+        self.maintenance.cancel(motors)
+        self.publish({'ev': 'maintenance', 'state': 'cancelled', 'queue': self.maintenance.snapshot()})
+
+    # Function to switch every pump off and drop the queue, returning the cancelled orders
+    def cancel_all(self):
+        self.all_off()
+        self.maintenance.cancel()
+        cancelled = [order for job in self.jobs for order in job.orders]
+        job_ids = [job.job_id for job in self.jobs]
+        if self.current is not None:
+            cancelled = self.current.orders + cancelled
+            job_ids.append(self.current.job_id)
+        if job_ids:
+            self.log({'r': 'cancel', 'jobs': job_ids})
+        self.jobs.clear()
+        self.current = None
+        self.queue_metric.set(0)
+        return cancelled
+
+    # Function to stop every pump and drop the queue
+    def stop(self):
+        cancelled = self.cancel_all()
+        self.publish({'ev': 'stopped', 'cancelled': cancelled})
+
+    # Function to fail safe: every relay off, queue dropped, clients told why
+    def fail_safe(self, reason):
+        cancelled = self.cancel_all()
+        self.heartbeat.disarm()
+        self.heartbeat_conn = None
+        print(f"Watchdog: {reason}, all relays forced off")
+        self.publish({'ev': 'watchdog', 'reason': reason, 'cancelled': cancelled})
+
+    # Function called from the watchdog thread when this loop stops running.
+    # It switches the relays off directly, the loop drops its jobs once it resumes.
+    def loop_stalled(self):
+        for pin in self.relay_pins:
+            self.gpio.output(pin, self.gpio.HIGH)
+        self.loop_stall_pending = True
+
+    # Function to hold the jobs a crash left unfinished, with the volume each motor still has to pour
+    def recover(self):
+        for job in journal.replay(self.journal.path):
+            pours = []
+            for motor, volume in sorted(job['volumes'].items()):
+                # The run first filled a drained line, only what came after it reached the glass
+                poured = job['ran'].get(motor, 0.0) * self.flow_rates.get(motor, self.flow_rate) - job['primed'].get(motor, 0.0)
+                missing = volume - max(0.0, poured)
+                if motor in self.motor_mapping and missing > 0.05:
+                    pours.append({'motor': motor, 'volume': round(missing, 2)})
+            if pours:
+                self.held[self.next_job_id] = {'job': self.next_job_id, 'orders': job['orders'], 'label': job['label'],
+                                               'glasses': job['glasses'], 'pours': pours, 'partial': bool(job['ran'])}
+                self.next_job_id += 1
+        # Job ids restart with the process, so the journal starts over with just the held jobs
+        self.journal.checkpoint(self.held_records())
+        if self.held:
+            print(f"Recovered {len(self.held)} unfinished orders from the journal")
+
+    # Function to describe the held jobs as journal records
+    def held_records(self):
+        return [{'r': 'queued', 'job': held['job'], 'orders': held['orders'], 'label': held['label'], 'glasses': held['glasses'],
+                 'pours': held['pours'], 'scaled': True, 'started': held['partial']} for held in self.held.values()]
+
+    # Function to queue the missing pours of a recovered job
+    def resume(self, job_id, conn):
+        held = self.held.get(job_id)
+        if held is None:
+            self.publish({'ev': 'error', 'error': f"No recovered job {job_id}"}, conn)
+            return
+        message = {'order': held['orders'][0], 'label': held['label'], 'pours': held['pours']}
+        if self.enqueue(message, conn, held['orders']) is not None:
+            del self.held[job_id]
+            self.log({'r': 'discard', 'job': job_id})
+
+    # Function to drop a recovered job without pouring it
+    def discard(self, job_id):
+        if self.held.pop(job_id, None) is not None:
+            self.log({'r': 'discard', 'job': job_id})
+
+    # Function to build the event listing the recovered jobs
+    def recovered_event(self):
+        return {'ev': 'recovered', 'jobs': list(self.held.values())}
+
+    # Function to report the controller state
+    def state(self):
+        return {
+            'ev': 'state',
+            'current': self.current.order if self.current is not None else None,
+            'depth': len(self.jobs),
+            'relays_on': sorted(self.relay_on_times),
+            'maintenance': self.maintenance.snapshot(),
+            'thermal': self.thermal.snapshot(time.monotonic()),
+            'priming': self.priming.snapshot(time.monotonic()) if self.priming is not None else None,
+        }
+
+    # Function to handle one message from a client, a malformed one is answered with an error event
+    def handle_message(self, message, conn):
+        try:
+            self.dispatch(message, conn)
+        except BadMessage as e:
+            self.publish({'ev': 'error', 'order': message.get('order'), 'op': message.get('op'), 'error': f"Bad message: {e}"}, conn)
+
+    # Function to run the op of one client message
+    def dispatch(self, message, conn):
+        op = message.get('op')
+        if op == 'pour':
+            self.enqueue(message, conn)
+        elif op == 'hb':
+            self.heartbeat.beat(message_field(message, 'timeout', float, 1.0))
+            self.heartbeat_conn = conn
+        elif op == 'disarm':
+            self.heartbeat.disarm()
+            self.heartbeat_conn = None
+        elif op == 'refill':
+            motor = message_field(message, 'motor', int)
+            if motor not in self.motor_mapping:
+                raise BadMessage(f"Unknown motor {motor}")
+            self.inventory.refill(motor, message_field(message, 'volume', float, None), message_field(message, 'ingredient', str, None),
+                                  message_field(message, 'capacity', float, None))
+            self.publish(self.inventory_event(levels=True))
+        elif op == 'inventory':
+            self.publish(self.inventory_event(levels=True), conn)
+        elif op == 'stop':
+            self.stop()
+        elif op == 'state':
+            self.publish(self.state(), conn)
+        elif op == 'clean':
+            self.clean(message, conn)
+        elif op == 'cancel_clean':
+            self.cancel_clean(self.message_motors(message))
+        elif op == 'recovered':
+            self.publish(self.recovered_event(), conn)
+        elif op == 'resume':
+            self.resume(message_field(message, 'job', int), conn)
+            self.publish(self.recovered_event())
+        elif op == 'discard':
+            self.discard(message_field(message, 'job', int))
+            self.publish(self.recovered_event())
+        elif op == 'shutdown':
+            self.running = False
+        elif op == 'auth':
+            pass  # Already authenticated, or no token needed
+        else:
+            self.publish({'ev': 'error', 'error': f"Unknown op {op}"}, conn)
+
+    # Function to accept a new client connection
+    def accept(self, server):
+        conn, _ = server.accept()
+        conn.setblocking(False)
+        self.buffers[conn] = b''
+        if self.token is None:
+            self.authenticated.add(conn)
+        self.selector.register(conn, selectors.EVENT_READ, self.read)
+
+    # Function to check the first message of a client against the token, dropping it if wrong
+    def authenticate(self, message, conn):
+        token = message.get('token') if message.get('op') == 'auth' else None
+        if isinstance(token, str) and hmac.compare_digest(token.encode(), self.token.encode()):
+            self.authenticated.add(conn)
+            return True
+        self.publish({'ev': 'error', 'error': "Not authenticated"}, conn)
+        self.drop_client(conn)
+        return False
+
+    # Function to forget a client that went away
+    def drop_client(self, conn):
+        if conn in self.buffers:
+            del self.buffers[conn]
+            self.authenticated.discard(conn)
+            self.selector.unregister(conn)
+            conn.close()
+            # A client feeding the watchdog that vanishes counts as a missed heartbeat
+            if conn is self.heartbeat_conn:
+                self.fail_safe("heartbeat client disconnected")
+
+    # Function to read and dispatch the messages waiting on a client socket
+    def read(self, conn):
+        try:
+            data = conn.recv(65536)
+        except OSError:
+            data = b''
+        if not data:
+            self.drop_client(conn)
+            return
+        buffer = self.buffers[conn] + data
+        *lines, self.buffers[conn] = buffer.split(b'\n')
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError as e:
+                self.publish({'ev': 'error', 'error': f"Bad message: {e}"}, conn)
+                continue
+            if not isinstance(message, dict):
+                # Not a message at all: a client that has not sent the token is dropped, any other told so
+                if conn not in self.authenticated:
+                    self.publish({'ev': 'error', 'error': "Not authenticated"}, conn)
+                    self.drop_client(conn)
+                    return
+                self.publish({'ev': 'error', 'error': "Bad message: messages must be JSON objects"}, conn)
+                continue
+            if conn not in self.authenticated and not self.authenticate(message, conn):
+                return
+            try:
+                self.handle_message(message, conn)
+            except Exception as e:
+                # A message this loop did not expect must never take the relays down with it
+                traceback.print_exc()
+                self.publish({'ev': 'error', 'error': f"Could not handle message: {e!r}"}, conn)
+
+    # Function to work out how long the loop may sleep before the next deadline.
+    # The loop wakes at least four times per loop watchdog timeout to feed it.
+    def next_timeout(self):
+        deadline = time.monotonic() + self.loop_watchdog.timeout / 4
+        if self.timers and self.timers[0][0] < deadline:
+            deadline = self.timers[0][0]
+        if self.heartbeat.deadline is not None and self.heartbeat.deadline < deadline:
+            deadline = self.heartbeat.deadline
+        maintenance_deadline = self.maintenance.deadline()
+        if maintenance_deadline is not None and maintenance_deadline < deadline:
+            deadline = maintenance_deadline
+        return max(0, deadline - time.monotonic())
+
+    # Function to check both watchdogs once per loop iteration
+    def check_watchdogs(self):
+        now = time.monotonic()
+        self.loop_watchdog.last_beat = now
+        if self.loop_stall_pending:
+            self.loop_stall_pending = False
+            self.fail_safe("controller loop stalled")
+        elif self.heartbeat.expired(now):
+            self.fail_safe("heartbeat missed")
+
+    # Function to serve clients until asked to shut down
+    def serve(self, path=socket_path):
+        family, address = socket_address(path)
+        if family == socket.AF_INET and self.token is None:
+            raise ValueError(f"Listening on {path} over TCP needs a shared token, see --token-file")
+        if family == socket.AF_UNIX and os.path.exists(path):
+            os.unlink(path)
+        server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(address)
+        server.listen()
+        server.setblocking(False)
+        self.selector.register(server, selectors.EVENT_READ, self.accept)
+
+        self.setup_gpio()
+        if self.journal is not None:
+            self.recover()
+            self.journal.start()
+        if self.order_log is not None:
+            self.order_log.start()
+        self.loop_watchdog.start()
+        if self.telemetry is not None:
+            self.telemetry.start()
+        if self.metrics_port:
+            metrics.start_http_server(self.metrics_port)
+        try:
+            while self.running:
+                events = self.selector.select(self.next_timeout())
+                self.check_watchdogs()
+                self.fire_timers()
+                for key, _ in events:
+                    key.data(key.fileobj)
+                self.fire_timers()
+                # Persist bottle levels only while no pour is running
+                if self.current is None and self.inventory.dirty:
+                    self.inventory.save()
+                # Compact the journal while nothing is queued or pouring
+                if self.journal is not None and self.current is None and not self.jobs and self.journal.size() > self.journal_limit:
+                    self.journal.checkpoint(self.held_records())
+        finally:
+            # Whatever happened, the pumps must end up off
+            self.loop_watchdog.stop()
+            self.all_off()
+            if self.telemetry is not None:
+                self.telemetry.stop()
+            if self.journal is not None:
+                self.journal.stop()
+            if self.order_log is not None:
+                self.order_log.stop()
+            if self.inventory.dirty:
+                self.inventory.save()
+            for conn in list(self.buffers):
+                self.drop_client(conn)
+            self.selector.close()
+            server.close()
+            if family == socket.AF_UNIX and os.path.exists(path):
+                os.unlink(path)
+            self.gpio.cleanup()
+
+# Function to raise the scheduling priority of the controller process
+def raise_priority(priority):
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+        print(f"Pump controller running with SCHED_FIFO priority {priority}")
+    except (AttributeError, PermissionError, OSError) as e:
+        print(f"Could not raise pump controller priority: {e}")
+
+# Class used by the GUI to talk to the controller
+class PumpClient:
+    def __init__(self, path=socket_path, token=None):
+        family, address = socket_address(path)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.connect(address)
+        self.send_lock = threading.Lock()
+        if token is not None:
+            self.send(op='auth', token=token)
+        self.listeners = []  # Functions called with every event, from the reader thread
+        self.process = None  # Controller process when started by this client
+        self.reader = threading.Thread(target=self.read_events, daemon=True)
+        self.reader.start()
+
+    # Function to register a callback for controller events
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    # Function to send one message to the controller
+    def send(self, **message):
+        data = (json.dumps(message) + '\n').encode()
+        with self.send_lock:
+            self.sock.sendall(data)
+
+    # Function to ask the controller to pour a list of (motor, volume) pairs into each of the glasses,
+    # an ingredient name instead of a motor lets the controller pick the motors from its bottle map
+    def pour(self, order, pours, label=None, glasses=1):
+        self.send(op='pour', order=order, label=label, glasses=glasses,
+                  pours=[{'ingredient' if isinstance(motor, str) else 'motor': motor, 'volume': volume} for motor, volume in pours])
+
+    # Function to stop every pump
+    def stop(self):
+        self.send(op='stop')
+
+    # Function to record a bottle refill, to full capacity unless a volume is given
+    def refill(self, motor, volume=None, ingredient=None, capacity=None):
+        self.send(op='refill', motor=motor, volume=volume, ingredient=ingredient, capacity=capacity)
+
+    # Function to ask for the bottle levels, answered with an "inventory" event
+    def request_inventory(self):
+        self.send(op='inventory')
+
+    # Function to queue a cleaning ("clean", water in the line) or "flush" program of volume mL per motor, all motors by default
+    def clean(self, motors=None, volume=50, program='clean'):
+        self.send(op='clean', motors=motors, volume=volume, program=program)
+
+    # Function to drop cleaning and flush programs
+    def cancel_clean(self, motors=None):
+        self.send(op='cancel_clean', motors=motors)
+
+    # Function to ask for the jobs recovered after a crash, answered with a "recovered" event
+    def request_recovered(self):
+        self.send(op='recovered')
+
+    # Function to pour what is missing from a recovered job
+    def resume(self, job_id):
+        self.send(op='resume', job=job_id)
+
+    # Function to drop a recovered job
+    def discard(self, job_id):
+        self.send(op='discard', job=job_id)
+
+    # Function to feed the controller watchdog, relays go off if the next beat is late
+    def heartbeat(self, timeout):
+        self.send(op='hb', timeout=timeout)
+
+    # Function to read events until the controller goes away
+    def read_events(self):
+        buffer = b''
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except OSError:
+                break
+            if not data:
+                break
+            buffer += data
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                event = json.loads(line)
+                for listener in self.listeners:
+                    listener(event)
+        for listener in self.listeners:
+            listener({'ev': 'disconnected'})
+
+    # Function to disconnect, shutting the controller down if this client started it
+    def close(self):
+        try:
+            self.send(op='disarm')
+        except OSError:
+            pass
+        if self.process is not None:
+            try:
+                self.send(op='shutdown')
+            except OSError:
+                pass
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.terminate()
+        self.sock.close()
+
+# Function to connect to a running controller, or start one if there is none
+def connect_or_spawn(relay_pins, flow_rate, path=socket_path, sim=False, priority=None, hw_watchdog=None, extra_args=(), token=None):
+    try:
+        return PumpClient(path, token)
+    except OSError:
+        pass
+
+    args = [sys.executable, os.path.abspath(__file__), '--socket', path,
+            '--pins', ','.join(str(pin) for pin in relay_pins), '--flow-rate', str(flow_rate)]
+    if sim:
+        args.append('--sim')
+    if priority:
+        args += ['--priority', str(priority)]
+    if hw_watchdog:
+        args += ['--hw-watchdog', hw_watchdog]
+    args += list(extra_args)
+    process = subprocess.Popen(args)
+
+    # Wait for the controller to create its socket
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            client = PumpClient(path, token)
+            client.process = process
+            return client
+        except OSError:
+            if time.monotonic() > deadline or process.poll() is not None:
+                process.terminate()
+                raise
+            time.sleep(0.01)
+
+# Class running connect_or_spawn on a background thread, so the GUI can build its
+# window while the controller process starts and sets up the relay pins
+class BackgroundConnect(threading.Thread):
+    def __init__(self, *args, **kwargs):
+        super().__init__(daemon=True)
+        self.args = args
+        self.kwargs = kwargs
+        self.client = None
+        self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            self.client = connect_or_spawn(*self.args, **self.kwargs)
+        except Exception as e:
+            self.error = e
+
+    # Function to wait for the connection and return the client, raising if it failed
+    def result(self):
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.client
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Cocktail robot pump controller")
+    parser.add_argument('--socket', default=socket_path, help="Socket path, or host:port to listen on TCP (needs --token-file)")
+    parser.add_argument('--token-file', help="File holding the shared token clients must send first, required on TCP")
+    parser.add_argument('--pins', default='40,38,36,15,13,11,7,5,31,33', help="Relay pins in motor order")
+    parser.add_argument('--flow-rate', type=float, default=1.5, help="Pump flow rate in mL/second")
+    parser.add_argument('--priority', type=int, help="Run with SCHED_FIFO at this priority")
+    parser.add_argument('--sim', action='store_true', help="Use the simulated GPIO backend")
+    parser.add_argument('--loop-timeout', type=float, default=0.5, help="Seconds the timing loop may stall before relays are forced off")
+    parser.add_argument('--hw-watchdog', help="Hardware watchdog device to pet, e.g. /dev/watchdog")
+    parser.add_argument('--telemetry-log', default='pours.log', help="Append-only pour log, rotated at 1 MB")
+    parser.add_argument('--metrics-port', type=int, help="Serve Prometheus metrics on this local port")
+    parser.add_argument('--inventory', default='inventory.json', help="File keeping the bottle level behind every motor")
+    parser.add_argument('--journal', default='orders.journal', help="Crash-safe journal of orders and pours")
+    parser.add_argument('--order-log', default='orders.log', help="History of finished orders, one JSON line each, rotated at 1 MB")
+    parser.add_argument('--max-batch', type=int, default=4, help="Most glasses coalesced into one run")
+    parser.add_argument('--max-burst', type=float, default=120.0, help="Heat budget of each pump, see thermal.py")
+    parser.add_argument('--cool-rate', type=float, default=0.5, help="Duty cycle each pump can sustain")
+    parser.add_argument('--strategy', default='concurrent', choices=[name for name, strategy in strategies.strategies.items() if strategy.exact],
+                        help="How the pours of an order are laid out in time")
+    parser.add_argument('--max-pumps', type=int, help="Most pumps on at once with the capped strategy (default 3)")
+    parser.add_argument('--bottles', help="JSON file mapping motor numbers to the ingredient loaded on them")
+    parser.add_argument('--prime-volume', type=float, default=0.0, help="mL filling a drained line, 0 to treat lines as always primed")
+    parser.add_argument('--drain-seconds', type=float, default=300.0, help="Seconds of idle after which a line counts as drained")
+    parser.add_argument('--prime-budget', type=float, default=0.0, help="mL per hour pre-priming may waste, 0 to never prime ahead")
+    parser.add_argument('--demand-half-life', type=float, default=600.0, help="Seconds over which recent orders lose half their weight in the demand model")
+    parser.add_argument('--idle-delay', type=float, default=2.0, help="Seconds of idle before cleaning, flush and prime runs start")
+    parser.add_argument('--calibration', help="JSON file mapping motor numbers to measured flow rates in mL/second")
+    args = parser.parse_args()
+    try:
+        family, _ = socket_address(args.socket)
+    except ValueError as e:
+        parser.error(str(e))
+    if family == socket.AF_INET and not args.token_file:
+        parser.error("listening on TCP needs --token-file")
+    # The thermal plan rests for heat / cool_rate, a pump that never cools could never pour over budget
+    if not 0 < args.cool_rate <= 1:
+        parser.error("--cool-rate must be above 0 and at most 1")
+    if args.max_burst <= 0:
+        parser.error("--max-burst must be above 0")
+
+    if args.sim:
+        import sim_gpio as GPIO
+    else:
+        import RPi.GPIO as GPIO
+
+    if args.priority:
+        raise_priority(args.priority)
+
+    # Load the per-motor flow rate calibration
+    flow_rates = None
+    if args.calibration:
+        with open(args.calibration) as file:
+            flow_rates = {int(motor): float(rate) for motor, rate in json.load(file).items()}
+
+    controller = PumpController(GPIO, [int(pin) for pin in args.pins.split(',')], args.flow_rate,
+                                loop_timeout=args.loop_timeout, hw_watchdog=args.hw_watchdog,
+                                telemetry_log=args.telemetry_log, metrics_port=args.metrics_port,
+                                flow_rates=flow_rates, inventory_path=args.inventory,
+                                max_burst=args.max_burst, cool_rate=args.cool_rate, max_batch=args.max_batch,
+                                journal_path=args.journal, strategy=args.strategy, max_pumps=args.max_pumps,
+                                bottles=menu.load_bottles(args.bottles) if args.bottles else None, order_log=args.order_log,
+                                prime_volume=args.prime_volume, drain_seconds=args.drain_seconds, prime_budget=args.prime_budget,
+                                demand_half_life=args.demand_half_life, idle_delay=args.idle_delay,
+                                token=read_token(args.token_file) if args.token_file else None)
+    try:
+        controller.serve(args.socket)
+    except KeyboardInterrupt:
+        print("Process interrupted by the user.")
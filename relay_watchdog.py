@@ -0,0 +1,78 @@
+# -*- coding: utf8 -*-
+
+# Watchdogs used by the pump controller to fail the relays safe.
+#
+# HeartbeatWatchdog is fed by the GUI: if the Tk process hangs its heartbeats
+# stop and the controller switches every relay off.
+# LoopWatchdog is fed by the controller's own timing loop and checked from a
+# separate thread, optionally petting the hardware watchdog (/dev/watchdog) so
+# the Pi resets if the whole controller process stalls.
+
+import os
+import threading
+import time
+
+# Class tracking the heartbeat deadline of a client
+class HeartbeatWatchdog:
+    def __init__(self):
+        self.timeout = None  # None while disarmed
+        self.deadline = None
+
+    # Function to record a heartbeat, arming the watchdog with the given timeout
+    def beat(self, timeout, now=None):
+        self.timeout = timeout
+        self.deadline = (time.monotonic() if now is None else now) + timeout
+
+    # Function to disarm the watchdog until the next heartbeat
+    def disarm(self):
+        self.timeout = None
+        self.deadline = None
+
+    # Function to check whether the heartbeat deadline was missed
+    def expired(self, now):
+        return self.deadline is not None and now >= self.deadline
+
+# Class checking from its own thread that the controller loop keeps running
+class LoopWatchdog:
+    def __init__(self, timeout, on_stall, device=None):
+        self.timeout = timeout
+        self.on_stall = on_stall  # Called from the watchdog thread when the loop stalls
+        self.last_beat = time.monotonic()  # Written by the loop, a single float store
+        self.stalled = False
+        self.running = True
+        self.device = None
+
+        # Open the hardware watchdog if asked to, it resets the Pi if we stop petting it
+        if device:
+            try:
+                self.device = os.open(device, os.O_WRONLY)
+            except OSError as e:
+                print(f"Could not open hardware watchdog {device}: {e}")
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    # Function to start the watchdog thread
+    def start(self):
+        self.thread.start()
+
+    # Function to check the loop at a fraction of the timeout
+    def run(self):
+        while self.running:
+            time.sleep(self.timeout / 4)
+            if time.monotonic() - self.last_beat > self.timeout:
+                if not self.stalled:
+                    self.stalled = True
+                    self.on_stall()
+            else:
+                self.stalled = False
+                # Only pet the hardware watchdog while the loop is alive
+                if self.device is not None:
+                    os.write(self.device, b'\0')
+
+    # Function to stop the watchdog thread, disarming the hardware watchdog cleanly
+    def stop(self):
+        self.running = False
+        if self.device is not None:
+            os.write(self.device, b'V')  # Magic close, the kernel disarms the timer
+            os.close(self.device)
+            self.device = None
@@ -0,0 +1,54 @@
+# -*- coding: utf8 -*-
+
+# Simulated stand-in for RPi.GPIO so the pump controller can run on a laptop.
+# Only the calls used by the bartender scripts are implemented.
+
+import threading
+import time
+
+BOARD = 10
+BCM = 11
+OUT = 0
+IN = 1
+HIGH = 1
+LOW = 0
+
+# Current pin mode and the level of every configured pin
+mode = None
+pins = {}
+
+# Lock guarding the pin table, outputs may come from several threads
+lock = threading.Lock()
+
+# Functions called on every output change with (pin, level, monotonic time)
+listeners = []
+
+def setmode(new_mode):
+    global mode
+    mode = new_mode
+
+def setwarnings(flag):
+    pass
+
+def setup(pin, direction, initial=None):
+    with lock:
+        pins[pin] = HIGH if initial is None else initial
+
+def output(pin, level):
+    with lock:
+        if pin not in pins:
+            raise RuntimeError(f"The GPIO channel {pin} has not been set up as an OUTPUT")
+        pins[pin] = level
+    now = time.monotonic()
+    for listener in listeners:
+        listener(pin, level, now)
+
+def input(pin):
+    with lock:
+        return pins.get(pin, HIGH)
+
+def cleanup():
+    global mode
+    with lock:
+        pins.clear()
+    mode = None
@@ -0,0 +1,69 @@
+# -*- coding: utf8 -*-
+
+# Startup phase timing for the GUI.
+#
+# The GUI imports this module first, calls begin(), then mark() at the end of
+# each phase. first_frame() is called from the first Tk callback once
+# mainloop() is running, and loaded() once the work deferred past the first
+# frame (image decoding, the controller connection) is done. If
+# CBR_STARTUP_TRACE names a file, the phases are written there in the Chrome
+# trace-event format (open it in chrome://tracing or Perfetto).
+
+import json
+import os
+import threading
+import time
+
+# Start of the current run and the phases recorded so far as (name, start, end)
+began = time.perf_counter()
+last_mark = began
+phases = []
+first_frame_at = None
+loaded_at = None
+
+# Function to start timing a new run
+def begin():
+    global began, last_mark, first_frame_at, loaded_at
+    began = last_mark = time.perf_counter()
+    first_frame_at = loaded_at = None
+    phases.clear()
+
+# Function to end the phase that started at the previous mark, returning its duration
+def mark(name):
+    global last_mark
+    now = time.perf_counter()
+    phases.append((name, last_mark, now))
+    duration = now - last_mark
+    last_mark = now
+    return duration
+
+# Function to record the first interactive frame and write the trace if asked to
+def first_frame():
+    global first_frame_at
+    mark('first_frame')
+    first_frame_at = last_mark
+    path = os.environ.get('CBR_STARTUP_TRACE')
+    if path:
+        write_trace(path)
+    return first_frame_at - began
+
+# Function to record that the deferred startup work is done and rewrite the trace
+def loaded():
+    global loaded_at
+    loaded_at = time.perf_counter()
+    path = os.environ.get('CBR_STARTUP_TRACE')
+    if path:
+        write_trace(path)
+    return loaded_at - began
+
+# Function to write the recorded phases as Chrome trace events
+def write_trace(path):
+    pid = os.getpid()
+    tid = threading.get_ident()
+    events = [{'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+               'ts': (start - began) * 1e6, 'dur': (end - start) * 1e6} for name, start, end in phases]
+    for name, at in (('time_to_first_frame', first_frame_at), ('time_to_loaded', loaded_at)):
+        if at is not None:
+            events.append({'name': name, 'ph': 'i', 's': 'p', 'pid': pid, 'tid': tid, 'ts': (at - began) * 1e6})
+    with open(path, 'w') as file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
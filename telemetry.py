@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+# -*- coding: utf8 -*-
+
+# Per-pour telemetry for the pump controller.
+#
+# The timing loop writes each finished pour into a preallocated ring buffer:
+# plain stores into fixed arrays, no locks and no lists growing on the relay
+# path. A background thread copies new records into a compact append-only
+# binary log that is rotated by size.
+#
+# Run "python3 telemetry.py pours.log" to print a log.
+
+import array
+import json
+import os
+import struct
+import sys
+import threading
+import time
+
+# Layout of one log record: motor, requested seconds, actual seconds, monotonic
+# start and end of the relay, and the length of the order ids that follow as a
+# JSON list
+record_format = struct.Struct('<iffddH')
+
+# Class holding the last pours in fixed-size arrays
+class PourRing:
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.orders = [()] * capacity  # Order ids the pour was for, several for a merged batch
+        self.motors = array.array('i', bytes(4 * capacity))
+        self.requested = array.array('d', bytes(8 * capacity))
+        self.actual = array.array('d', bytes(8 * capacity))
+        self.starts = array.array('d', bytes(8 * capacity))
+        self.ends = array.array('d', bytes(8 * capacity))
+        self.written = 0  # Number of records ever written, only the writer changes it
+
+    # Function to record one pour, called from the timing loop only
+    def record(self, orders, motor, requested, start, end):
+        i = self.written % self.capacity
+        self.orders[i] = orders
+        self.motors[i] = motor
+        self.requested[i] = requested
+        self.actual[i] = end - start
+        self.starts[i] = start
+        self.ends[i] = end
+        self.written += 1  # Publish the slot last so readers never see it half written
+
+    # Function to return record number seq as a tuple
+    def get(self, seq):
+        i = seq % self.capacity
+        return (self.orders[i], self.motors[i], self.requested[i], self.actual[i], self.starts[i], self.ends[i])
+
+# Class copying ring records into a rotated log file from a background thread
+class TelemetryFlusher:
+    def __init__(self, ring, path, interval=1.0, max_bytes=1024 * 1024, backups=5):
+        self.ring = ring
+        self.path = path
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flushed = 0  # Records already written to the log
+        self.dropped = 0  # Records overwritten in the ring before they were flushed
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    # Function to start the flusher thread
+    def start(self):
+        self.thread.start()
+
+    # Function to flush periodically until stopped
+    def run(self):
+        while self.running:
+            time.sleep(self.interval)
+            self.flush()
+
+    # Function to write every record the ring gained since the last flush
+    def flush(self):
+        written = self.ring.written
+        if written == self.flushed:
+            return
+        if written - self.flushed > self.ring.capacity:
+            self.dropped += written - self.flushed - self.ring.capacity
+            self.flushed = written - self.ring.capacity
+
+        records = [encode(*self.ring.get(seq)) for seq in range(self.flushed, written)]
+        # The writer may have lapped us while we copied, those records are lost
+        lapped = self.ring.written - self.ring.capacity - self.flushed
+        if lapped > 0:
+            records = records[lapped:]
+            self.dropped += lapped
+        self.flushed = written
+        data = b''.join(records)
+
+        self.rotate(len(data))
+        with open(self.path, 'ab') as file:
+            file.write(data)
+
+    # Function to rotate the log when the next write would make it too large
+    def rotate(self, incoming):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size + incoming <= self.max_bytes:
+            return
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{n}"):
+                os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    # Function to stop the thread and write what is left, once the thread can no longer write it too
+    def stop(self):
+        self.running = False
+        if self.thread.is_alive():
+            self.thread.join()
+        self.flush()
+
+# Function to encode one ring record for the log
+def encode(orders, motor, requested, actual, start, end):
+    ids = json.dumps(list(orders), separators=(',', ':')).encode()
+    return record_format.pack(motor, requested, actual, start, end, len(ids)) + ids
+
+# Function to read the records of a log file as (order ids, motor, requested, actual, start, end)
+# tuples, ignoring a record torn at the end
+def read_log(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+    records = []
+    offset = 0
+    while offset + record_format.size <= len(data):
+        motor, requested, actual, start, end, length = record_format.unpack_from(data, offset)
+        offset += record_format.size
+        if offset + length > len(data):
+            break
+        records.append((tuple(json.loads(data[offset:offset + length])), motor, requested, actual, start, end))
+        offset += length
+    return records
+
+if __name__ == '__main__':
+    for orders, motor, requested, actual, start, end in read_log(sys.argv[1] if len(sys.argv) > 1 else 'pours.log'):
+        print(f"Orders {', '.join(orders)} Motor {motor}: requested {requested:.3f} s, actual {actual:.3f} s, error {(actual - requested) * 1000:+.1f} ms at {start:.3f}")
@@ -0,0 +1,36 @@
+# -*- coding: utf8 -*-
+
+# Fleet startup check: two simulated units behind the coordinator serve
+# /menu, /orders and /fleet.
+
+import json
+
+import fleet
+
+recipes = {'Mojito': {'ingredients': [{'name': 'Rum', 'motor': 1, 'quantity': 3}, {'name': 'Lime', 'motor': 2, 'quantity': 1.5}],
+                      'imgpath': '', 'image_url': ''},
+           'Screwdriver': {'ingredients': [{'name': 'Vodka', 'motor': 3, 'quantity': 3}], 'imgpath': '', 'image_url': ''}}
+
+def test_fleet_starts_and_serves(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = {'units': [{'name': 'bar-1', 'socket': str(tmp_path / 'bar1.sock'), 'flow_rate': 30, 'bottles': {'1': 'Rum', '2': 'Lime'}},
+                        {'name': 'bar-2', 'socket': str(tmp_path / 'bar2.sock'), 'flow_rate': 30, 'bottles': {'1': 'Vodka'}}]}
+    units = fleet.connect_units(config, sim=True)
+    try:
+        api = fleet.FleetAPI(fleet.FleetCoordinator(units, recipes))
+        status, items = api.route('GET', '/menu', None)
+        assert status == 200
+        assert {item['cocktail']: item['available'] for item in items} == {'Mojito': True, 'Screwdriver': True}
+
+        status, body = api.route('POST', '/orders', json.dumps({'cocktail': 'Screwdriver'}).encode())
+        assert status == 202
+        assert api.orders[body['order']]['unit'] == 'bar-2'
+
+        status, snapshot = api.route('GET', '/fleet', None)
+        assert status == 200
+        assert [unit['unit'] for unit in snapshot] == ['bar-1', 'bar-2']
+    finally:
+        for unit in units:
+            unit.client.send(op='shutdown')
+            unit.client.close()
+            unit.client.process.wait(10)
@@ -0,0 +1,60 @@
+# -*- coding: utf8 -*-
+
+# Button latencies are timed from the X server time of the release, so a
+# release queued behind slow Tk work counts its wait.
+
+import types
+
+import input_latency
+
+# Class standing in for the Tk root and a button, keeping the idle callbacks and the bindings
+class FakeTk:
+    def __init__(self):
+        self.idle = []
+        self.bindings = {}
+        self.options = {}
+
+    def after_idle(self, func, *args):
+        self.idle.append((func, args))
+
+    def bind(self, sequence, func, add=None):
+        self.bindings[sequence] = func
+
+    def config(self, **options):
+        self.options.update(options)
+
+    def run_idle(self):
+        idle, self.idle = self.idle, []
+        for func, args in idle:
+            func(*args)
+
+# Function to deliver a release stamped server_ms at monotonic time now, then run the command
+def tap(button, server_ms, now, monkeypatch):
+    monkeypatch.setattr(input_latency.time, 'monotonic', lambda: now)
+    button.bindings['<ButtonRelease-1>'](types.SimpleNamespace(time=server_ms))
+    button.options['command']()
+
+def test_queued_release_counts_its_wait(monkeypatch):
+    root = FakeTk()
+    button = FakeTk()
+    latencies = input_latency.InputLatencies(root)
+    latencies.watch(button, 'order', lambda: None)
+
+    # Delivered at once: the server clock is 1000 s behind the monotonic one
+    tap(button, 5_000, 1005.0, monkeypatch)
+    # Released at server time 6 s but only delivered 0.25 s later, behind slow work
+    tap(button, 6_000, 1006.25, monkeypatch)
+    root.run_idle()
+
+    histogram = latencies.histograms.histograms['order']['input_to_handler']
+    assert histogram.total == 2
+    assert histogram.min_value == 0
+    assert abs(histogram.max_seen / 1e6 - 0.25) < 0.001
+
+def test_release_without_server_time_uses_now(monkeypatch):
+    root = FakeTk()
+    button = FakeTk()
+    latencies = input_latency.InputLatencies(root)
+    latencies.watch(button, 'select', lambda: None)
+    tap(button, '??', 50.0, monkeypatch)
+    assert latencies.histograms.histograms['select']['input_to_handler'].max_seen == 0
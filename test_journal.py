@@ -0,0 +1,79 @@
+# -*- coding: utf8 -*-
+
+# What the controller recovers from its journal after a power cut, and the
+# order log rotated by size.
+
+import json
+import os
+
+import journal
+
+# Function to write journal records, optionally followed by a line torn by the power cut
+def write_journal(path, records, torn=''):
+    with open(path, 'w') as file:
+        file.writelines(json.dumps(record) + '\n' for record in records)
+        file.write(torn)
+    return str(path)
+
+def test_finished_and_discarded_jobs_are_not_recovered(tmp_path):
+    path = write_journal(tmp_path / 'orders.journal', [
+        {'r': 'boot'},
+        {'r': 'queued', 'job': 1, 'orders': ['gui-1'], 'label': 'Mojito', 'glasses': 1, 'pours': [{'motor': 1, 'volume': 30}]},
+        {'r': 'queued', 'job': 2, 'orders': ['gui-2'], 'label': 'Mojito', 'glasses': 1, 'pours': [{'motor': 1, 'volume': 30}]},
+        {'r': 'start', 'job': 1, 'merged': []},
+        {'r': 'on', 'job': 1, 'motor': 1, 't': 10.0, 's': 20.0},
+        {'r': 'off', 'job': 1, 'motor': 1, 't': 30.0},
+        {'r': 'done', 'job': 1},
+        {'r': 'discard', 'job': 2},
+    ])
+    assert journal.replay(path) == []
+
+def test_interrupted_job_counts_what_ran_until_the_last_tick(tmp_path):
+    path = write_journal(tmp_path / 'orders.journal', [
+        {'r': 'boot'},
+        {'r': 'queued', 'job': 1, 'orders': ['gui-1'], 'label': 'Mojito', 'glasses': 1,
+         'pours': [{'motor': 1, 'volume': 30}, {'motor': 2, 'volume': 15}]},
+        {'r': 'queued', 'job': 2, 'orders': ['gui-2'], 'label': 'Mojito', 'glasses': 1,
+         'pours': [{'motor': 1, 'volume': 30}, {'motor': 2, 'volume': 15}]},
+        {'r': 'start', 'job': 1, 'merged': [2]},
+        {'r': 'on', 'job': 1, 'motor': 1, 't': 100.0, 's': 40.0},
+        {'r': 'on', 'job': 1, 'motor': 2, 't': 100.0, 's': 20.0},
+        {'r': 'off', 'job': 1, 'motor': 2, 't': 120.0},
+        {'r': 'tick', 't': 112.5},
+    ], torn='{"r": "tick", "t": 1')
+    job, = journal.replay(path)
+    assert job['orders'] == ['gui-1', 'gui-2']
+    assert job['glasses'] == 2
+    assert job['started']
+    assert job['volumes'] == {1: 60.0, 2: 30.0}
+    # Motor 1 was still on: it counts up to the latest time recorded, the switch-off of motor 2
+    assert job['ran'] == {1: 20.0, 2: 20.0}
+
+def test_missing_journal_recovers_nothing(tmp_path):
+    assert journal.replay(str(tmp_path / 'orders.journal')) == []
+
+def test_prime_of_a_drained_line_is_carried_with_the_job(tmp_path):
+    path = write_journal(tmp_path / 'orders.journal', [
+        {'r': 'boot'},
+        {'r': 'queued', 'job': 1, 'orders': ['gui-1'], 'label': 'Mojito', 'glasses': 1,
+         'pours': [{'motor': 1, 'volume': 30}, {'motor': 2, 'volume': 15}]},
+        {'r': 'start', 'job': 1, 'merged': [], 'primed': [{'motor': 1, 'volume': 10.0}]},
+        {'r': 'on', 'job': 1, 'motor': 1, 't': 100.0, 's': 26.7},
+        {'r': 'tick', 't': 110.0},
+    ])
+    job, = journal.replay(path)
+    assert job['primed'] == {1: 10.0}
+
+def test_order_log_is_rotated_by_size(tmp_path):
+    path = str(tmp_path / 'orders.log')
+    log = journal.OrderJournal(path, max_bytes=200, backups=2)
+    log.file = open(path, 'ab')
+    for n in range(20):
+        log.append({'r': 'order', 'order': f"gui-{n}"})
+        log.flush()
+    log.stop()
+    files = [f"{path}.2", f"{path}.1", path]
+    assert all(os.path.getsize(name) <= 200 for name in files)
+    assert not os.path.exists(f"{path}.3")
+    orders = [record['order'] for name in files for record in journal.read_records(name)]
+    assert orders == [f"gui-{n}" for n in range(20 - len(orders), 20)]
@@ -0,0 +1,26 @@
+# -*- coding: utf8 -*-
+
+# Pours by ingredient name split over the motors of a bottle map.
+
+import pytest
+
+import menu
+
+bottles = {1: 'Rum', 2: 'Rum', 3: 'Lime'}
+
+def test_ingredient_on_several_motors_is_split_by_flow_rate():
+    pours = menu.split_pours([('Rum', 60.0), ('Lime', 15.0)], bottles, {1: 1.0, 2: 2.0, 3: 1.5})
+    assert pours == [(1, pytest.approx(20.0)), (2, pytest.approx(40.0)), (3, 15.0)]
+    # Both rum pumps finish together
+    assert pours[0][1] / 1.0 == pytest.approx(pours[1][1] / 2.0)
+
+def test_bottle_too_low_is_left_out():
+    levels = {1: 10.0, 2: 500.0}
+    pours = menu.split_pours([('Rum', 60.0)], bottles, {1: 1.5, 2: 1.5}, usable=lambda motor, volume: volume <= levels[motor])
+    assert pours == [(2, 60.0)]
+
+def test_ingredient_without_a_usable_motor_raises_its_name():
+    with pytest.raises(KeyError, match='Vodka'):
+        menu.split_pours([('Vodka', 30.0)], bottles, {1: 1.5, 2: 1.5, 3: 1.5})
+    with pytest.raises(KeyError, match='Lime'):
+        menu.split_pours([('Lime', 30.0)], bottles, {3: 1.5}, usable=lambda motor, volume: False)
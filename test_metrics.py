@@ -0,0 +1,26 @@
+# -*- coding: utf8 -*-
+
+# Metrics registered by name: a controller created again replaces the metric
+# families of the previous one instead of repeating them.
+
+import gc
+import weakref
+
+import metrics
+import pump_controller
+import sim_gpio
+
+def test_new_controller_replaces_the_metrics_of_the_old_one():
+    first = pump_controller.PumpController(sim_gpio, [40, 38, 36], 1.5)
+    first.jobs_metric.inc()
+    old = weakref.ref(first)
+    del first
+    second = pump_controller.PumpController(sim_gpio, [40, 38, 36], 1.5)
+    gc.collect()
+    assert old() is None
+
+    text = metrics.render()
+    assert text.count('# TYPE cbr_jobs_total counter') == 1
+    assert text.count('# TYPE cbr_motor_duty_cycle gauge') == 1
+    assert 'cbr_jobs_total 0.0' in text
+    assert metrics.registry['cbr_motor_heat'].function == second.heat_levels
@@ -0,0 +1,84 @@
+# -*- coding: utf8 -*-
+
+# Ordering API: malformed requests get a 400 and never reach the controller,
+# oversized ones are refused, and finished orders are not kept forever.
+
+import asyncio
+import json
+
+import pytest
+
+import order_api
+
+recipes = {'Mojito': {'ingredients': [{'name': 'Rum', 'motor': 1, 'quantity': 30}], 'imgpath': '', 'image_url': ''}}
+
+# Class standing in for the pump controller client, remembering the pours sent
+class FakeClient:
+    def __init__(self):
+        self.pours = []
+
+    def add_listener(self, listener):
+        pass
+
+    def pour(self, order, pours, label=None, glasses=1):
+        self.pours.append(order)
+
+@pytest.fixture
+def api():
+    return order_api.OrderAPI(FakeClient(), recipes, 1.5)
+
+@pytest.mark.parametrize('body', [b'{"cocktail": [1]}', b'{"cocktail": {"a": 1}}', b'[]', b'"Mojito"', b'{"glasses": 2}',
+                                  b'{"cocktail": "Mojito", "glasses": "2"}', b'{"cocktail": "Mojito", "glasses": true}', b'{'])
+def test_malformed_orders_get_a_400(api, body):
+    status, _ = api.route('POST', '/orders', body)
+    assert status == 400
+    assert not api.client.pours
+
+def test_finished_orders_are_evicted(api):
+    api.keep_finished = 2
+    orders = [api.route('POST', '/orders', b'{"cocktail": "Mojito"}')[1]['order'] for _ in range(4)]
+    for order in orders[:3]:
+        api.handle_event({'ev': 'done', 'order': order, 't': 0.0, 'elapsed': 1.0})
+    assert list(api.orders) == orders[1:]
+    assert api.route('GET', f'/orders/{orders[0]}', None)[0] == 404
+    assert api.route('GET', f'/orders/{orders[3]}', None)[1]['status'] == 'sent'
+
+    api.max_orders = 2
+    api.route('POST', '/orders', b'{"cocktail": "Mojito"}')
+    assert len(api.orders) == 2
+
+# Function to send raw bytes to the API over a real connection and return the response
+def exchange(api, request):
+    async def run():
+        server = await asyncio.start_server(api.handle_connection, '127.0.0.1', 0)
+        async with server:
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            writer.write(request)
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            return response
+    return asyncio.run(run())
+
+def test_websocket_upgrade_without_a_key_gets_a_400(api):
+    response = exchange(api, b'GET /ws HTTP/1.1\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n\r\n')
+    assert response.startswith(b'HTTP/1.1 400')
+    assert not api.sockets
+
+def test_oversized_body_gets_a_413(api):
+    response = exchange(api, b'POST /orders HTTP/1.1\r\nContent-Length: 100000000\r\n\r\n{"cocktail": "Mojito"}')
+    assert response.startswith(b'HTTP/1.1 413')
+    assert not api.client.pours
+
+def test_oversized_websocket_frame_closes_the_connection(api):
+    handshake = b'GET /ws HTTP/1.1\r\nUpgrade: websocket\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n\r\n'
+    frame = bytes([0x81, 0xFF]) + (1 << 40).to_bytes(8, 'big')
+    response = exchange(api, handshake + frame)
+    assert response.startswith(b'HTTP/1.1 101')
+    assert not api.sockets
+
+def test_order_over_http(api):
+    body = b'{"cocktail": "Mojito", "glasses": 2}'
+    response = exchange(api, b'POST /orders HTTP/1.1\r\nConnection: close\r\nContent-Length: %d\r\n\r\n' % len(body) + body)
+    assert response.startswith(b'HTTP/1.1 202')
+    assert json.loads(response.split(b'\r\n\r\n', 1)[1])['order'] == api.client.pours[0]
@@ -0,0 +1,199 @@
+# -*- coding: utf8 -*-
+
+# Pump controller: orders it must refuse before anything is queued, what it
+# reports to the menu, who may talk to it, the pump cap under late
+# switch-offs, and what it recovers after a power cut.
+
+import json
+import socket
+
+import pytest
+
+import pump_controller
+import sim_gpio
+
+@pytest.fixture
+def controller():
+    controller = pump_controller.PumpController(sim_gpio, [40, 38, 36], 1.5, max_batch=4)
+    controller.events = []
+    controller.publish = lambda event, conn=None: controller.events.append(event)
+    return controller
+
+@pytest.mark.parametrize('glasses', [0, -2, 5, 'two'])
+def test_glasses_out_of_range_are_refused(controller, glasses):
+    job = controller.enqueue({'order': 'o1', 'glasses': glasses, 'pours': [{'motor': 1, 'volume': 30}]}, None)
+    assert job is None
+    assert not controller.jobs
+    assert controller.events[-1]['ev'] == 'error'
+
+@pytest.mark.parametrize('pour', [{'motor': 1, 'volume': -60}, {'motor': 1, 'volume': 0}, {'motor': 1, 'volume': 'nan'},
+                                  {'motor': 1, 'volume': 1e400}, {'motor': 1, 'volume': 30, 'offset': -5},
+                                  {'motor': 1, 'volume': 30, 'offset': 'inf'}, {'ingredient': 'Rum', 'volume': -30}])
+def test_pours_that_are_not_positive_and_finite_are_refused(controller, pour):
+    controller.bottles = {1: 'Rum'}
+    controller.handle_message({'op': 'pour', 'order': 'o1', 'pours': [pour]}, None)
+    assert not controller.jobs
+    assert controller.events[-1]['ev'] == 'error'
+
+def test_batch_of_max_glasses_is_queued(controller):
+    job = controller.enqueue({'order': 'o1', 'glasses': 4, 'pours': [{'motor': 1, 'volume': 30}]}, None)
+    assert job is not None
+    assert job.pours[0]['volume'] == 120
+
+def test_inventory_levels_report_the_calibrated_flow_rates():
+    controller = pump_controller.PumpController(sim_gpio, [40, 38, 36], 1.5, flow_rates={2: 3.0})
+    event = controller.inventory_event(levels=True)
+    assert event['flow_rates'] == [{'motor': 1, 'rate': 1.5}, {'motor': 2, 'rate': 3.0}, {'motor': 3, 'rate': 1.5}]
+
+def test_tcp_address_needs_a_host():
+    assert pump_controller.socket_address('10.0.0.11:9400') == (socket.AF_INET, ('10.0.0.11', 9400))
+    with pytest.raises(ValueError):
+        pump_controller.socket_address(':9400')
+
+# Function to send messages to the controller from a new client and return the client end
+def client_of(controller, *messages):
+    server_end, client_end = socket.socketpair()
+    controller.accept(type('Server', (), {'accept': lambda self: (server_end, None)})())
+    client_end.sendall(b''.join((json.dumps(message) + '\n').encode() for message in messages))
+    controller.read(server_end)
+    return server_end, client_end
+
+def test_clients_without_the_token_are_dropped():
+    controller = pump_controller.PumpController(sim_gpio, [40, 38, 36], 1.5, token='s3cret')
+    intruder, intruder_end = client_of(controller, {'op': 'auth', 'token': 'guess'}, {'op': 'shutdown'})
+    assert intruder not in controller.buffers
+    assert controller.running
+    assert json.loads(intruder_end.recv(4096))['error'] == "Not authenticated"
+
+    member, member_end = client_of(controller, {'op': 'auth', 'token': 's3cret'}, [], {'op': 'state'})
+    assert member in controller.authenticated
+    error, state = member_end.recv(4096).decode().splitlines()
+    assert json.loads(error)['ev'] == 'error'
+    assert json.loads(state)['ev'] == 'state'
+    controller.drop_client(member)
+
+@pytest.mark.parametrize('message', [[], 'auth', 7, None])
+def test_client_sending_no_object_before_the_token_is_dropped(message):
+    controller = pump_controller.PumpController(sim_gpio, [40, 38, 36], 1.5, token='s3cret')
+    intruder, intruder_end = client_of(controller, message, {'op': 'shutdown'})
+    assert intruder not in controller.buffers
+    assert controller.running
+    assert json.loads(intruder_end.recv(4096))['error'] == "Not authenticated"
+
+# A late switch-off must not let the next run of its lane start early and go over the pump cap
+def test_capped_run_waits_for_a_late_switch_off(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(pump_controller.time, 'monotonic', lambda: clock[0])
+    controller = pump_controller.PumpController(sim_gpio, [40, 38], 1.5, strategy='capped', max_pumps=1)
+    controller.publish = lambda event, conn=None: None
+    controller.setup_gpio()
+    most_on = []
+    listener = lambda pin, level, now: most_on.append(sum(sim_gpio.input(relay) == sim_gpio.LOW for relay in controller.relay_pins))
+    sim_gpio.listeners.append(listener)
+    try:
+        controller.enqueue({'order': 'o1', 'pours': [{'motor': 1, 'volume': 3}, {'motor': 2, 'volume': 3}]}, None)
+        controller.fire_timers()
+        controller.fire_timers()
+        assert sorted(controller.relay_on_times) == [1]
+
+        # Motor 1 switches off 50 ms after motor 2 was due on
+        off_at = max(deadline for deadline, _, motor, seconds in controller.timers if seconds is None)
+        on_at = min(deadline for deadline, _, motor, seconds in controller.timers if seconds is not None)
+        controller.timers = [(off_at + 0.05 if seconds is None else deadline, seq, motor, seconds)
+                             for deadline, seq, motor, seconds in controller.timers]
+        pump_controller.heapq.heapify(controller.timers)
+        clock[0] = on_at
+        controller.fire_timers()
+        assert sorted(controller.relay_on_times) == [1]
+
+        clock[0] = off_at + 0.05
+        controller.fire_timers()
+        assert sorted(controller.relay_on_times) == [2]
+        clock[0] += 5
+        controller.fire_timers()
+        assert not controller.relay_on_times and controller.current is None
+        assert max(most_on) <= 1
+    finally:
+        sim_gpio.listeners.remove(listener)
+        controller.all_off()
+
+@pytest.mark.parametrize('message', [
+    {'op': 'refill'},
+    {'op': 'refill', 'motor': 9},
+    {'op': 'pour', 'order': 'o1', 'pours': [{'volume': 30}]},
+    {'op': 'pour', 'order': 'o1', 'pours': [{'motor': 1}]},
+    {'op': 'pour', 'order': 'o1', 'pours': [{'motor': 'a', 'volume': 30}]},
+    {'op': 'pour', 'order': 'o1', 'pours': [{'motor': 1, 'volume': 30, 'offset': 'soon'}]},
+    {'op': 'pour', 'order': 'o1', 'pours': [{'ingredient': ['Rum'], 'volume': 30}]},
+    {'op': 'pour', 'order': 'o1', 'pours': {'motor': 1}},
+    {'op': 'pour', 'order': 'o1', 'pours': ['Rum']},
+    {'op': 'pour', 'order': ['o1'], 'pours': [{'motor': 1, 'volume': 30}]},
+    {'op': 'resume', 'job': 'abc'},
+    {'op': 'discard', 'job': 1.5},
+    {'op': 'hb', 'timeout': 'x'},
+    {'op': 'clean', 'volume': 'x'},
+    {'op': 'clean', 'motors': [1, 'b']},
+    {'op': 'cancel_clean', 'motors': 3},
+])
+def test_malformed_messages_get_an_error(controller, message):
+    controller.handle_message(message, None)
+    assert controller.events[-1]['ev'] == 'error'
+    assert controller.running
+    assert not controller.jobs
+
+def test_message_that_raises_does_not_escape_the_loop(controller, monkeypatch):
+    monkeypatch.setattr(controller, 'stop', lambda: {}['boom'])
+    server_end, client_end = client_of(controller, {'op': 'stop'}, {'op': 'state'})
+    assert controller.events[-2]['ev'] == 'error'
+    assert controller.events[-1]['ev'] == 'state'
+    controller.drop_client(server_end)
+
+# Two pours on one motor used to overwrite its relay state, and the second switch-off crashed the loop
+def test_pours_on_the_same_motor_run_once(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(pump_controller.time, 'monotonic', lambda: clock[0])
+    controller = pump_controller.PumpController(sim_gpio, [40, 38], 1.5, bottles={1: 'Rum', 2: 'Rum'})
+    controller.events = []
+    controller.publish = lambda event, conn=None: controller.events.append(event)
+    controller.setup_gpio()
+    try:
+        job = controller.enqueue({'order': 'o1', 'pours': [{'motor': 1, 'volume': 10}, {'motor': 1, 'volume': 20},
+                                                           {'ingredient': 'Rum', 'volume': 30}]}, None)
+        assert sorted((pour['motor'], pour['volume']) for pour in job.pours) == [(1, 45.0), (2, 15.0)]
+        for _ in range(3):
+            controller.fire_timers()
+            clock[0] += 40
+        assert controller.current is None and not controller.relay_on_times
+        assert [event['order'] for event in controller.events if event['ev'] == 'done'] == ['o1']
+    finally:
+        controller.all_off()
+
+# Filling a drained line is journaled, and recovery does not count it as poured into the glass
+def test_recovery_leaves_out_the_prime_of_a_drained_line(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(pump_controller.time, 'monotonic', lambda: clock[0])
+    path = str(tmp_path / 'orders.journal')
+    controller = pump_controller.PumpController(sim_gpio, [40, 38], 1.5, journal_path=path, prime_volume=10.0)
+    controller.publish = lambda event, conn=None: None
+    records = []
+    controller.log = records.append
+    controller.setup_gpio()
+    try:
+        controller.enqueue({'order': 'o1', 'pours': [{'motor': 1, 'volume': 30}]}, None)
+        controller.fire_timers()
+        controller.fire_timers()
+        assert sorted(controller.relay_on_times) == [1]
+    finally:
+        controller.all_off()
+    start, = [record for record in records if record['r'] == 'start']
+    assert start['primed'] == [{'motor': 1, 'volume': 10.0}]
+
+    # The power went out 10 s into the 40 mL run: 15 mL left the pump, 5 mL of it reached the glass
+    records = [record for record in records if record['r'] in ('queued', 'start', 'on')] + [{'r': 'tick', 't': clock[0] + 10}]
+    with open(path, 'w') as file:
+        file.writelines(json.dumps(record) + '\n' for record in records)
+    recovered = pump_controller.PumpController(sim_gpio, [40, 38], 1.5, journal_path=path, prime_volume=10.0)
+    recovered.recover()
+    recovered.journal.stop()
+    held, = recovered.held.values()
+    assert held['pours'] == [{'motor': 1, 'volume': 25.0}]
@@ -0,0 +1,50 @@
+# -*- coding: utf8 -*-
+
+# Pour telemetry: what the controller logs for each pour, and the last
+# records written exactly once when the flusher stops.
+
+import pump_controller
+import sim_gpio
+import telemetry
+
+def test_pours_are_logged_with_their_order_ids(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(pump_controller.time, 'monotonic', lambda: clock[0])
+    path = str(tmp_path / 'pours.log')
+    controller = pump_controller.PumpController(sim_gpio, [40, 38], 1.5, telemetry_log=path)
+    controller.publish = lambda event, conn=None: None
+    controller.setup_gpio()
+    try:
+        controller.enqueue({'order': 'o1', 'pours': [{'motor': 1, 'volume': 3}]}, None)
+        controller.enqueue({'order': 'o2', 'pours': [{'motor': 1, 'volume': 3}]}, None)
+        for _ in range(3):
+            controller.fire_timers()
+            clock[0] += 5
+    finally:
+        controller.all_off()
+    controller.telemetry.flush()
+    (orders, motor, requested, actual, start, end), = telemetry.read_log(path)
+    assert orders == ('o1', 'o2') and motor == 1
+    assert requested == 4.0
+
+def test_record_torn_at_the_end_is_ignored(tmp_path):
+    path = str(tmp_path / 'pours.log')
+    with open(path, 'wb') as file:
+        file.write(telemetry.encode(['o1'], 1, 2.0, 2.0, 10.0, 12.0))
+        file.write(telemetry.encode(['o2'], 2, 2.0, 2.0, 12.0, 14.0)[:-3])
+    assert telemetry.read_log(path) == [(('o1',), 1, 2.0, 2.0, 10.0, 12.0)]
+
+def test_stop_writes_every_record_once(tmp_path, monkeypatch):
+    ring = telemetry.PourRing()
+    flusher = telemetry.TelemetryFlusher(ring, str(tmp_path / 'pours.log'), interval=0.01)
+    flush = flusher.flush
+    # The final flush used to run while the thread could still be flushing the same records
+    def checked_flush():
+        assert flusher.thread is telemetry.threading.current_thread() or not flusher.thread.is_alive()
+        flush()
+    monkeypatch.setattr(flusher, 'flush', checked_flush)
+    flusher.start()
+    for n in range(200):
+        ring.record([f"o{n}"], 1, 1.0, n, n + 1.0)
+    flusher.stop()
+    assert [orders for orders, *_ in telemetry.read_log(flusher.path)] == [(f"o{n}",) for n in range(200)]
@@ -0,0 +1,41 @@
+# -*- coding: utf8 -*-
+
+# Heat budget splits: the segments add up to the run, the pump never goes
+# over budget, and rounding at the edge of a segment cannot stall the plan.
+
+import threading
+
+import pytest
+
+import thermal
+
+# Function to plan in a thread so a plan that never ends fails instead of hanging the tests
+def plan_within(thermal_model, seconds, timeout=5):
+    result = []
+    worker = threading.Thread(target=lambda: result.append(thermal_model.plan(1, seconds, 0.0)), daemon=True)
+    worker.start()
+    worker.join(timeout)
+    assert result, "thermal.plan did not finish"
+    return result[0]
+
+# Function to replay the segments and return the highest heat the pump reaches
+def peak_heat(thermal_model, segments):
+    heat = peak = 0.0
+    end = 0.0
+    for offset, seconds in segments:
+        heat = max(0.0, heat - (offset - end) * thermal_model.cool_rate) + seconds * (1 - thermal_model.cool_rate)
+        end = offset + seconds
+        peak = max(peak, heat)
+    return peak
+
+def test_short_run_is_not_split():
+    assert thermal.PumpThermal([1]).plan(1, 30.0, 0.0) == [(0.0, 30.0)]
+
+# Rounding used to leave the room a hair under min_segment here, and plan rested forever
+@pytest.mark.parametrize('max_burst, min_segment, seconds', [(10.0, 0.4, 30.0), (120.0, 0.1, 301.7), (10.0, 0.25, 1000.0)])
+def test_plan_ends_and_stays_within_budget(max_burst, min_segment, seconds):
+    thermal_model = thermal.PumpThermal([1], max_burst, 0.5, min_segment=min_segment)
+    segments = plan_within(thermal_model, seconds)
+    assert sum(run for _, run in segments) == pytest.approx(seconds)
+    assert all(later[0] >= earlier[0] + earlier[1] - 1e-9 for earlier, later in zip(segments, segments[1:]))
+    assert peak_heat(thermal_model, segments) <= max_burst + 1e-6
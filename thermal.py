@@ -0,0 +1,89 @@
+# -*- coding: utf8 -*-
+
+# Pump duty-cycle accounting and thermal budget.
+#
+# Each pump has a heat budget modelled as a leaky bucket: while the pump runs
+# its heat rises by (1 - cool_rate) per second, while it is off it falls by
+# cool_rate per second. max_burst is the heat a pump may hold, so a cold pump
+# can run max_burst / (1 - cool_rate) seconds in one go and cool_rate is the
+# duty cycle it can sustain. Pours that would go over budget are split with
+# the shortest rests that keep the pump within it.
+
+import collections
+
+# Class tracking duty cycle and heat of every pump
+class PumpThermal:
+    def __init__(self, motors, max_burst=120.0, cool_rate=0.5, window=600.0, min_segment=10.0):
+        self.max_burst = max_burst
+        self.cool_rate = cool_rate
+        self.window = window  # Seconds of history used for the rolling duty cycle
+        self.min_segment = min_segment  # Shortest run worth starting after a rest
+        self.heat = {motor: 0.0 for motor in motors}  # Heat when the pump last switched
+        self.switched_at = {motor: None for motor in motors}  # Time of the last switch
+        self.on_since = {}  # Motor -> time the running pump was switched on
+        self.intervals = {motor: collections.deque() for motor in motors}  # (on, off) runs in the window
+
+    # Function to compute the heat of a pump at a time
+    def heat_at(self, motor, now):
+        switched_at = self.switched_at[motor]
+        if switched_at is None:
+            return 0.0
+        if motor in self.on_since:
+            return self.heat[motor] + (now - switched_at) * (1 - self.cool_rate)
+        return max(0.0, self.heat[motor] - (now - switched_at) * self.cool_rate)
+
+    # Function to record a pump switching on
+    def relay_on(self, motor, now):
+        self.heat[motor] = self.heat_at(motor, now)
+        self.switched_at[motor] = now
+        self.on_since[motor] = now
+
+    # Function to record a pump switching off
+    def relay_off(self, motor, now):
+        self.heat[motor] = self.heat_at(motor, now)
+        self.switched_at[motor] = now
+        on_time = self.on_since.pop(motor, now)
+        intervals = self.intervals[motor]
+        intervals.append((on_time, now))
+        while intervals and intervals[0][1] < now - self.window:
+            intervals.popleft()
+
+    # Function to compute the fraction of the window a pump has been running. It is also called from
+    # the metrics thread, so it works on copies of the state the controller loop changes.
+    def duty_cycle(self, motor, now):
+        start = now - self.window
+        busy = sum(off - max(on, start) for on, off in list(self.intervals[motor]) if off > start)
+        on_since = self.on_since.get(motor)
+        if on_since is not None:
+            busy += now - max(on_since, start)
+        return busy / self.window
+
+    # Function to split a run of the given seconds, starting at offset from now,
+    # into (offset, seconds) segments that keep the pump within its heat budget
+    def plan(self, motor, seconds, now, offset=0.0):
+        heat = max(0.0, self.heat_at(motor, now) - offset * self.cool_rate)
+        rise = 1 - self.cool_rate
+        segments = []
+        while seconds > 1e-9:
+            room = (self.max_burst - heat) / rise if rise > 0 else seconds
+            if room >= seconds:
+                segments.append((offset, seconds))
+                break
+            # Rounding can leave the room a hair short of a segment the rest below was sized for
+            if room >= min(self.min_segment, seconds) - 1e-9:
+                segments.append((offset, room))
+                offset += room
+                seconds -= room
+                heat = self.max_burst
+            # Rest just long enough for the next segment to fit
+            run = min(self.min_segment, seconds)
+            rest = (heat + run * rise - self.max_burst) / self.cool_rate
+            if rest > 0:
+                offset += rest
+                heat -= rest * self.cool_rate
+        return segments
+
+    # Function to report the thermal state of every pump
+    def snapshot(self, now):
+        return {motor: {'heat': self.heat_at(motor, now) / self.max_burst, 'duty_cycle': self.duty_cycle(motor, now)}
+                for motor in self.heat}
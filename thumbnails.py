@@ -0,0 +1,54 @@
+# -*- coding: utf8 -*-
+
+# In-memory cache of the cocktail button images.
+#
+# The most ordered cocktails are pinned and never leave the cache. The others
+# are kept least recently used first, and once there are more than capacity
+# images the oldest unpinned one is dropped: on_evict is called with its name
+# so its button can let go of it, and it is loaded again when tapped.
+
+import collections
+
+# Class keeping the cocktail images, the popular ones pinned
+class ThumbnailCache:
+    def __init__(self, capacity=None, on_evict=None):
+        self.capacity = capacity  # Most images kept, None for no limit
+        self.on_evict = on_evict
+        self.images = collections.OrderedDict()  # Cocktail -> image, least recently used first
+        self.pinned = set()
+
+    # Function to keep the images of these cocktails whatever the capacity
+    def pin(self, names):
+        self.pinned = set(names)
+
+    # Function to tell whether another unpinned image fits without evicting one
+    def has_room(self):
+        return self.capacity is None or len(self.images) < self.capacity
+
+    # Function to give the image of a cocktail, None when it is not loaded
+    def get(self, name):
+        image = self.images.get(name)
+        if image is not None:
+            self.images.move_to_end(name)
+        return image
+
+    # Function to add an image, dropping the least recently used unpinned ones beyond capacity
+    def put(self, name, image):
+        self.images[name] = image
+        self.images.move_to_end(name)
+        if self.capacity is None:
+            return
+        for old in list(self.images):
+            if len(self.images) <= self.capacity:
+                break
+            if old in self.pinned or old == name:
+                continue
+            del self.images[old]
+            if self.on_evict is not None:
+                self.on_evict(old)
+
+    def __contains__(self, name):
+        return name in self.images
+
+    def __len__(self):
+        return len(self.images)